@@ -1,24 +1,64 @@
-
 import pandas as pd
-import psycopg
-import credentials
-
-
-def connect_to_database():
-    """
-    Connect to the PostgreSQL database.
-
-    Returns:
-        A tuple containing the connection and cursor objects.
-    """
-    conn = psycopg.connect(
-        host="pinniped.postgres.database.azure.com",
-        dbname=credentials.DB_NAME,
-        user=credentials.DB_USER,
-        password=credentials.DB_PASSWORD
-    )
-    cur = conn.cursor()
-    return conn, cur
+from report_cache import cached_query
+from report_queries import REPORT_QUERIES
+
+
+# labels of the region, control and ccbasic codes used in the reports.
+REGION_NAMES = {
+    0: 'U.S. Service schools',
+    1: 'New England',
+    2: 'Mid East',
+    3: 'Great Lakes',
+    4: 'Plains',
+    5: 'Southeast',
+    6: 'Southwest',
+    7: 'Rocky Mountains',
+    8: 'Far West',
+    9: 'Outlying areas'
+}
+
+CONTROL_NAMES = {
+    1: 'Public',
+    2: 'Private nonprofit',
+    3: 'Private for-profit'
+}
+
+CLASSIFICATION_NAMES = {
+    0: 'Not classified',
+    1: 'Associates Colleges: High Transfer-High Traditional',
+    2: 'Traditional/Nontraditional',
+    3: 'Associate\'s Colleges: High Transfer-High Nontraditional',
+    4: 'Associate\'s Colleges: Mixed Transfer/Career & Technical-High Traditional',
+    5: 'Associate\'s Colleges: Mixed Transfer/Career & Technical-Mixed Traditional/Nontraditional',
+    6: 'Associate\'s Colleges: Mixed Transfer/Career & Technical-High Nontraditional',
+    7: 'Associate\'s Colleges: High Career & Technical-High Traditional',
+    8: 'Associate\'s Colleges: High Career & Technical-Mixed Traditional/Nontraditional',
+    9: 'Associate\'s Colleges: High Career & Technical-High Nontraditional',
+    10: 'Special Focus Two-Year: Health Professions',
+    11: 'Special Focus Two-Year: Technical Professions',
+    12: 'Special Focus Two-Year: Arts & Design',
+    13: 'Special Focus Two-Year: Other Fields',
+    14: 'Baccalaureate/Associate\'s Colleges: Associate\'s Dominant',
+    15: 'Doctoral Universities: Very High Research Activity',
+    16: 'Doctoral Universities: High Research Activity',
+    17: 'Doctoral/Professional Universities',
+    18: 'Master\'s Colleges & Universities: Larger Programs',
+    19: 'Master\'s Colleges & Universities: Medium Programs',
+    20: 'Master\'s Colleges & Universities: Small Programs',
+    21: 'Baccalaureate Colleges: Arts & Sciences Focus',
+    22: 'Baccalaureate Colleges: Diverse Fields',
+    23: 'Baccalaureate/Associate\'s Colleges: Mixed Baccalaureate/Associate\'s',
+    24: 'Special Focus Four-Year: Faith-Related Institutions',
+    25: 'Special Focus Four-Year: Medical Schools & Centers',
+    26: 'Special Focus Four-Year: Other Health Professions Schools',
+    27: 'Special Focus Four-Year: Research Schools',
+    28: 'Special Focus Four-Year: Engineering and Other Technology-Related Schools',
+    29: 'Special Focus Four-Year: Business & Management Schools',
+    30: 'Special Focus Four-Year: Arts, Music & Design Schools',
+    31: 'Special Focus Four-Year: Law Schools',
+    32: 'Special Focus Four-Year: Other Special Focus Institutions',
+    33: 'Tribal Colleges'
+}
 
 
 year = 2021
@@ -41,43 +81,15 @@ def summarize_colleges_by_state_and_type(year):
                           'region' represents the state, 'control' represents the type of institution, and 'count' represents
                           the number of colleges/universities in that state and institution type.
     """
-    # Connect to the database
-    conn, cur = connect_to_database()
-
     # Query the data for the selected year
-    query = f"SELECT region, control,  COUNT(*) as count FROM institutioninformation WHERE year = {year} GROUP BY region, control ORDER BY region, control;"
-    cur.execute(query)
-    rows = cur.fetchall()
+    query, tables = REPORT_QUERIES['colleges_by_state_and_type']
+    rows = cached_query(query.format(year=year), tables)
 
     # Create a DataFrame from the query results
     df = pd.DataFrame(rows, columns=['region', 'control', 'count'])
 
-    # Map region codes to region names
-    region_names = {
-        0: 'U.S. Service schools',
-        1: 'New England',
-        2: 'Mid East',
-        3: 'Great Lakes',
-        4: 'Plains',
-        5: 'Southeast',
-        6: 'Southwest',
-        7: 'Rocky Mountains',
-        8: 'Far West',
-        9: 'Outlying areas'
-    }
-
-    control_names = {
-        1: 'Public',
-        2: 'Private nonprofit',
-        3: 'Private for-profit'
-    }
-
-    df['region'] = df['region'].map(region_names)
-    df['control'] = df['control'].map(control_names)
-
-    # Close the database connection
-    cur.close()
-    conn.close()
+    df['region'] = df['region'].map(REGION_NAMES)
+    df['control'] = df['control'].map(CONTROL_NAMES)
 
     return df
 
@@ -88,216 +100,114 @@ print(summarize_colleges_by_state_and_type(year))
 
 # 2.
 # Summaries of current college tuition rates, by state and Carnegie Classification of institution.
-def summarize_tuition_rates_by_state_and_classification(year):
+def get_tuition_cube(year):
+    """
+    Retrieves every level of the tuition breakdown for the selected year with one query.
+
+    The average tuition is computed per state and classification, per state and per classification in a single
+    GROUPING SETS query, so the three tuition summaries below can slice the result instead of querying again.
+
+    Args:
+        year (int): The selected year for which the data is retrieved.
+
+    Returns:
+        pandas.DataFrame: A DataFrame with columns 'level', 'region', 'classification' and 'tuition_rate'.
+                          'level' is 'region_classification', 'region' or 'classification' and tells which
+                          breakdown a row belongs to; 'region' and 'classification' hold the codes of the row.
+    """
+    # GROUPING() is 0 for the region and ccbasic level, 1 for the region level and 2 for the ccbasic level
+    query, tables = REPORT_QUERIES['tuition_cube']
+    rows = cached_query(query.format(year=year), tables)
+
+    # Create a DataFrame from the query results
+    df = pd.DataFrame(rows, columns=['level', 'region', 'classification', 'tuition_rate'])
+    df['level'] = df['level'].map({0: 'region_classification', 1: 'region', 2: 'classification'})
+    df[['region', 'classification']] = df[['region', 'classification']].astype('Int64')
+
+    return df
+
+
+def summarize_tuition_rates_by_state_and_classification(year, cube=None):
     """
     Retrieves the summary of current college tuition rates, grouped by state and Carnegie Classification of institution.
 
     Args:
         year (int): The selected year for which the data is retrieved.
+        cube (pandas.DataFrame, optional): The result of get_tuition_cube(year), if it was already retrieved.
 
     Returns:
         pandas.DataFrame: A DataFrame containing the summary information, with columns 'region', 'classification', and 'tuition_rate'.
                           'region' represents the state, 'classification' represents the Carnegie Classification of institution,
                           and 'tuition_rate' represents the current tuition rate for that state and classification.
     """
-    # Connect to the database
-    conn, cur = connect_to_database()
+    if cube is None:
+        cube = get_tuition_cube(year)
+    df = cube[cube['level'] == 'region_classification']
+    df = df[['region', 'classification', 'tuition_rate']].reset_index(drop=True)
 
-    # Query the data for the selected year
-    query = f"SELECT region, ccbasic, AVG(tuitfte) AS avg_tuition FROM institutioninformation NATURAL JOIN studentbody WHERE year = {year} GROUP BY region, ccbasic ORDER BY region;"
-    cur.execute(query)
-    rows = cur.fetchall()
-
-    # Create a DataFrame from the query results
-    df = pd.DataFrame(rows, columns=['region', 'classification', 'tuition_rate'])
-
-    # Map region codes to region names
-    region_names = {
-        0: 'U.S. Service schools',
-        1: 'New England',
-        2: 'Mid East',
-        3: 'Great Lakes',
-        4: 'Plains',
-        5: 'Southeast',
-        6: 'Southwest',
-        7: 'Rocky Mountains',
-        8: 'Far West',
-        9: 'Outlying areas'
-    }
-
-    classification_names = {
-        0: 'Not classified',
-        1: 'Associates Colleges: High Transfer-High Traditional',
-        2: 'Traditional/Nontraditional',
-        3: 'Associate\'s Colleges: High Transfer-High Nontraditional',
-        4: 'Associate\'s Colleges: Mixed Transfer/Career & Technical-High Traditional',
-        5: 'Associate\'s Colleges: Mixed Transfer/Career & Technical-Mixed Traditional/Nontraditional',
-        6: 'Associate\'s Colleges: Mixed Transfer/Career & Technical-High Nontraditional',
-        7: 'Associate\'s Colleges: High Career & Technical-High Traditional',
-        8: 'Associate\'s Colleges: High Career & Technical-Mixed Traditional/Nontraditional',
-        9: 'Associate\'s Colleges: High Career & Technical-High Nontraditional',
-        10: 'Special Focus Two-Year: Health Professions',
-        11: 'Special Focus Two-Year: Technical Professions',
-        12: 'Special Focus Two-Year: Arts & Design',
-        13: 'Special Focus Two-Year: Other Fields',
-        14: 'Baccalaureate/Associate\'s Colleges: Associate\'s Dominant',
-        15: 'Doctoral Universities: Very High Research Activity',
-        16: 'Doctoral Universities: High Research Activity',
-        17: 'Doctoral/Professional Universities',
-        18: 'Master\'s Colleges & Universities: Larger Programs',
-        19: 'Master\'s Colleges & Universities: Medium Programs',
-        20: 'Master\'s Colleges & Universities: Small Programs',
-        21: 'Baccalaureate Colleges: Arts & Sciences Focus',
-        22: 'Baccalaureate Colleges: Diverse Fields',
-        23: 'Baccalaureate/Associate\'s Colleges: Mixed Baccalaureate/Associate\'s',
-        24: 'Special Focus Four-Year: Faith-Related Institutions',
-        25: 'Special Focus Four-Year: Medical Schools & Centers',
-        26: 'Special Focus Four-Year: Other Health Professions Schools',
-        27: 'Special Focus Four-Year: Research Schools',
-        28: 'Special Focus Four-Year: Engineering and Other Technology-Related Schools',
-        29: 'Special Focus Four-Year: Business & Management Schools',
-        30: 'Special Focus Four-Year: Arts, Music & Design Schools',
-        31: 'Special Focus Four-Year: Law Schools',
-        32: 'Special Focus Four-Year: Other Special Focus Institutions',
-        33: 'Tribal Colleges'
-    }
-
-    df['region'] = df['region'].map(region_names)
-    df['classification'] = df['classification'].map(classification_names)
-
-    # Close the database connection
-    cur.close()
-    conn.close()
+    df['region'] = df['region'].map(REGION_NAMES)
+    df['classification'] = df['classification'].map(CLASSIFICATION_NAMES)
 
     return df
 
 
-print('tuition rates by state and classification')
-print(summarize_tuition_rates_by_state_and_classification(year))
-
-
-def summarize_tuition_rates_by_state(year):
+def summarize_tuition_rates_by_state(year, cube=None):
     """
     Retrieves the summary of current college tuition rates, grouped by state of institution.
 
     Args:
         year (int): The selected year for which the data is retrieved.
+        cube (pandas.DataFrame, optional): The result of get_tuition_cube(year), if it was already retrieved.
 
     Returns:
         pandas.DataFrame: A DataFrame containing the summary information, with columns 'region', and 'tuition_rate'.
                           'region' represents the state, 'classification' 
                           and 'tuition_rate' represents the current tuition rate for that state and classification.
     """
-    # Connect to the database
-    conn, cur = connect_to_database()
+    if cube is None:
+        cube = get_tuition_cube(year)
+    df = cube[cube['level'] == 'region']
+    df = df[['region', 'tuition_rate']].reset_index(drop=True)
 
-    # Query the data for the selected year
-    query = f"SELECT region, AVG(tuitfte) AS avg_tuition FROM institutioninformation NATURAL JOIN studentbody WHERE year = {year} GROUP BY region ORDER BY region;"
-    cur.execute(query)
-    rows = cur.fetchall()
-
-    # Create a DataFrame from the query results
-    df = pd.DataFrame(rows, columns=['region', 'tuition_rate'])
-
-    # Map region codes to region names
-    region_names = {
-        0: 'U.S. Service schools',
-        1: 'New England',
-        2: 'Mid East',
-        3: 'Great Lakes',
-        4: 'Plains',
-        5: 'Southeast',
-        6: 'Southwest',
-        7: 'Rocky Mountains',
-        8: 'Far West',
-        9: 'Outlying areas'
-    }
-
-    df['region'] = df['region'].map(region_names)
-
-    # Close the database connection
-    cur.close()
-    conn.close()
+    df['region'] = df['region'].map(REGION_NAMES)
 
     return df
 
 
-print('tuition rates by state')
-print(summarize_tuition_rates_by_state(year))
-
-
-def summarize_tuition_rates_by_classification(year):
+def summarize_tuition_rates_by_classification(year, cube=None):
     """
     Retrieves the summary of current college tuition rates, grouped by Carnegie Classification of institution.
 
     Args:
         year (int): The selected year for which the data is retrieved.
+        cube (pandas.DataFrame, optional): The result of get_tuition_cube(year), if it was already retrieved.
 
     Returns:
         pandas.DataFrame: A DataFrame containing the summary information, with columns 'classification', and 'tuition_rate'.
                           'classification' represents the Carnegie Classification of institution,
                           and 'tuition_rate' represents the current tuition rate for that classification.
     """
-    # Connect to the database
-    conn, cur = connect_to_database()
-
-    # Query the data for the selected year
-    query = f"SELECT ccbasic, AVG(tuitfte) AS avg_tuition FROM institutioninformation NATURAL JOIN studentbody WHERE year = {year} GROUP BY ccbasic ORDER BY ccbasic;"
-    cur.execute(query)
-    rows = cur.fetchall()
+    if cube is None:
+        cube = get_tuition_cube(year)
+    df = cube[cube['level'] == 'classification']
+    df = df[['classification', 'tuition_rate']].reset_index(drop=True)
 
-    # Create a DataFrame from the query results
-    df = pd.DataFrame(rows, columns=['classification', 'tuition_rate'])
-
-    # Map region codes to classification names
-    classification_names = {
-        0: 'Not classified',
-        1: 'Associates Colleges: High Transfer-High Traditional',
-        2: 'Traditional/Nontraditional',
-        3: 'Associate\'s Colleges: High Transfer-High Nontraditional',
-        4: 'Associate\'s Colleges: Mixed Transfer/Career & Technical-High Traditional',
-        5: 'Associate\'s Colleges: Mixed Transfer/Career & Technical-Mixed Traditional/Nontraditional',
-        6: 'Associate\'s Colleges: Mixed Transfer/Career & Technical-High Nontraditional',
-        7: 'Associate\'s Colleges: High Career & Technical-High Traditional',
-        8: 'Associate\'s Colleges: High Career & Technical-Mixed Traditional/Nontraditional',
-        9: 'Associate\'s Colleges: High Career & Technical-High Nontraditional',
-        10: 'Special Focus Two-Year: Health Professions',
-        11: 'Special Focus Two-Year: Technical Professions',
-        12: 'Special Focus Two-Year: Arts & Design',
-        13: 'Special Focus Two-Year: Other Fields',
-        14: 'Baccalaureate/Associate\'s Colleges: Associate\'s Dominant',
-        15: 'Doctoral Universities: Very High Research Activity',
-        16: 'Doctoral Universities: High Research Activity',
-        17: 'Doctoral/Professional Universities',
-        18: 'Master\'s Colleges & Universities: Larger Programs',
-        19: 'Master\'s Colleges & Universities: Medium Programs',
-        20: 'Master\'s Colleges & Universities: Small Programs',
-        21: 'Baccalaureate Colleges: Arts & Sciences Focus',
-        22: 'Baccalaureate Colleges: Diverse Fields',
-        23: 'Baccalaureate/Associate\'s Colleges: Mixed Baccalaureate/Associate\'s',
-        24: 'Special Focus Four-Year: Faith-Related Institutions',
-        25: 'Special Focus Four-Year: Medical Schools & Centers',
-        26: 'Special Focus Four-Year: Other Health Professions Schools',
-        27: 'Special Focus Four-Year: Research Schools',
-        28: 'Special Focus Four-Year: Engineering and Other Technology-Related Schools',
-        29: 'Special Focus Four-Year: Business & Management Schools',
-        30: 'Special Focus Four-Year: Arts, Music & Design Schools',
-        31: 'Special Focus Four-Year: Law Schools',
-        32: 'Special Focus Four-Year: Other Special Focus Institutions',
-        33: 'Tribal Colleges'
-    }
-
-    df['classification'] = df['classification'].map(classification_names)
-
-    # Close the database connection
-    cur.close()
-    conn.close()
+    df['classification'] = df['classification'].map(CLASSIFICATION_NAMES)
 
     return df
 
 
+# the three tuition summaries share one query
+tuition_cube = get_tuition_cube(year)
+
+print('tuition rates by state and classification')
+print(summarize_tuition_rates_by_state_and_classification(year, tuition_cube))
+
+print('tuition rates by state')
+print(summarize_tuition_rates_by_state(year, tuition_cube))
+
 print('tuition rates by classification')
-print(summarize_tuition_rates_by_classification(year))
+print(summarize_tuition_rates_by_classification(year, tuition_cube))
 
 
 # 3.
@@ -305,14 +215,10 @@ print(summarize_tuition_rates_by_classification(year))
 
 
 def get_best_and_worst_performing_institutions_by_loan_repayment_rates(year):
-    # Connect to the database
-    conn, cur = connect_to_database()
-
     # Query the data for the selected year
-    query = f"SELECT * FROM loanrepayments WHERE year = {year};"
+    query, tables = REPORT_QUERIES['loan_repayments']
 
-    cur.execute(query)
-    rows = cur.fetchall()
+    rows = cached_query(query.format(year=year), tables)
 
     # Create a DataFrame from the query results
     df = pd.DataFrame(rows, columns=[
@@ -331,9 +237,8 @@ def get_best_and_worst_performing_institutions_by_loan_repayment_rates(year):
         ])
 
     # Join the institutioninformation table to get the institution name (instnm)
-    institution_query = f"SELECT unitid, instnm FROM institutioninformation WHERE year = {year};"
-    cur.execute(institution_query)
-    institution_rows = cur.fetchall()
+    institution_query, institution_tables = REPORT_QUERIES['institution_names']
+    institution_rows = cached_query(institution_query.format(year=year), institution_tables)
     institution_df = pd.DataFrame(institution_rows, columns=['unitid', 'instnm'])
 
     # Calculate scaled values for each loan repayment column
@@ -360,10 +265,6 @@ def get_best_and_worst_performing_institutions_by_loan_repayment_rates(year):
     # Get the top 10 worst performing institutions
     best = df.tail(10)
 
-    # Close the database connection
-    cur.close()
-    conn.close()
-
     return worst, best
 
 
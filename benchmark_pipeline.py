@@ -0,0 +1,219 @@
+import argparse
+import csv
+import os
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+import psycopg
+from db import DSN_VARIABLE
+from schema_tables import TABLE_COLUMNS, ROLLUP_TABLE
+from synthetic_data import BASE_ROWS, write_synthetic_files
+
+# Reporting.py reports on 2021, so the benchmark loads that schema year.
+YEAR = 2021
+REPO_DIR = os.path.dirname(os.path.abspath(__file__))
+
+
+def start_postgres(pg_bin, directory, port):
+    """
+    Create and start a throwaway PostgreSQL server.
+
+    The server only listens on a unix socket in directory and trusts every
+    local user, so it must not be used for anything but benchmarks.
+
+    Args:
+        pg_bin: The directory with initdb and pg_ctl, or None to use PATH.
+        directory: An empty directory for the data and the socket.
+        port: The port number, which is part of the socket name.
+
+    Returns:
+        The connection string of the server.
+    """
+    def program(name):
+        return os.path.join(pg_bin, name) if pg_bin else name
+
+    data_dir = os.path.join(directory, 'data')
+    subprocess.run(
+        [program('initdb'), '-D', data_dir, '-U', 'postgres',
+         '--auth=trust', '-E', 'UTF8'],
+        check=True, stdout=subprocess.DEVNULL)
+    subprocess.run(
+        [program('pg_ctl'), '-D', data_dir, '-w',
+         '-l', os.path.join(directory, 'postgres.log'),
+         '-o', f"-k {directory} -p {port} -c listen_addresses=''", 'start'],
+        check=True, stdout=subprocess.DEVNULL)
+    return f'postgresql://postgres@/postgres?host={directory}&port={port}'
+
+
+def stop_postgres(pg_bin, directory):
+    """Stop a server started with start_postgres()."""
+    pg_ctl = os.path.join(pg_bin, 'pg_ctl') if pg_bin else 'pg_ctl'
+    subprocess.run(
+        [pg_ctl, '-D', os.path.join(directory, 'data'), '-m', 'fast', 'stop'],
+        check=True, stdout=subprocess.DEVNULL)
+
+
+def drop_pipeline_tables(dsn):
+    """Drop every table that the pipeline creates for YEAR."""
+    tables = [f'scorecard_{YEAR - 1}', f'ipeds_{YEAR}', *TABLE_COLUMNS,
+              ROLLUP_TABLE, 'table_versions']
+    with psycopg.connect(dsn, autocommit=True) as conn:
+        conn.execute(f"DROP TABLE IF EXISTS {', '.join(tables)} CASCADE;")
+
+
+def count_rows(dsn, table_name):
+    """Count the rows of a table."""
+    with psycopg.connect(dsn) as conn:
+        return conn.execute(f"SELECT COUNT(*) FROM {table_name};").fetchone()[0]
+
+
+def run_stage(args, workdir, env, log):
+    """
+    Run one pipeline stage in its own process and measure it.
+
+    Args:
+        args: The script and its arguments.
+        workdir: The working directory of the stage.
+        env: The environment variables of the stage.
+        log: An open file that gets the output of the stage.
+
+    Returns:
+        A tuple of (wall seconds, CPU seconds, peak RSS in MB).
+    """
+    log.write(f"$ {' '.join(args)}\n")
+    log.flush()
+    start = time.perf_counter()
+    process = subprocess.Popen(
+        [sys.executable, *args], cwd=workdir, env=env,
+        stdout=log, stderr=subprocess.STDOUT)
+    # wait4 gives the resource usage of this one child process.
+    _, status, usage = os.wait4(process.pid, 0)
+    wall = time.perf_counter() - start
+    process.returncode = os.waitstatus_to_exitcode(status)
+    if process.returncode != 0:
+        raise RuntimeError(
+            f"{' '.join(args)} exited with {process.returncode}, "
+            f"see {log.name}")
+    # ru_maxrss is in kilobytes on Linux.
+    return wall, usage.ru_utime + usage.ru_stime, usage.ru_maxrss / 1024
+
+
+def benchmark_scale(dsn, scale, workdir, schema_mode):
+    """
+    Generate the data of one scale and run every stage of the pipeline on it.
+
+    Args:
+        dsn: The connection string of the throwaway database.
+        scale: The size as a multiple of BASE_ROWS.
+        workdir: A directory for the data, the logs and the reject files.
+        schema_mode: The --mode of load-schema.py, client or server.
+
+    Returns:
+        A list of dicts, one per stage.
+    """
+    scale_dir = os.path.join(workdir, f'scale_{scale:g}')
+    os.makedirs(scale_dir, exist_ok=True)
+    rows = int(BASE_ROWS * scale)
+    print(f"scale {scale:g}x: generating {rows} institutions")
+    scorecard_file, hd_file = write_synthetic_files(scale_dir, YEAR, rows)
+    drop_pipeline_tables(dsn)
+
+    env = dict(os.environ)
+    env[DSN_VARIABLE] = dsn
+    env['REPORT_CACHE_DIR'] = os.path.join(scale_dir, 'report_cache')
+    env['PYTHONPATH'] = os.pathsep.join(
+        [REPO_DIR, *filter(None, [env.get('PYTHONPATH')])])
+
+    def script(name):
+        return os.path.join(REPO_DIR, name)
+
+    stages = [
+        ('load-scorecard', [script('load-scorecard.py'), scorecard_file],
+         f'scorecard_{YEAR - 1}'),
+        ('load_ipeds', [script('load_ipeds.py'), hd_file], f'ipeds_{YEAR}'),
+        ('load-schema', [script('load-schema.py'), str(YEAR), 'True',
+                         '--mode', schema_mode], 'InstitutionInformation'),
+        ('Reporting', [script('Reporting.py')], None),
+    ]
+    results = []
+    with open(os.path.join(scale_dir, 'stages.log'), 'w') as log:
+        for name, args, table_name in stages:
+            wall, cpu, peak_rss = run_stage(args, scale_dir, env, log)
+            stage_rows = count_rows(dsn, table_name) if table_name else None
+            result = {
+                'scale': scale,
+                'stage': name,
+                'rows': stage_rows,
+                'wall_seconds': round(wall, 3),
+                'cpu_seconds': round(cpu, 3),
+                'rows_per_second':
+                    round(stage_rows / wall) if stage_rows else None,
+                'peak_rss_mb': round(peak_rss, 1),
+            }
+            print(f"  {name:15} {wall:9.2f} s  "
+                  f"{result['rows_per_second'] or '-':>9} rows/s  "
+                  f"{peak_rss:8.1f} MB")
+            results.append(result)
+    return results
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+        description="Run the whole pipeline on synthetic data against a "
+                    "throwaway PostgreSQL database and report the wall time, "
+                    "rows per second and peak memory of every stage.")
+    parser.add_argument(
+        "--scales", type=float, nargs="+", default=[1, 10, 100],
+        help=f"data sizes as multiples of {BASE_ROWS} institutions "
+             f"(default: 1 10 100)")
+    parser.add_argument(
+        "--dsn",
+        help="connection string of an existing throwaway database; the "
+             "pipeline tables in it are dropped. By default a temporary "
+             "server is created with initdb")
+    parser.add_argument(
+        "--pg-bin", help="directory with initdb and pg_ctl (default: PATH)")
+    parser.add_argument(
+        "--port", type=int, default=54329,
+        help="port of the temporary server (default: 54329)")
+    parser.add_argument(
+        "--schema-mode", choices=["client", "server"], default="client",
+        help="the --mode passed to load-schema.py (default: client)")
+    parser.add_argument(
+        "--workdir",
+        help="keep the data, logs and reject files in this directory "
+             "(default: a temporary directory that is removed)")
+    parser.add_argument(
+        "--output", help="also write the results to this csv file")
+    args = parser.parse_args()
+
+    workdir = args.workdir or tempfile.mkdtemp(prefix='pipeline_benchmark_')
+    os.makedirs(workdir, exist_ok=True)
+    # unix socket paths are short, so the server gets its own directory in
+    # the temporary directory.
+    server_dir = None if args.dsn else tempfile.mkdtemp(prefix='pg_')
+    server_started = False
+    try:
+        dsn = args.dsn
+        if server_dir:
+            dsn = start_postgres(args.pg_bin, server_dir, args.port)
+            server_started = True
+        results = []
+        for scale in args.scales:
+            results.extend(
+                benchmark_scale(dsn, scale, workdir, args.schema_mode))
+    finally:
+        if server_started:
+            stop_postgres(args.pg_bin, server_dir)
+        if server_dir:
+            shutil.rmtree(server_dir, ignore_errors=True)
+        if not args.workdir:
+            shutil.rmtree(workdir, ignore_errors=True)
+
+    if args.output:
+        with open(args.output, 'w', newline='') as f:
+            writer = csv.DictWriter(f, fieldnames=list(results[0]))
+            writer.writeheader()
+            writer.writerows(results)
@@ -0,0 +1,138 @@
+import argparse
+import csv
+import statistics
+import psycopg
+import report_queries
+from db import connect_to_database, release
+from schema_tables import SECONDARY_INDEXES, create_indexes
+
+# the queries that the reports and loaders run against the schema tables,
+# by name. {year} is replaced with the year being benchmarked. The report
+# summaries read reporting_rollup, which the secondary indexes do not
+# serve, so only the rollup refresh that fills it is measured here. The
+# report queries come from report_queries.py; institution_new_not_in is
+# the form the notebook used before institution_new (NOT EXISTS).
+REPORT_QUERIES = {
+    'institution_names': report_queries.REPORT_QUERIES['institution_names'][0],
+    'rollup_refresh':
+        "SELECT i.year, i.region, i.control, i.ccbasic, COUNT(*), "
+        "COUNT(s.unitid), COUNT(s.tuitfte), SUM(s.tuitfte) "
+        "FROM institutioninformation i "
+        "LEFT JOIN studentbody s USING (unitid, year) WHERE i.year = {year} "
+        "GROUP BY i.year, i.region, i.control, i.ccbasic;",
+    'tuition_and_salary':
+        report_queries.REPORT_QUERIES['tuition_and_salary'][0],
+    'institution_new_not_in':
+        "SELECT i.unitid, i.instnm FROM institutioninformation i "
+        "WHERE i.year = {year} AND i.unitid NOT IN ("
+        "SELECT unitid FROM institutioninformation "
+        "WHERE year >= 2019 AND year < {year});",
+    'institution_new_not_exists':
+        report_queries.REPORT_QUERIES['institution_new'][0],
+    'loan_repayments': report_queries.REPORT_QUERIES['loan_repayments'][0],
+}
+
+
+def scans(plan):
+    """
+    List the table scans of a query plan.
+
+    Args:
+        plan: A plan node from EXPLAIN (FORMAT JSON).
+
+    Returns:
+        A list of strings such as 'Seq Scan on debt'.
+    """
+    found = []
+    if 'Relation Name' in plan:
+        found.append(f"{plan['Node Type']} on {plan['Relation Name']}")
+    for child in plan.get('Plans', []):
+        found.extend(scans(child))
+    return found
+
+
+def explain_query(cur, query, repeat):
+    """
+    Time a query with EXPLAIN ANALYZE.
+
+    The query is run once to warm the cache and then repeat more times.
+
+    Args:
+        cur: The database cursor.
+        query: The SQL query.
+        repeat: The number of timed runs.
+
+    Returns:
+        A tuple of (median execution time in milliseconds, table scans of
+        the plan).
+    """
+    times = []
+    for _ in range(repeat + 1):
+        cur.execute(f"EXPLAIN (ANALYZE, FORMAT JSON) {query}")
+        result = cur.fetchone()[0][0]
+        times.append(result['Execution Time'])
+    return statistics.median(times[1:]), scans(result['Plan'])
+
+
+def benchmark(year, repeat):
+    """
+    Time every report query without and with the secondary indexes.
+
+    Both runs happen in transactions that are rolled back, so the indexes
+    of the database are the same afterwards. Dropping an index locks its
+    table, so do not run this while a load is running.
+
+    Args:
+        year: The year that the queries select.
+        repeat: The number of timed runs of each query.
+
+    Returns:
+        A list of dicts with the query name, the median time and the table
+        scans before and after.
+    """
+    conn, cur = connect_to_database()
+    results = {name: {'query': name} for name in REPORT_QUERIES}
+    for label in ('before', 'after'):
+        with conn.transaction():
+            if label == 'before':
+                for index_name, _, _ in SECONDARY_INDEXES:
+                    cur.execute(f"DROP INDEX IF EXISTS {index_name};")
+            else:
+                create_indexes(cur)
+            for table_name in {table for _, table, _ in SECONDARY_INDEXES}:
+                cur.execute(f"ANALYZE {table_name};")
+            for name, query in REPORT_QUERIES.items():
+                time, plan = explain_query(cur, query.format(year=year), repeat)
+                results[name][f'{label}_ms'] = round(time, 3)
+                results[name][f'{label}_plan'] = '; '.join(plan)
+                print(f"{label:6} {name:28} {time:10.3f} ms  {'; '.join(plan)}")
+            raise psycopg.Rollback()
+    release(conn)
+    return list(results.values())
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+        description="Measure the report queries with EXPLAIN ANALYZE, "
+                    "without and with the secondary indexes of the schema "
+                    "tables.")
+    parser.add_argument("year", type=int, help="the year the queries select")
+    parser.add_argument(
+        "--repeat", type=int, default=5,
+        help="timed runs of each query; the median is reported (default: 5)")
+    parser.add_argument(
+        "--output", help="also write the results to this csv file")
+    args = parser.parse_args()
+
+    results = benchmark(args.year, args.repeat)
+    print()
+    print(f"{'query':28} {'before ms':>10} {'after ms':>10} {'speedup':>8}")
+    for row in results:
+        speedup = row['before_ms'] / row['after_ms'] if row['after_ms'] else 0
+        print(f"{row['query']:28} {row['before_ms']:10.3f} "
+              f"{row['after_ms']:10.3f} {speedup:7.1f}x")
+    if args.output:
+        with open(args.output, 'w', newline='') as f:
+            writer = csv.DictWriter(f, fieldnames=list(results[0]))
+            writer.writeheader()
+            writer.writerows(results)
@@ -0,0 +1,129 @@
+import pandas as pd
+
+
+def frame_to_text_rows(df):
+    """
+    Convert a dataframe into rows of text values that COPY can stream.
+
+    The conversion is done column by column on the underlying arrays, so no
+    per-row Series objects are built. Missing values become None (NULL).
+
+    Args:
+        df: The pandas dataframe.
+
+    Returns:
+        An iterator of tuples, one per dataframe row.
+    """
+    columns = []
+    for col in df.columns:
+        series = df[col]
+        values = series.astype(str).to_numpy(dtype=object)
+        values[pd.isna(series).to_numpy()] = None
+        columns.append(values)
+    return zip(*columns)
+
+
+def copy_rows(cur, table_name, columns, rows):
+    """
+    Stream rows into a table with PostgreSQL COPY.
+
+    Args:
+        cur: The database cursor.
+        table_name: The table to copy into.
+        columns: The column names, in the same order as the row values.
+        rows: An iterable of row tuples.
+
+    Returns:
+        The number of rows copied.
+    """
+    num_rows = 0
+    column_str = ', '.join(columns)
+    with cur.copy(f"COPY {table_name} ({column_str}) FROM STDIN") as copy:
+        for row in rows:
+            copy.write_row(row)
+            num_rows += 1
+    return num_rows
+
+
+def copy_frame(cur, table_name, df):
+    """
+    Stream a whole dataframe into a table with PostgreSQL COPY.
+
+    Args:
+        cur: The database cursor.
+        table_name: The table to copy into.
+        df: The pandas dataframe. Its column names must match the table.
+
+    Returns:
+        The number of rows copied.
+    """
+    return copy_rows(cur, table_name, list(df.columns), frame_to_text_rows(df))
+
+
+def frame_to_rows(df):
+    """
+    Convert a dataframe into a list of row tuples of plain Python values.
+
+    The rows are built from the column arrays, without creating a Series
+    per row the way df.iterrows() does.
+
+    Args:
+        df: The pandas dataframe.
+
+    Returns:
+        A list of tuples, one per dataframe row.
+    """
+    return list(zip(*(df[col].tolist() for col in df.columns)))
+
+
+def insert_batches(conn, cur, table_name, columns, rows, rejected_csv,
+                   batch_size=1000):
+    """
+    Insert rows in batches, isolating the rows that the database rejects.
+
+    Each batch is sent with one executemany inside a savepoint. If a batch
+    fails it is split in half and both halves are retried, down to single
+    rows, so only the rows that really fail are rejected. Rejected rows
+    are written to rejected_csv together with the error. The caller is
+    responsible for committing.
+
+    Args:
+        conn: The database connection.
+        cur: The database cursor.
+        table_name: The table to insert into.
+        columns: The column names, in the same order as the row values.
+        rows: A list of row tuples.
+        rejected_csv: A csv writer for the rejected rows.
+        batch_size: The number of rows sent in each batch.
+
+    Returns:
+        A tuple of (rows inserted, rows rejected).
+    """
+    placeholders = ', '.join(['%s'] * len(columns))
+    sql = (
+        f"INSERT INTO {table_name} "
+        f"({', '.join(columns)}) "
+        f"VALUES ({placeholders})"
+    )
+
+    def write(batch):
+        try:
+            with conn.transaction():
+                cur.executemany(sql, batch)
+        except Exception as e:
+            if len(batch) == 1:
+                rejected_csv.writerow([str(e), batch[0]])
+                return 0, 1
+            middle = len(batch) // 2
+            inserted_1, rejected_1 = write(batch[:middle])
+            inserted_2, rejected_2 = write(batch[middle:])
+            return inserted_1 + inserted_2, rejected_1 + rejected_2
+        return len(batch), 0
+
+    inserted_rows = 0
+    rejected_rows = 0
+    for start in range(0, len(rows), batch_size):
+        inserted, rejected = write(rows[start:start + batch_size])
+        inserted_rows += inserted
+        rejected_rows += rejected
+    return inserted_rows, rejected_rows
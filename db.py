@@ -0,0 +1,190 @@
+import atexit
+import os
+from psycopg import AsyncConnection
+from psycopg.pq import TransactionStatus
+from psycopg_pool import ConnectionPool
+
+# connection settings shared by every module. DB_HOST is optional in
+# credentials.py and defaults to our azure server.
+DEFAULT_HOST = "pinniped.postgres.database.azure.com"
+# if this environment variable holds a connection string, it is used instead
+# of credentials.py, e.g. to run the loaders against a local test database.
+DSN_VARIABLE = "PIPELINE_DSN"
+POOL_MIN_SIZE = 1
+POOL_MAX_SIZE = 8
+
+_pool = None
+_pool_pid = None
+
+
+def connection_settings():
+    """
+    Get the connection settings of the pool.
+
+    Returns:
+        A dict of ConnectionPool keyword arguments.
+    """
+    if dsn := os.environ.get(DSN_VARIABLE):
+        return {"conninfo": dsn}
+    import credentials
+    return {
+        "kwargs": {
+            "host": getattr(credentials, "DB_HOST", DEFAULT_HOST),
+            "dbname": credentials.DB_NAME,
+            "user": credentials.DB_USER,
+            "password": credentials.DB_PASSWORD,
+        }
+    }
+
+
+def get_pool():
+    """
+    Get the connection pool of this process, creating it on first use.
+
+    A pool is never shared with a forked child process; the child creates
+    its own pool the first time it asks for a connection.
+
+    Returns:
+        The psycopg_pool ConnectionPool.
+    """
+    global _pool, _pool_pid
+    if _pool is None or _pool_pid != os.getpid():
+        _pool = ConnectionPool(
+            **connection_settings(),
+            min_size=POOL_MIN_SIZE,
+            max_size=POOL_MAX_SIZE,
+            # make sure a connection still works before handing it out.
+            check=ConnectionPool.check_connection,
+            open=True)
+        _pool_pid = os.getpid()
+    return _pool
+
+
+def connect_to_database():
+    """
+    Take a connection from the pool.
+
+    The connection must be given back with release() instead of being
+    closed.
+
+    Returns:
+        A tuple containing the connection and cursor objects.
+    """
+    conn = get_pool().getconn()
+    cur = conn.cursor()
+    return conn, cur
+
+
+def release(conn):
+    """
+    Give a connection taken with connect_to_database() back to the pool.
+
+    An open transaction on the connection is rolled back.
+
+    Args:
+        conn: The database connection.
+    """
+    if conn.info.transaction_status in (
+            TransactionStatus.INTRANS, TransactionStatus.INERROR):
+        conn.rollback()
+    get_pool().putconn(conn)
+
+
+def connection():
+    """
+    Borrow a connection from the pool for the length of a with block.
+
+    The transaction is committed if the block succeeds and rolled back if
+    it raises, and the connection is given back to the pool either way.
+
+    Returns:
+        A context manager that yields a connection.
+    """
+    return get_pool().connection()
+
+
+async def connect_async():
+    """
+    Open an async connection with the same settings as the pool.
+
+    Async connections are not pooled; close the connection when done,
+    e.g. with an async with block.
+
+    Returns:
+        A psycopg AsyncConnection.
+    """
+    settings = connection_settings()
+    return await AsyncConnection.connect(
+        settings.get("conninfo", ""), **settings.get("kwargs", {}))
+
+
+def create_table_versions(cur):
+    """
+    Create the table_versions table if it does not exist yet.
+
+    It is created by create_tables_schema() in load-schema.py, before any
+    year is loaded. The caller is responsible for committing.
+
+    Args:
+        cur: The database cursor.
+    """
+    cur.execute("""
+        CREATE TABLE IF NOT EXISTS table_versions (
+            table_name TEXT PRIMARY KEY,
+            version BIGINT NOT NULL,
+            updated_at TIMESTAMPTZ NOT NULL DEFAULT now()
+        );""")
+
+
+def bump_table_versions(cur, tables):
+    """
+    Record that the data in some tables changed.
+
+    Every table has a version number in table_versions that goes up by one
+    each time a loader changes it. Cached report results are tied to these
+    versions, see report_cache.py. The table must exist, see
+    create_table_versions(). The caller is responsible for committing.
+
+    Args:
+        cur: The database cursor.
+        tables: The names of the tables that changed.
+    """
+    cur.executemany("""
+        INSERT INTO table_versions (table_name, version) VALUES (%s, 1)
+        ON CONFLICT (table_name) DO UPDATE
+        SET version = table_versions.version + 1, updated_at = now();""",
+        [(table.lower(),) for table in tables])
+
+
+def get_table_versions(cur, tables):
+    """
+    Look up the current version of some tables.
+
+    Args:
+        cur: The database cursor.
+        tables: The table names.
+
+    Returns:
+        A tuple of versions in the order of tables, with 0 for a table
+        that was never bumped, or None if table_versions does not exist.
+    """
+    cur.execute("SELECT to_regclass('table_versions') IS NOT NULL;")
+    if not cur.fetchone()[0]:
+        return None
+    names = [table.lower() for table in tables]
+    cur.execute(
+        "SELECT table_name, version FROM table_versions "
+        "WHERE table_name = ANY(%s);", (names,))
+    versions = dict(cur.fetchall())
+    return tuple(versions.get(name, 0) for name in names)
+
+
+def close_pool():
+    """Close the connection pool of this process, if there is one."""
+    global _pool
+    if _pool is not None and _pool_pid == os.getpid():
+        _pool.close()
+    _pool = None
+
+
+atexit.register(close_pool)
@@ -0,0 +1,102 @@
+import argparse
+import copy
+import os
+import time
+import nbformat
+from nbclient import NotebookClient
+from nbconvert import HTMLExporter
+
+REPO_DIR = os.path.dirname(os.path.abspath(__file__))
+NOTEBOOK = os.path.join(REPO_DIR, 'Reporting Notebook.ipynb')
+
+
+def year_notebook(template, year):
+    """
+    Make a copy of the reporting notebook that reports on one year.
+
+    Like papermill, a cell that sets the year is added after the cell
+    tagged 'parameters'.
+
+    Args:
+        template: The reporting notebook.
+        year: The year of the report.
+
+    Returns:
+        The new notebook.
+    """
+    nb = copy.deepcopy(template)
+    index = next(
+        (i for i, cell in enumerate(nb.cells)
+         if 'parameters' in cell.metadata.get('tags', [])), -1)
+    cell = nbformat.v4.new_code_cell(f'# Parameters\nyear = {year}\n')
+    cell.metadata['tags'] = ['injected-parameters']
+    nb.cells.insert(index + 1, cell)
+    return nb
+
+
+def generate_reports(years, output_dir, timeout=600, keep_notebooks=False):
+    """
+    Run the reporting notebook for several years and write HTML reports.
+
+    All years run one after the other in the same kernel, so geopandas and
+    matplotlib are imported once, the kernel keeps its database
+    connections, and data that every report shows, such as the yearly
+    tuition by control, is only fetched once (see report_data.py).
+
+    Args:
+        years: The years to report on.
+        output_dir: The directory for Report<year>.html.
+        timeout: The seconds a cell may run before the report fails.
+        keep_notebooks: Also write the executed Report<year>.ipynb.
+
+    Returns:
+        The paths of the HTML reports.
+    """
+    os.makedirs(output_dir, exist_ok=True)
+    template = nbformat.read(NOTEBOOK, as_version=4)
+    # the input cells are left out, like nbconvert --no-input.
+    exporter = HTMLExporter(exclude_input=True)
+    client = NotebookClient(
+        template, timeout=timeout, kernel_name='python3',
+        # the notebook reads its shapefile and modules from the repository.
+        resources={'metadata': {'path': REPO_DIR}})
+    paths = []
+    with client.setup_kernel():
+        for year in years:
+            start = time.perf_counter()
+            nb = year_notebook(template, year)
+            client.nb = nb
+            client.reset_execution_trackers()
+            for index, cell in enumerate(nb.cells):
+                client.execute_cell(cell, index)
+            if keep_notebooks:
+                nbformat.write(
+                    nb, os.path.join(output_dir, f'Report{year}.ipynb'))
+            html, _ = exporter.from_notebook_node(nb)
+            path = os.path.join(output_dir, f'Report{year}.html')
+            with open(path, 'w', encoding='utf-8') as f:
+                f.write(html)
+            print(f"wrote {path} in {time.perf_counter() - start:.1f} s")
+            paths.append(path)
+    return paths
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+        description="Write the HTML report of several years from the "
+                    "reporting notebook, in one kernel.")
+    parser.add_argument("years", type=int, nargs="+",
+                        help="the years to report on, e.g. 2019 2020 2021")
+    parser.add_argument(
+        "--output-dir", default=".",
+        help="directory for Report<year>.html (default: current directory)")
+    parser.add_argument(
+        "--timeout", type=int, default=600,
+        help="seconds a cell may run (default: 600)")
+    parser.add_argument(
+        "--keep-notebooks", action="store_true",
+        help="also write the executed Report<year>.ipynb files")
+    args = parser.parse_args()
+
+    generate_reports(args.years, args.output_dir, args.timeout,
+                     args.keep_notebooks)
@@ -0,0 +1,196 @@
+import json
+import os
+import resource
+import sys
+import threading
+import time
+from contextlib import contextmanager
+from datetime import datetime, timezone
+
+# if this environment variable names a directory, every loader run writes
+# its stage measurements there as <run>.json, or as <run>.prom for the
+# node_exporter textfile collector if PIPELINE_METRICS_FORMAT=prometheus.
+METRICS_DIR_VARIABLE = "PIPELINE_METRICS_DIR"
+METRICS_FORMAT_VARIABLE = "PIPELINE_METRICS_FORMAT"
+
+_records = {}
+_lock = threading.Lock()
+# when the first stage of the current run started.
+_run_started_at = None
+
+
+def peak_rss_mb():
+    """Get the peak resident memory of this process so far, in MB."""
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # ru_maxrss is in bytes on macOS and in kilobytes elsewhere.
+    if sys.platform == 'darwin':
+        return peak / 1024 / 1024
+    return peak / 1024
+
+
+@contextmanager
+def stage(name, rows=None, **labels):
+    """
+    Measure one stage of a loader.
+
+    The stage yields a dict in which the block can set 'rows' once it
+    knows how many rows it handled. A stage that runs several times with
+    the same name and labels, e.g. once per chunk, is recorded once with
+    the durations and rows added up.
+
+    Args:
+        name: The stage name, e.g. 'read_csv' or 'insert'.
+        rows: The number of rows handled, if known up front.
+        **labels: Extra labels that tell runs of a stage apart, e.g. the
+            table name.
+
+    Yields:
+        A dict with the key 'rows'.
+    """
+    global _run_started_at
+    if _run_started_at is None:
+        _run_started_at = datetime.now(timezone.utc)
+    measurement = {'rows': rows}
+    start = time.perf_counter()
+    try:
+        yield measurement
+    finally:
+        duration = time.perf_counter() - start
+        key = (name, tuple(sorted(labels.items())))
+        with _lock:
+            record = _records.setdefault(key, {
+                'stage': name,
+                'labels': labels,
+                'calls': 0,
+                'duration_seconds': 0.0,
+                'rows': None,
+            })
+            record['calls'] += 1
+            record['duration_seconds'] += duration
+            if measurement['rows'] is not None:
+                record['rows'] = (record['rows'] or 0) + measurement['rows']
+            record['peak_rss_mb'] = round(peak_rss_mb(), 1)
+
+
+def stage_records():
+    """
+    Get the stages measured so far, in the order they first ran.
+
+    Returns:
+        A list of dicts with the stage name, labels, number of calls,
+        duration, rows, rows per second and peak RSS.
+    """
+    with _lock:
+        records = [dict(record) for record in _records.values()]
+    for record in records:
+        record['duration_seconds'] = round(record['duration_seconds'], 4)
+        record['rows_per_second'] = (
+            round(record['rows'] / record['duration_seconds'])
+            if record['rows'] and record['duration_seconds'] else None)
+    return records
+
+
+def prometheus_text(run, labels, records):
+    """
+    Format stage records in the Prometheus text exposition format.
+
+    Args:
+        run: The run name, e.g. load-scorecard.
+        labels: Labels of the whole run, e.g. the year.
+        records: The records returned by stage_records().
+
+    Returns:
+        The text of a .prom file.
+    """
+    def label_str(extra):
+        all_labels = {'run': run, **labels, **extra}
+        return ','.join(f'{key}="{value}"' for key, value in all_labels.items())
+
+    metrics = [
+        ('pipeline_stage_duration_seconds', 'duration_seconds',
+         'Wall time of a loader stage.'),
+        ('pipeline_stage_rows', 'rows',
+         'Rows handled by a loader stage.'),
+        ('pipeline_stage_rows_per_second', 'rows_per_second',
+         'Throughput of a loader stage.'),
+        ('pipeline_stage_peak_rss_megabytes', 'peak_rss_mb',
+         'Peak resident memory of the loader at the end of a stage.'),
+    ]
+    lines = []
+    for metric, field, help_text in metrics:
+        lines.append(f'# HELP {metric} {help_text}')
+        lines.append(f'# TYPE {metric} gauge')
+        for record in records:
+            if record[field] is not None:
+                stage_labels = {'stage': record['stage'], **record['labels']}
+                lines.append(
+                    f'{metric}{{{label_str(stage_labels)}}} {record[field]}')
+    lines.append('# HELP pipeline_run_finished_timestamp_seconds '
+                 'When the loader run finished.')
+    lines.append('# TYPE pipeline_run_finished_timestamp_seconds gauge')
+    lines.append(f'pipeline_run_finished_timestamp_seconds{{{label_str({})}}} '
+                 f'{time.time():.0f}')
+    return '\n'.join(lines) + '\n'
+
+
+def write_run_record(run, **labels):
+    """
+    Print the stages measured in this run and write them out.
+
+    The stages are printed as a table. If PIPELINE_METRICS_DIR is set they
+    are also written to <run>_<label values>.json (or .prom) in that
+    directory. The measurements are then cleared, so the next run in the
+    same process starts afresh.
+
+    Args:
+        run: The run name, e.g. load-scorecard.
+        **labels: Labels of the whole run, e.g. year=2019.
+
+    Returns:
+        The path of the written file, or None.
+    """
+    global _run_started_at
+    records = stage_records()
+    finished_at = datetime.now(timezone.utc)
+    started_at = _run_started_at or finished_at
+    print(f"{'stage':32} {'calls':>5} {'seconds':>9} {'rows':>9} "
+          f"{'rows/s':>9} {'peak MB':>8}")
+    for record in records:
+        name = ' '.join([record['stage'], *map(str, record['labels'].values())])
+        print(f"{name:32} {record['calls']:5} "
+              f"{record['duration_seconds']:9.3f} "
+              f"{record['rows'] if record['rows'] is not None else '-':>9} "
+              f"{record['rows_per_second'] or '-':>9} "
+              f"{record['peak_rss_mb']:8.1f}")
+
+    path = None
+    directory = os.environ.get(METRICS_DIR_VARIABLE)
+    if directory:
+        os.makedirs(directory, exist_ok=True)
+        file_name = '_'.join([run, *map(str, labels.values())])
+        if os.environ.get(METRICS_FORMAT_VARIABLE) == 'prometheus':
+            path = os.path.join(directory, f'{file_name}.prom')
+            text = prometheus_text(run, labels, records)
+        else:
+            path = os.path.join(directory, f'{file_name}.json')
+            text = json.dumps({
+                'run': run,
+                'labels': labels,
+                'pid': os.getpid(),
+                'started_at': started_at.isoformat(),
+                'finished_at': finished_at.isoformat(),
+                'duration_seconds': round(
+                    (finished_at - started_at).total_seconds(), 4),
+                'stages': records,
+            }, indent=2)
+        # write to a temporary file first, so a collector never reads a
+        # half written file.
+        tmp_path = f'{path}.{os.getpid()}.tmp'
+        with open(tmp_path, 'w') as f:
+            f.write(text)
+        os.replace(tmp_path, path)
+
+    with _lock:
+        _records.clear()
+    _run_started_at = None
+    return path
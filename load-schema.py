@@ -1,33 +1,54 @@
 import pandas as pd
-import psycopg
-import credentials
 import csv
-import sys
+import io
+import argparse
+import bulk_load
+from concurrent.futures import ThreadPoolExecutor
+from schema_tables import (TABLE_COLUMNS, PRIMARY_KEY, ROLLUP_TABLE,
+                           create_indexes, create_rollup_table,
+                           create_year_table, ensure_year_partition,
+                           get_table_column_types, is_partitioned,
+                           migrate_fraction_columns, partition_name,
+                           refresh_rollup, swap_year_partition, upsert_sql)
+from db import (connect_to_database, release, bump_table_versions,
+                create_table_versions)
+from instrumentation import stage, write_run_record
+from validation import validate, reject_records, rules_for_sql_types
+import row_hashes
 
 
-def connect_to_database():
+def create_tables_schema():
     """
-    Connect to the PostgreSQL database.
+    Create the six schema tables and their indexes if they do not exist yet,
+    together with the reporting rollup and table_versions tables.
 
-    Returns:
-        A tuple containing the connection and cursor objects.
+    The tables are partitioned by year, with one partition per loaded year.
+    Plain tables from before the tables were partitioned are converted:
+    they are renamed, their rows are moved into the partitioned tables and
+    they are dropped. Older INTEGER columns that hold fractions are changed
+    to FLOAT, see migrate_fraction_columns().
     """
-    conn = psycopg.connect(
-        host="pinniped.postgres.database.azure.com",
-        dbname=credentials.DB_NAME,
-        user=credentials.DB_USER,
-        password=credentials.DB_PASSWORD
-    )
-    cur = conn.cursor()
-    return conn, cur
-
-
-def create_tables_schema():
     # Connect to the database
     conn, cur = connect_to_database()
+    unpartitioned = []
+    for table_name in TABLE_COLUMNS:
+        cur.execute("SELECT to_regclass(%s) IS NOT NULL;",
+                    (table_name.lower(),))
+        if cur.fetchone()[0] and not is_partitioned(cur, table_name):
+            cur.execute(f"ALTER TABLE {table_name} "
+                        f"RENAME TO {table_name}_unpartitioned;")
+            # free the name of the primary key for the new table.
+            cur.execute("SELECT conname FROM pg_constraint "
+                        "WHERE conrelid = to_regclass(%s) AND contype = 'p';",
+                        (f"{table_name}_unpartitioned".lower(),))
+            for (constraint,) in cur.fetchall():
+                cur.execute(f"ALTER TABLE {table_name}_unpartitioned "
+                            f"RENAME CONSTRAINT {constraint} "
+                            f"TO {table_name}_unpartitioned_pkey;")
+            unpartitioned.append(table_name)
     # Create the tables
     cur.execute("""
-        CREATE TABLE InstitutionInformation (
+        CREATE TABLE IF NOT EXISTS InstitutionInformation (
             UNITID INTEGER,
             YEAR INTEGER,
             INSTNM TEXT,
@@ -35,16 +56,16 @@ def create_tables_schema():
             REGION INTEGER,
             CONTROL INTEGER,
             CCBASIC INTEGER,
-            LATITUDE INTEGER,
-            LONGITUDE INTEGER,
+            LATITUDE FLOAT,
+            LONGITUDE FLOAT,
             ACCREDAGENCY TEXT,
             PREDDEG INTEGER,
             HIGHDEG INTEGER,
             AVGFACSAL INTEGER,
             PRIMARY KEY (UNITID, YEAR)
-        );
+        ) PARTITION BY LIST (YEAR);
 
-        CREATE TABLE StudentBody (
+        CREATE TABLE IF NOT EXISTS StudentBody (
             UNITID INTEGER,
             YEAR INTEGER,
             PPTUG_EF FLOAT,
@@ -55,16 +76,16 @@ def create_tables_schema():
             UGDS_NRA FLOAT,
             UG INTEGER,
             INEXPFTE INTEGER,
-            C150_4 INTEGER,
-            C150_L4 INTEGER,
+            C150_4 FLOAT,
+            C150_L4 FLOAT,
             TUITFTE INTEGER,
             TUITIONFEE_IN INTEGER,
             TUITIONFEE_OUT INTEGER,
             TUITIONFEE_PROG INTEGER,
             PRIMARY KEY (UNITID, YEAR)
-        );
+        ) PARTITION BY LIST (YEAR);
 
-        CREATE TABLE Debt (
+        CREATE TABLE IF NOT EXISTS Debt (
             UNITID INTEGER,
             YEAR INTEGER,
             GRAD_DEBT_MDN INTEGER,
@@ -80,12 +101,12 @@ def create_tables_schema():
             MALE_DEBT_MDN INTEGER,
             FIRSTGEN_DEBT_MDN INTEGER,
             NOTFIRSTGEN_DEBT_MDN INTEGER,
-            CDR2 INTEGER,
-            CDR3 INTEGER,
+            CDR2 FLOAT,
+            CDR3 FLOAT,
             PRIMARY KEY (UNITID, YEAR)
-        );
+        ) PARTITION BY LIST (YEAR);
 
-        CREATE TABLE StudentOutcomes (
+        CREATE TABLE IF NOT EXISTS StudentOutcomes (
             UNITID INTEGER,
             YEAR INTEGER,
             PCT25_EARN_WNE_P6 INTEGER,
@@ -94,8 +115,8 @@ def create_tables_schema():
             COUNT_WNE_INC2_P6 INTEGER,
             COUNT_WNE_INC3_P6 INTEGER,
             PRIMARY KEY (UNITID, YEAR)
-        );
-        CREATE TABLE LoanRepayments(
+        ) PARTITION BY LIST (YEAR);
+        CREATE TABLE IF NOT EXISTS LoanRepayments(
             UNITID INTEGER,
             YEAR INTEGER,
             DBRR1_FED_UG_N INTEGER,
@@ -109,8 +130,8 @@ def create_tables_schema():
             DBRR20_FED_UG_N INTEGER,
             DBRR20_FED_UG_RT FLOAT,
             PRIMARY KEY (UNITID, YEAR)
-        );
-        CREATE TABLE Admissions(
+        ) PARTITION BY LIST (YEAR);
+        CREATE TABLE IF NOT EXISTS Admissions(
             UNITID INTEGER,
             YEAR INTEGER,
             SAT_AVG INTEGER,
@@ -118,173 +139,643 @@ def create_tables_schema():
             OPENADMP INTEGER,
             ADMCON7 INTEGER,
             PRIMARY KEY (UNITID, YEAR)
-        );
+        ) PARTITION BY LIST (YEAR);
         """)
+    migrate_fraction_columns(cur)
+    for table_name in unpartitioned:
+        cur.execute(f"SELECT DISTINCT year FROM {table_name}_unpartitioned;")
+        for (year,) in cur.fetchall():
+            ensure_year_partition(cur, table_name, year)
+        cur.execute(f"INSERT INTO {table_name} "
+                    f"SELECT * FROM {table_name}_unpartitioned;")
+        cur.execute(f"DROP TABLE {table_name}_unpartitioned;")
+    create_indexes(cur)
+    # the loads of several years may run at the same time, so the shared
+    # tables are created here, once.
+    create_rollup_table(cur)
+    create_table_versions(cur)
     # Commit the changes
     conn.commit()
-    conn.close()
+    release(conn)
 
 
 def select_data(year):
     conn, cur = connect_to_database()
-    scorecard_df = pd.read_sql_query(
-        f'SELECT * from scorecard_{year - 1};', conn)
-    hd_df = pd.read_sql_query(f'SELECT * from ipeds_{year};', conn)
-    merged_df = pd.merge(
-        left=scorecard_df,
-        right=hd_df,
-        how='inner',
-        on='unitid')
+    with stage('read_table', table=f'scorecard_{year - 1}') as measurement:
+        scorecard_df = pd.read_sql_query(
+            f'SELECT * from scorecard_{year - 1};', conn)
+        measurement['rows'] = len(scorecard_df)
+    with stage('read_table', table=f'ipeds_{year}') as measurement:
+        hd_df = pd.read_sql_query(f'SELECT * from ipeds_{year};', conn)
+        measurement['rows'] = len(hd_df)
+    with stage('merge') as measurement:
+        merged_df = pd.merge(
+            left=scorecard_df,
+            right=hd_df,
+            how='inner',
+            on='unitid')
+        measurement['rows'] = len(merged_df)
     merged_df.rename(columns={"instnm_x": "instnm", "latitude_y": "latitude",
                               "control_x": "control", "ccbasic_y": "ccbasic",
                               "addr_y": "addr"}, inplace=True)
     merged_df['year'] = merged_df['year2']
+    release(conn)
     return merged_df
 
 
+def schema_rules(cur):
+    """
+    Build the validation rules of every schema table.
+
+    The rules follow the column types of the tables in the database, and
+    no two rows may share a primary key.
+
+    Args:
+        cur: The database cursor.
+
+    Returns:
+        A dict of table name to rules, see validation.py.
+    """
+    rules = {}
+    for table_name, columns in TABLE_COLUMNS.items():
+        column_types = get_table_column_types(cur, table_name)
+        rules[table_name] = rules_for_sql_types(
+            {col: column_types[col] for col in columns}, PRIMARY_KEY)
+    return rules
+
+
+def validate_table(df, table_name, rules, rejected_csv):
+    """
+    Check the rows of one schema table before they are sent.
+
+    The rows that fail the rules are written to rejected_csv with their
+    reasons.
+
+    Args:
+        df: The merged dataframe returned by select_data().
+        table_name: The schema table to write.
+        rules: The rules returned by schema_rules().
+        rejected_csv: A csv writer for the rejected rows.
+
+    Returns:
+        A tuple of (valid rows of the table's columns, number of rows
+        rejected).
+    """
+    with stage('validate', rows=len(df), table=table_name):
+        valid, rejected = validate(
+            df.loc[:, TABLE_COLUMNS[table_name]], rules[table_name])
+        rejected_csv.writerows(reject_records(rejected))
+    return valid, len(rejected)
+
+
+def frame_rows(df):
+    """Convert a frame into row tuples, with missing values as None."""
+    # NULL numbers come back from the database as NaN, which
+    # postgres would store as NaN or reject, so send them as NULL.
+    df = df.astype(object).where(df.notna(), None)
+    return bulk_load.frame_to_rows(df)
+
+
+def valid_rows(df, table_name, rules, rejected_csv):
+    """
+    Check the rows of one schema table and convert the valid ones.
+
+    Args:
+        df: The merged dataframe returned by select_data().
+        table_name: The schema table to write.
+        rules: The rules returned by schema_rules().
+        rejected_csv: A csv writer for the rejected rows.
+
+    Returns:
+        A tuple of (valid row tuples, number of rows rejected).
+    """
+    valid, rejected = validate_table(df, table_name, rules, rejected_csv)
+    return frame_rows(valid), rejected
+
+
 def insert_data(df, year):
-    """Insert data into the table and handle invalid rows."""
+    """
+    Insert data into the tables and handle invalid rows.
+
+    The rows of each table are checked with valid_rows() first, and only
+    the valid ones are sent, in batches. A batch that still fails is split
+    until the rows that fail are found, so only those rows are rejected.
+    All rejected rows are written to rejected_rows_{year}.csv.
+
+    Each table's rows are loaded into a standalone table, which then
+    replaces the partition of the year, so loading a year again replaces
+    its rows. The version of the table is bumped in the transaction that
+    commits it, so cached reports never outlive the rows they were made
+    from; the other loaders do the same. The row hashes of the table and
+    year are dropped in that transaction too, because only delta_data()
+    keeps them up to date.
+    """
     conn, cur = connect_to_database()
     inserted_rows = 0
     rejected_rows = 0
     rejected_csv = csv.writer(open(f'rejected_rows_{year}.csv', 'w'))
-    tables = [
-        "InstitutionInformation",
-        "StudentBody",
-        "Debt",
-        "LoanRepayments",
-        "Admissions",
-        "StudentOutcomes"]
-    for table_name in tables:
+    rules = schema_rules(cur)
+    for table_name, columns in TABLE_COLUMNS.items():
         print(table_name)
-        if table_name == "InstitutionInformation":
-            tmp_df = df.loc[:,
-                            ['unitid',
-                             'year',
-                             'instnm',
-                             'addr',
-                             'region',
-                             'control',
-                             'ccbasic',
-                             'latitude',
-                             'longitude',
-                             'accredagency',
-                             'preddeg',
-                             'highdeg',
-                             'avgfacsal']]
-        elif table_name == "StudentBody":
-            tmp_df = df.loc[:,
-                            ['unitid',
-                             'year',
-                             'pptug_ef',
-                             'ugds_white',
-                             'ugds_black',
-                             'ugds_hisp',
-                             'ugds_asian',
-                             'ugds_nra',
-                             'ug',
-                             'inexpfte',
-                             'c150_4',
-                             'c150_l4',
-                             'tuitfte',
-                             'tuitionfee_in',
-                             'tuitionfee_out',
-                             'tuitionfee_prog']]
-        elif table_name == "Debt":
-            tmp_df = df.loc[:,
-                            ['unitid',
-                             'year',
-                             'grad_debt_mdn',
-                             'wdraw_debt_mdn',
-                             'lo_inc_debt_mdn',
-                             'md_inc_debt_mdn',
-                             'hi_inc_debt_mdn',
-                             'dep_debt_mdn',
-                             'ind_debt_mdn',
-                             'pell_debt_mdn',
-                             'nopell_debt_mdn',
-                             'female_debt_mdn',
-                             'male_debt_mdn',
-                             'firstgen_debt_mdn',
-                             'notfirstgen_debt_mdn',
-                             'cdr2',
-                             'cdr3']]
-        elif table_name == "LoanRepayments":
-            tmp_df = df.loc[:,
-                            ['unitid',
-                             'year',
-                             'dbrr1_fed_ug_n',
-                             'dbrr1_fed_ug_rt',
-                             'dbrr4_fed_ug_n',
-                             'dbrr4_fed_ug_rt',
-                             'dbrr5_fed_ug_n',
-                             'dbrr5_fed_ug_rt',
-                             'dbrr10_fed_ug_n',
-                             'dbrr10_fed_ug_rt',
-                             'dbrr20_fed_ug_n',
-                             'dbrr20_fed_ug_rt']]
-        elif table_name == "Admissions":
-            tmp_df = df.loc[:,
-                            ['unitid',
-                             'year',
-                             'sat_avg',
-                             'adm_rate',
-                             'openadmp',
-                             'admcon7']]
-        else:
-            tmp_df = df.loc[:,
-                            ['unitid',
-                             'year',
-                             'pct25_earn_wne_p6',
-                             'pct75_earn_wne_p6',
-                             'count_wne_inc1_p6',
-                             'count_wne_inc2_p6',
-                             'count_wne_inc3_p6']]
-        with conn.transaction():
-            rowbank = []
-            for _, row in tmp_df.iterrows():
-                rowbank.append(tuple(row.values))
+        rows, invalid = valid_rows(df, table_name, rules, rejected_csv)
+        with stage('insert', rows=len(rows), table=table_name):
+            load_table = create_year_table(cur, table_name, year)
+            inserted, rejected = bulk_load.insert_batches(
+                conn, cur, load_table, columns, rows, rejected_csv)
+            rejected += invalid
+        with stage('swap_partition', table=table_name):
+            swap_year_partition(cur, table_name, year, load_table)
+        if rejected:
+            print(f"Rejected {rejected} rows")
+        inserted_rows += inserted
+        rejected_rows += rejected
+        row_hashes.forget_hashes(cur, [table_name], year)
+        bump_table_versions(cur, [table_name])
+        with stage('commit', table=table_name):
+            conn.commit()
+        print("transaction committed")
+    print("transaction closing")
+    release(conn)
+    return inserted_rows, rejected_rows
+
+
+def table_payloads(df, rules, rejected_csv):
+    """
+    Project the merged frame into the rows of every schema table at once.
+
+    The columns that any table needs are converted to plain Python values
+    (missing values as None) in one pass. Each table is checked against
+    its rules on the original frame, and then takes the columns of its
+    valid rows from the converted frame.
+
+    Args:
+        df: The merged dataframe returned by select_data().
+        rules: The rules returned by schema_rules().
+        rejected_csv: A csv writer for the rows that fail the rules.
+
+    Returns:
+        A dict of table name to a tuple of (list of row tuples, number of
+        rows rejected).
+    """
+    needed = list(dict.fromkeys(
+        col for columns in TABLE_COLUMNS.values() for col in columns))
+    values = df.loc[:, needed]
+    values = values.astype(object).where(values.notna(), None)
+    payloads = {}
+    for table_name, columns in TABLE_COLUMNS.items():
+        with stage('validate', rows=len(df), table=table_name):
+            valid, rejected = validate(df.loc[:, columns], rules[table_name])
+            rejected_csv.writerows(reject_records(rejected))
+        payloads[table_name] = (
+            bulk_load.frame_to_rows(values.loc[valid.index, columns]),
+            len(rejected))
+    return payloads
+
+
+def write_table(table_name, rows, year):
+    """
+    Insert the rows of one schema table on a connection of its own.
+
+    The table is written and committed in its own transaction, and its
+    partition of the year is replaced the same way as in insert_data().
+    Rejected rows are collected in memory, so that tables written at the
+    same time do not interleave their lines in the reject file.
+
+    Args:
+        table_name: The schema table to write.
+        rows: The row tuples returned by table_payloads().
+        year: The year to load.
+
+    Returns:
+        A tuple of (rows inserted, rows rejected, reject file text).
+    """
+    columns = TABLE_COLUMNS[table_name]
+    rejected_text = io.StringIO()
+    conn, cur = connect_to_database()
+    try:
+        with stage('insert', rows=len(rows), table=table_name):
+            load_table = create_year_table(cur, table_name, year)
+            inserted, rejected = bulk_load.insert_batches(
+                conn, cur, load_table, columns, rows,
+                csv.writer(rejected_text))
+        with stage('swap_partition', table=table_name):
+            swap_year_partition(cur, table_name, year, load_table)
+        row_hashes.forget_hashes(cur, [table_name], year)
+        bump_table_versions(cur, [table_name])
+        with stage('commit', table=table_name):
+            conn.commit()
+    finally:
+        release(conn)
+    return inserted, rejected, rejected_text.getvalue()
+
+
+def insert_data_parallel(df, year):
+    """
+    Insert data into the tables, writing all of them at the same time.
+
+    The schema tables share no constraints, so each one is written by its
+    own thread over its own pooled connection, with the same batching and
+    row-level rejects as insert_data(). Every table is committed on its
+    own, so a failing table does not hold back the others.
+
+    Args:
+        df: The merged dataframe returned by select_data().
+        year: The year to load.
+
+    Returns:
+        A tuple of (rows inserted, rows rejected).
+    """
+    conn, cur = connect_to_database()
+    rules = schema_rules(cur)
+    release(conn)
+    inserted_rows = 0
+    rejected_rows = 0
+    with open(f'rejected_rows_{year}.csv', 'w', newline='') as f:
+        # the rows that fail the rules are written before the writers start.
+        payloads = table_payloads(df, rules, csv.writer(f))
+        with ThreadPoolExecutor(max_workers=len(payloads)) as writers:
+            futures = {
+                table_name: writers.submit(write_table, table_name, rows, year)
+                for table_name, (rows, _) in payloads.items()}
+            # tables are reported in their usual order as they finish.
+            for table_name, future in futures.items():
+                inserted, rejected, rejected_text = future.result()
+                f.write(rejected_text)
+                rejected += payloads[table_name][1]
+                print(f"{table_name}: inserted {inserted}, "
+                      f"rejected {rejected}")
+                inserted_rows += inserted
+                rejected_rows += rejected
+    return inserted_rows, rejected_rows
+
+
+# where each merged column comes from when the merge is done in the
+# database. The same choices are made by the renames in select_data();
+# every other column comes from the scorecard table.
+SOURCE_COLUMNS = {
+    'addr': 'h.addr',
+    'latitude': 'h.latitude',
+    'ccbasic': 'h.ccbasic',
+    'year': 's.year2',
+}
+
+
+def merged_source(year):
+    """Get the FROM clause that joins scorecard_{year - 1} with ipeds_{year}."""
+    return (f'scorecard_{year - 1} s '
+            f'JOIN ipeds_{year} h ON s.unitid = h.unitid')
+
+
+def merged_select(cur, table_name, columns, year):
+    """
+    Build the SELECT over the merged source tables for one schema table.
+
+    Every value is cast to the type of its target column, so that values
+    which insert_data() would reject are rejected here too.
+
+    Args:
+        cur: The database cursor.
+        table_name: The schema table that will be filled.
+        columns: The columns of the schema table to fill.
+        year: The year to load.
+
+    Returns:
+        The SELECT statement.
+    """
+    column_types = get_table_column_types(cur, table_name)
+    selects = ', '.join(
+        f"CAST({SOURCE_COLUMNS.get(col, f's.{col}')} "
+        f"AS {column_types[col]})"
+        for col in columns)
+    return f"SELECT {selects} FROM {merged_source(year)}"
+
+
+def insert_data_server_side(year):
+    """
+    Merge scorecard_{year - 1} with ipeds_{year} and fill the schema tables
+    without moving any rows out of the database.
+
+    Each table is filled with one INSERT ... SELECT over the join into a
+    standalone table, which then replaces the partition of the year, in
+    its own savepoint. If a table fails, all of its rows count as rejected
+    and the year keeps its old rows.
+
+    Args:
+        year: The year to load.
+
+    Returns:
+        A tuple of (rows inserted, rows rejected).
+    """
+    conn, cur = connect_to_database()
+    inserted_rows = 0
+    rejected_rows = 0
+    rejected_csv = csv.writer(open(f'rejected_rows_{year}.csv', 'w'))
+    cur.execute(f'SELECT COUNT(*) FROM {merged_source(year)};')
+    num_rows = cur.fetchone()[0]
+    print(f"Total rows in merge: {num_rows}")
+    for table_name, columns in TABLE_COLUMNS.items():
+        print(table_name)
+        with stage('insert', rows=num_rows, table=table_name):
+            select = merged_select(cur, table_name, columns, year)
             try:
-                placeholders = ', '.join(['%s'] * len(row))
-                columns = ', '.join(row.index)
-                sql = (
-                    f"INSERT INTO {table_name} "
-                    f"({columns}) "
-                    f"VALUES ({placeholders})"
-                )
-                cur.executemany(sql, rowbank)
+                with conn.transaction():
+                    load_table = create_year_table(cur, table_name, year)
+                    cur.execute(
+                        f"INSERT INTO {load_table} ({', '.join(columns)}) "
+                        f"{select};")
+                    inserted = cur.rowcount
+                    swap_year_partition(cur, table_name, year, load_table)
             except Exception as e:
-                rejected_csv.writerow([str(e), row])
+                rejected_csv.writerow([str(e), table_name])
                 print(f"Error: {e}")
-                rejected_rows += len(rowbank)
+                rejected_rows += num_rows
             else:
-                inserted_rows += len(rowbank)
-        conn.commit()
+                inserted_rows += inserted
+        row_hashes.forget_hashes(cur, [table_name], year)
+        bump_table_versions(cur, [table_name])
+        with stage('commit', table=table_name):
+            conn.commit()
         print("transaction committed")
     print("transaction closing")
-    conn.close()
+    release(conn)
     return inserted_rows, rejected_rows
 
 
-def main(years, user_flag):
+def run_upsert(conn, cur, table_name, columns, select, num_rows, counts,
+               rejected_csv):
+    """
+    Upsert the rows of a SELECT into a schema table and count the outcome.
+
+    Args:
+        conn: The database connection.
+        cur: The database cursor.
+        table_name: The schema table to write.
+        columns: The columns returned by the SELECT.
+        select: The SELECT statement that produces the rows.
+        num_rows: The number of rows the SELECT returns.
+        counts: A dict of running totals, updated in place.
+        rejected_csv: A csv writer for the rejected rows.
+    """
+    try:
+        with conn.transaction():
+            cur.execute(
+                f"INSERT INTO {table_name} AS t ({', '.join(columns)}) "
+                f"{select} {upsert_sql(columns)};")
+            written = [row[0] for row in cur.fetchall()]
+    except Exception as e:
+        rejected_csv.writerow([str(e), table_name])
+        print(f"Error: {e}")
+        counts['rejected'] += num_rows
+        return
+    inserted = sum(written)
+    updated = len(written) - inserted
+    unchanged = num_rows - len(written)
+    print(f"Inserted: {inserted}, Updated: {updated}, "
+          f"Unchanged: {unchanged}")
+    counts['inserted'] += inserted
+    counts['updated'] += updated
+    counts['unchanged'] += unchanged
+
+
+def upsert_data(df, year):
+    """
+    Write the merged data into the tables, updating rows that already exist.
+
+    Each table's rows are checked and inserted into a temporary copy of
+    the table, with the same rejects as insert_data(), and then
+    upserted on (unitid, year) in one statement. Rows whose values did not
+    change are left alone, so a year can be loaded again safely.
+
+    Args:
+        df: The merged dataframe returned by select_data().
+        year: The year to load.
+
+    Returns:
+        A dict with the number of rows inserted, updated, unchanged and
+        rejected.
+    """
+    conn, cur = connect_to_database()
+    counts = {'inserted': 0, 'updated': 0, 'unchanged': 0, 'rejected': 0}
+    rejected_csv = csv.writer(open(f'rejected_rows_{year}.csv', 'w'))
+    rules = schema_rules(cur)
+    for table_name, columns in TABLE_COLUMNS.items():
+        print(table_name)
+        # rows of a year that was never loaded need its partition.
+        ensure_year_partition(cur, table_name, year)
+        rows, invalid = valid_rows(df, table_name, rules, rejected_csv)
+        counts['rejected'] += invalid
+        with stage('upsert', rows=len(rows), table=table_name):
+            staging_table = f'{table_name}_upsert'
+            cur.execute(
+                f'CREATE TEMP TABLE {staging_table} (LIKE {table_name}) '
+                f'ON COMMIT DROP;')
+            staged, rejected = bulk_load.insert_batches(
+                conn, cur, staging_table, columns, rows, rejected_csv)
+            counts['rejected'] += rejected
+            select = f"SELECT {', '.join(columns)} FROM {staging_table}"
+            run_upsert(conn, cur, table_name, columns, select, staged,
+                       counts, rejected_csv)
+        row_hashes.forget_hashes(cur, [table_name], year)
+        bump_table_versions(cur, [table_name])
+        with stage('commit', table=table_name):
+            conn.commit()
+        print("transaction committed")
+    print("transaction closing")
+    release(conn)
+    return counts
+
+
+def upsert_data_server_side(year):
+    """
+    Merge the source tables in the database and upsert the schema tables.
+
+    This is insert_data_server_side() with the conflict handling of
+    upsert_data().
+
+    Args:
+        year: The year to load.
+
+    Returns:
+        A dict with the number of rows inserted, updated, unchanged and
+        rejected.
+    """
+    conn, cur = connect_to_database()
+    counts = {'inserted': 0, 'updated': 0, 'unchanged': 0, 'rejected': 0}
+    rejected_csv = csv.writer(open(f'rejected_rows_{year}.csv', 'w'))
+    cur.execute(f'SELECT COUNT(*) FROM {merged_source(year)};')
+    num_rows = cur.fetchone()[0]
+    print(f"Total rows in merge: {num_rows}")
+    for table_name, columns in TABLE_COLUMNS.items():
+        print(table_name)
+        # rows of a year that was never loaded need its partition.
+        ensure_year_partition(cur, table_name, year)
+        with stage('upsert', rows=num_rows, table=table_name):
+            select = merged_select(cur, table_name, columns, year)
+            run_upsert(conn, cur, table_name, columns, select, num_rows,
+                       counts, rejected_csv)
+        row_hashes.forget_hashes(cur, [table_name], year)
+        bump_table_versions(cur, [table_name])
+        with stage('commit', table=table_name):
+            conn.commit()
+        print("transaction committed")
+    print("transaction closing")
+    release(conn)
+    return counts
+
+
+def delta_data(df, year):
+    """
+    Write only the rows of the tables that changed since the last delta load.
+
+    The valid rows of each table are hashed and compared with the hashes
+    stored in row_hashes for the table and year. The old versions of the
+    changed rows and the rows of institutions that are no longer in the
+    merge are deleted, the new and changed rows are inserted with the
+    same row-level rejects as insert_data(), and the hashes are updated.
+    Each table is committed on its own. A table and year that have no
+    hashes yet are written in full once.
+
+    Args:
+        df: The merged dataframe returned by select_data().
+        year: The year to load.
+
+    Returns:
+        A dict with the number of rows inserted, changed, removed,
+        unchanged and rejected.
+    """
+    conn, cur = connect_to_database()
+    counts = {'inserted': 0, 'changed': 0, 'removed': 0, 'unchanged': 0,
+              'rejected': 0}
+    rejected_csv = csv.writer(open(f'rejected_rows_{year}.csv', 'w'))
+    rules = schema_rules(cur)
+    for table_name, columns in TABLE_COLUMNS.items():
+        ensure_year_partition(cur, table_name, year)
+        valid, invalid = validate_table(df, table_name, rules, rejected_csv)
+        with stage('hash', rows=len(valid), table=table_name):
+            hashes = row_hashes.frame_hashes(
+                valid, get_table_column_types(cur, table_name))
+            changes = row_hashes.compare_hashes(
+                valid['unitid'], hashes,
+                row_hashes.stored_hashes(cur, table_name, year))
+        written = changes['inserted'] | changes['changed']
+        changed = valid[written]
+        with stage('insert', rows=len(changed), table=table_name):
+            removed = row_hashes.delete_stale_rows(
+                cur, table_name, year, changed['unitid'], valid['unitid'],
+                year_column='year')
+            changes['removed'] = sorted({*changes['removed'], *removed})
+            inserted, rejected = bulk_load.insert_batches(
+                conn, cur, table_name, columns, frame_rows(changed),
+                rejected_csv)
+            row_hashes.save_hashes(
+                cur, table_name, year, changed['unitid'], hashes[written],
+                changes['removed'], year_column='year')
+        bump_table_versions(cur, [table_name])
+        with stage('commit', table=table_name):
+            conn.commit()
+        print(row_hashes.change_summary(table_name, changes))
+        counts['inserted'] += int(changes['inserted'].sum())
+        counts['changed'] += int(changes['changed'].sum())
+        counts['removed'] += len(changes['removed'])
+        counts['unchanged'] += int(changes['unchanged'].sum())
+        counts['rejected'] += invalid + rejected
+    release(conn)
+    return counts
+
+
+def record_table_changes(year):
+    """
+    Refresh the reporting rollup of a year, update the planner statistics
+    of the year's partitions and bump the version of the rollup so cached
+    reports refresh. The version of each schema table is bumped by the
+    loaders in the transaction that commits its rows.
+
+    Only the partitions of the year are analyzed, since the other years did
+    not change and analyzing a partitioned table samples all of them.
+    """
+    conn, cur = connect_to_database()
+    with stage('refresh_rollup'):
+        refresh_rollup(cur, year)
+    with stage('analyze'):
+        for table_name in TABLE_COLUMNS:
+            if is_partitioned(cur, table_name):
+                table_name = partition_name(table_name, year)
+            cur.execute(f'ANALYZE {table_name};')
+    bump_table_versions(cur, [ROLLUP_TABLE])
+    with stage('commit', table=ROLLUP_TABLE):
+        conn.commit()
+    release(conn)
+
+
+def main(years, user_flag, mode="client", upsert=False, parallel=False,
+         delta=False):
     """Main function to process the CSV file and update the database."""
     if user_flag == "True":
         print("entered this area")
         create_tables_schema()
-    df = select_data(years)
-    conn, cur = connect_to_database()
-    inserted_rows, rejected_rows = insert_data(df, years)
-    conn.close()
-    print(f"Total rows from CSV: {len(df)}")
-    print(f"Inserted: {inserted_rows}, Rejected: {rejected_rows}")
+    if delta:
+        counts = delta_data(select_data(years), years)
+        print(f"Inserted: {counts['inserted']}, "
+              f"Changed: {counts['changed']}, "
+              f"Removed: {counts['removed']}, "
+              f"Unchanged: {counts['unchanged']}, "
+              f"Rejected: {counts['rejected']}")
+    elif upsert:
+        if mode == "server":
+            counts = upsert_data_server_side(years)
+        else:
+            counts = upsert_data(select_data(years), years)
+        print(f"Inserted: {counts['inserted']}, "
+              f"Updated: {counts['updated']}, "
+              f"Unchanged: {counts['unchanged']}, "
+              f"Rejected: {counts['rejected']}")
+    elif mode == "server":
+        inserted_rows, rejected_rows = insert_data_server_side(years)
+        print(f"Inserted: {inserted_rows}, Rejected: {rejected_rows}")
+    else:
+        df = select_data(years)
+        if parallel:
+            inserted_rows, rejected_rows = insert_data_parallel(df, years)
+        else:
+            inserted_rows, rejected_rows = insert_data(df, years)
+        print(f"Total rows from CSV: {len(df)}")
+        print(f"Inserted: {inserted_rows}, Rejected: {rejected_rows}")
+    record_table_changes(years)
+    write_run_record('load-schema', year=years)
 
 
 if __name__ == '__main__':
-    if len(sys.argv) < 0:
-        print("Usage: python load-schema.py [<years>] <user_flag>")
-        sys.exit(1)
-    years = int(sys.argv[1])
-    print(years)
-    user_flag = sys.argv[2]
-    print(user_flag)
-    main(years, user_flag)
+    parser = argparse.ArgumentParser(
+        description="Build the schema tables for one year from the loaded "
+                    "scorecard and IPEDS tables.")
+    parser.add_argument("years", type=int, help="the year to load")
+    parser.add_argument(
+        "user_flag", nargs="?", default="False",
+        help="True to create the schema tables first (default: False)")
+    parser.add_argument(
+        "--mode", choices=["client", "server"], default="client",
+        help="client: merge the tables in pandas (default); "
+             "server: merge and insert inside the database")
+    parser.add_argument(
+        "--upsert", action="store_true",
+        help="update rows that already exist instead of rejecting them, "
+             "so a year can be loaded again")
+    parser.add_argument(
+        "--parallel", action="store_true",
+        help="write the six tables at the same time over separate "
+             "connections (client mode without --upsert only)")
+    parser.add_argument(
+        "--delta", action="store_true",
+        help="only write the rows that are new, changed or gone since the "
+             "last delta load (client mode only)")
+    args = parser.parse_args()
+    if args.parallel and (args.mode != "client" or args.upsert):
+        parser.error("--parallel can only be used in client mode "
+                     "without --upsert")
+    if args.delta and (args.mode != "client" or args.upsert or args.parallel):
+        parser.error("--delta can only be used in client mode without "
+                     "--upsert or --parallel")
+    print(args.years)
+    print(args.user_flag)
+    main(args.years, args.user_flag, args.mode, args.upsert, args.parallel,
+         args.delta)
@@ -1,104 +1,242 @@
 import pandas as pd
-import psycopg
-import sys
-import credentials
+import argparse
+import os
 import csv
 import numpy as np
+import bulk_load
+import parquet_cache
+from concurrent.futures import ThreadPoolExecutor
+from db import connect_to_database, release
+from instrumentation import stage, write_run_record
+from raw_files import open_raw_file
+from schema_tables import get_table_column_types
+from validation import validate, reject_records, rules_for_sql_types
+import row_hashes
+from shadow_tables import create_shadow_table, swap_shadow_table
 
 
-def connect_to_database():
-    """
-    Connect to the PostgreSQL database.
-
-    Returns:
-        A tuple containing the connection and cursor objects.
-    """
-    conn = psycopg.connect(
-        host="pinniped.postgres.database.azure.com",
-        dbname=credentials.DB_USER,
-        user=credentials.DB_USER,
-        password=credentials.DB_PASSWORD
-    )
-
-    cur = conn.cursor()
-
-    return conn, cur
-
-
-def clean_csv(csv_file_path):
-    columns_to_select = [
-        "UNITID",
-        "INSTNM",
-        "CONTROL",
-        "ACCREDAGENCY",
-        "ADDR",
-        "REGION",
-        "CCBASIC",
-        "LATITUDE",
-        "LONGITUDE",
-        "PREDDEG",
-        "HIGHDEG",
-        "AVGFACSAL",
-        "SAT_AVG",
-        "ADM_RATE",
-        "PPTUG_EF",
-        "UGDS_WHITE",
-        "UGDS_BLACK",
-        "UGDS_HISP",
-        "UGDS_ASIAN",
-        "UGDS_NRA",
-        "UG",
-        "INEXPFTE",
-        "C150_4",
-        "C150_L4",
-        "TUITFTE",
-        "TUITIONFEE_IN",
-        "TUITIONFEE_OUT",
-        "TUITIONFEE_PROG",
-        "GRAD_DEBT_MDN",
-        "WDRAW_DEBT_MDN",
-        "LO_INC_DEBT_MDN",
-        "MD_INC_DEBT_MDN",
-        "HI_INC_DEBT_MDN",
-        "DEP_DEBT_MDN",
-        "IND_DEBT_MDN",
-        "PELL_DEBT_MDN",
-        "NOPELL_DEBT_MDN",
-        "FEMALE_DEBT_MDN",
-        "MALE_DEBT_MDN",
-        "FIRSTGEN_DEBT_MDN",
-        "NOTFIRSTGEN_DEBT_MDN",
-        "CDR2",
-        "CDR3",
-        "MD_EARN_WNE_P6",
-        "PCT25_EARN_WNE_P6",
-        "PCT75_EARN_WNE_P6",
-        "COUNT_WNE_INC1_P6",
-        "COUNT_WNE_INC2_P6",
-        "COUNT_WNE_INC3_P6",
-        'DBRR1_FED_UG_N', 
-        'DBRR1_FED_UG_RT', 
-        'DBRR4_FED_UG_N', 
-        'DBRR4_FED_UG_RT', 
-        'DBRR5_FED_UG_N', 
-        'DBRR5_FED_UG_RT',               
-        'DBRR10_FED_UG_N', 
-        'DBRR10_FED_UG_RT', 
-        'DBRR20_FED_UG_N', 
-        'DBRR20_FED_UG_RT', 
-        'OPENADMP', 
-        'ADMCON7']
-    file = pd.read_csv(
-        filepath_or_buffer=csv_file_path,
-        usecols=columns_to_select,
-        dtype={'DBRR1_FED_UG_N': object, 
-        'DBRR1_FED_UG_RT': object, 
-        'DBRR5_FED_UG_N': object, 
-        'DBRR5_FED_UG_RT': object,               
-        'DBRR10_FED_UG_N': object, 
-        'DBRR10_FED_UG_RT': object, 
-        'DBRR20_FED_UG_N': object, 
-        'DBRR20_FED_UG_RT': object})
+def scorecard_year(csv_file_path):
+    """
+    Get the first year of the academic year from a raw MERGED file name.
+
+    Args:
+        csv_file_path: The path to the raw scorecard CSV file.
+
+    Returns:
+        The year as a string, e.g. '2018' for MERGED2018_19_PP.csv.
+    """
+    return os.path.basename(csv_file_path).split('_')[0].replace('MERGED', '')
+
+
+# the columns of a raw MERGED file that we load.
+SCORECARD_COLUMNS = [
+    "UNITID",
+    "INSTNM",
+    "CONTROL",
+    "ACCREDAGENCY",
+    "ADDR",
+    "REGION",
+    "CCBASIC",
+    "LATITUDE",
+    "LONGITUDE",
+    "PREDDEG",
+    "HIGHDEG",
+    "AVGFACSAL",
+    "SAT_AVG",
+    "ADM_RATE",
+    "PPTUG_EF",
+    "UGDS_WHITE",
+    "UGDS_BLACK",
+    "UGDS_HISP",
+    "UGDS_ASIAN",
+    "UGDS_NRA",
+    "UG",
+    "INEXPFTE",
+    "C150_4",
+    "C150_L4",
+    "TUITFTE",
+    "TUITIONFEE_IN",
+    "TUITIONFEE_OUT",
+    "TUITIONFEE_PROG",
+    "GRAD_DEBT_MDN",
+    "WDRAW_DEBT_MDN",
+    "LO_INC_DEBT_MDN",
+    "MD_INC_DEBT_MDN",
+    "HI_INC_DEBT_MDN",
+    "DEP_DEBT_MDN",
+    "IND_DEBT_MDN",
+    "PELL_DEBT_MDN",
+    "NOPELL_DEBT_MDN",
+    "FEMALE_DEBT_MDN",
+    "MALE_DEBT_MDN",
+    "FIRSTGEN_DEBT_MDN",
+    "NOTFIRSTGEN_DEBT_MDN",
+    "CDR2",
+    "CDR3",
+    "MD_EARN_WNE_P6",
+    "PCT25_EARN_WNE_P6",
+    "PCT75_EARN_WNE_P6",
+    "COUNT_WNE_INC1_P6",
+    "COUNT_WNE_INC2_P6",
+    "COUNT_WNE_INC3_P6",
+    'DBRR1_FED_UG_N', 
+    'DBRR1_FED_UG_RT', 
+    'DBRR4_FED_UG_N', 
+    'DBRR4_FED_UG_RT', 
+    'DBRR5_FED_UG_N', 
+    'DBRR5_FED_UG_RT',               
+    'DBRR10_FED_UG_N', 
+    'DBRR10_FED_UG_RT', 
+    'DBRR20_FED_UG_N', 
+    'DBRR20_FED_UG_RT', 
+    'OPENADMP', 
+    'ADMCON7']
+
+
+# the repayment columns mix numbers and PrivacySuppressed, so they are read
+# as text and cleaned later.
+SCORECARD_TEXT_COLUMNS = [
+    'DBRR1_FED_UG_N',
+    'DBRR1_FED_UG_RT',
+    'DBRR5_FED_UG_N',
+    'DBRR5_FED_UG_RT',
+    'DBRR10_FED_UG_N',
+    'DBRR10_FED_UG_RT',
+    'DBRR20_FED_UG_N',
+    'DBRR20_FED_UG_RT',
+]
+
+
+# no two rows of a scorecard table may share these columns.
+SCORECARD_KEY = ['UNITID', 'year1']
+
+
+# the marker that the scorecard puts in cells that are hidden for privacy.
+SUPPRESSED_VALUE = 'PrivacySuppressed'
+
+
+def read_scorecard_csv(csv_file_path, chunksize=None, typed=False):
+    """
+    Read the scorecard columns that we load from a raw MERGED file.
+
+    The file is read through its Parquet copy when parquet_cache is
+    enabled. A .gz or .zip file is decompressed as it is read.
+
+    Args:
+        csv_file_path: The path to the raw scorecard CSV file, or to a .gz
+            or .zip archive of it.
+        chunksize: If given, read the file this many rows at a time.
+        typed: Read PrivacySuppressed cells as missing, so that the
+            repayment columns are parsed as numbers, and the accrediting
+            agency as a categorical.
+
+    Returns:
+        A dataframe, or an iterator of dataframes if chunksize is given.
+    """
+    if typed:
+        null_values = [SUPPRESSED_VALUE]
+        string_columns = []
+        dtype = {'ACCREDAGENCY': 'category'}
+    else:
+        null_values = []
+        string_columns = SCORECARD_TEXT_COLUMNS
+        dtype = {column: object for column in SCORECARD_TEXT_COLUMNS}
+    if parquet_cache.cache_enabled():
+        if chunksize:
+            return parquet_cache.read_csv_chunks(
+                csv_file_path, chunksize, columns=SCORECARD_COLUMNS,
+                null_values=null_values, string_columns=string_columns)
+        return parquet_cache.read_csv(
+            csv_file_path, columns=SCORECARD_COLUMNS,
+            null_values=null_values, string_columns=string_columns)
+    if chunksize:
+        return read_scorecard_chunks(
+            csv_file_path, chunksize, na_values=null_values, dtype=dtype)
+    with open_raw_file(csv_file_path) as f:
+        return pd.read_csv(
+            filepath_or_buffer=f,
+            usecols=SCORECARD_COLUMNS,
+            na_values=null_values,
+            dtype=dtype)
+
+
+def read_scorecard_chunks(csv_file_path, chunksize, **kwargs):
+    """
+    Read a raw MERGED file chunksize rows at a time with pandas.
+
+    The file stays open until the last chunk has been read.
+
+    Args:
+        csv_file_path: The path to the raw scorecard file.
+        chunksize: The number of rows in each chunk.
+        **kwargs: More arguments for pandas.read_csv.
+
+    Yields:
+        Dataframes of at most chunksize rows.
+    """
+    with open_raw_file(csv_file_path) as f:
+        yield from pd.read_csv(
+            filepath_or_buffer=f,
+            usecols=SCORECARD_COLUMNS,
+            chunksize=chunksize,
+            **kwargs)
+
+
+def compact_column(series):
+    """
+    Store a column in the narrowest dtype that keeps every value.
+
+    Integers are downcast to the smallest integer dtype, and floats become
+    float32 if each value still prints the same. Float columns stay float
+    columns even if they only hold whole numbers, because with --chunksize
+    the column types of the table come from the first chunk, and a later
+    chunk may hold fractions. Text columns in which values repeat become
+    categoricals.
+
+    Args:
+        series: The column.
+
+    Returns:
+        The column, in its new dtype.
+    """
+    if pd.api.types.is_integer_dtype(series):
+        return pd.to_numeric(series, downcast='integer')
+    if pd.api.types.is_float_dtype(series):
+        values = series.dropna()
+        if values.empty:
+            return series.astype('float32')
+        narrow = values.astype('float32')
+        # COPY sends the shortest text of each float32, so the column is
+        # only narrowed if that text reads back as the same number.
+        if (narrow.astype(str).astype('float64') == values).all():
+            return series.astype('float32')
+        return series
+    if series.dtype == object and series.nunique() <= len(series) // 2:
+        return series.astype('category')
+    return series
+
+
+def compact_frame(df):
+    """Store every column of a dataframe in its narrowest dtype."""
+    return pd.DataFrame({col: compact_column(df[col]) for col in df.columns})
+
+
+def clean_frame(file, csv_file_path, typed=False):
+    """
+    Clean a dataframe (or one chunk) read from a raw MERGED file.
+
+    A typed frame already has PrivacySuppressed cells as missing values,
+    which stay missing (NULL) instead of becoming 999, and its columns are
+    only narrowed with compact_frame.
+
+    Args:
+        file: The dataframe returned by read_scorecard_csv.
+        csv_file_path: The path to the raw scorecard CSV file.
+        typed: Whether the frame was read with typed=True.
+
+    Returns:
+        The cleaned dataframe.
+    """
     if object_dtypes := {
         c: dtype for c in file.columns if (
             dtype := pd.api.types.infer_dtype(
@@ -106,13 +244,16 @@ def clean_csv(csv_file_path):
         raise TypeError(
             f"Dataframe has one more object dtypes: {object_dtypes}")
     # Extract year from csv_file_path
-    year1 = csv_file_path.split('_')[0].replace('MERGED', '')
+    year1 = scorecard_year(csv_file_path)
     year2 = str(int(year1) + 1)
 
     # Add year as a new column and convert to date data type
     file['year1'] = year1
     file['year2'] = year2
 
+    if typed:
+        return compact_frame(file)
+
     # replace privacy suppressed values with 999 in numeric columns
     numeric_cols = file.select_dtypes(include=['int64', 'float64']).columns
     file[numeric_cols] = file[numeric_cols].replace(
@@ -122,7 +263,6 @@ def clean_csv(csv_file_path):
     object_cols = file.select_dtypes(include=['object']).columns
     file[object_cols] = file[object_cols].replace(
         'PrivacySuppressed', "999", regex=True)
-    print(f"Number of rows read in: {len(file)}")
 
     # replace nan's with 999.
     numeric_cols = file.select_dtypes(include=['int64', 'float64']).columns
@@ -132,88 +272,613 @@ def clean_csv(csv_file_path):
     return file
 
 
+def clean_csv(csv_file_path, typed=False):
+    with stage('read_csv') as measurement:
+        file = read_scorecard_csv(csv_file_path, typed=typed)
+        measurement['rows'] = len(file)
+    with stage('clean', rows=len(file)):
+        file = clean_frame(file, csv_file_path, typed)
+    print(f"Number of rows read in: {len(file)}")
+    return file
+
+
+def clean_csv_chunks(csv_file_path, chunksize, typed=False):
+    """
+    Read and clean a raw MERGED file one chunk at a time.
+
+    Only one chunk is held in memory at a time, so peak memory depends on
+    the chunk size rather than on the size of the file.
+
+    Args:
+        csv_file_path: The path to the raw scorecard CSV file.
+        chunksize: The number of rows in each chunk.
+        typed: Whether to parse the chunks with typed dtypes.
+
+    Yields:
+        Cleaned dataframes of at most chunksize rows.
+    """
+    reader = iter(read_scorecard_csv(csv_file_path, chunksize, typed))
+    while True:
+        with stage('read_csv') as measurement:
+            chunk = next(reader, None)
+            measurement['rows'] = 0 if chunk is None else len(chunk)
+        if chunk is None:
+            return
+        with stage('clean', rows=len(chunk)):
+            chunk = clean_frame(chunk, csv_file_path, typed)
+        yield chunk
+
+
 def get_column_types(df):
     """
-    Get a list of all int64 columns, a list of all float64 columns, and a list of all object columns.
+    Get a list of all integer columns, a list of all float columns, and a list of all other (text) columns.
+
+    Integer and float columns of any width count, including nullable
+    integers, and categorical columns count as text.
 
     Args:
         df: The pandas dataframe.
 
     Returns:
-        A tuple containing three lists: a list of all int64 columns, a list of all float64 columns, and a list of all object columns.
+        A tuple containing three lists: a list of all integer columns, a list of all float columns, and a list of all other columns.
     """
-    # List of int64 columns
-    int_cols = df.select_dtypes(include='int64').columns.tolist()
+    with stage('get_column_types', rows=len(df)):
+        # List of integer columns
+        int_cols = [col for col in df.columns
+                    if pd.api.types.is_integer_dtype(df[col])]
 
-    # List of float64 columns
-    float_cols = df.select_dtypes(include='float64').columns.tolist()
+        # List of float columns
+        float_cols = [col for col in df.columns
+                      if pd.api.types.is_float_dtype(df[col])]
 
-    # List of object columns
-    object_cols = df.select_dtypes(include='object').columns.tolist()
+        # List of the other columns
+        object_cols = [col for col in df.columns
+                       if col not in int_cols and col not in float_cols]
 
     return int_cols, float_cols, object_cols
 
 
-def create_tables(df, year):
-    conn, cur = connect_to_database()
-    # Split the dataframe into three dataframes
-    yr = year
+def get_column_definitions(df):
+    """
+    Map every dataframe column to the SQL type used for scorecard_{year}.
+
+    Args:
+        df: The pandas dataframe.
+
+    Returns:
+        A list of (column name, SQL type) tuples, in dataframe column order.
+    """
     int_cols, float_cols, _ = get_column_types(df)
-    columns = []
+    definitions = []
     for col in df.columns:
         if str(col) in int_cols:
-            # print(f"this is an int col: {col}")
-            columns.append(f'{col} INTEGER')
+            definitions.append((col, 'INTEGER'))
         elif str(col) in float_cols:
-            # print(f"this is a float col: {col}")
-            columns.append(f'{col} FLOAT')
+            definitions.append((col, 'FLOAT'))
         else:
-            # print(f"this is a text col: {col}")
-            columns.append(f'{col} VARCHAR(255)')
+            definitions.append((col, 'VARCHAR(255)'))
+    return definitions
+
+
+# the definition type of each information_schema data_type that
+# get_column_definitions() creates.
+DEFINITION_TYPES = {
+    'integer': 'INTEGER',
+    'double precision': 'FLOAT',
+    'character varying': 'VARCHAR(255)',
+}
+
+
+def get_table_definitions(cur, df, table_name):
+    """
+    Map every dataframe column to its SQL type in an existing table.
+
+    Args:
+        cur: The database cursor.
+        df: The pandas dataframe.
+        table_name: The table that the rows are written to.
+
+    Returns:
+        A list of (column name, SQL type) tuples, in dataframe column order,
+        like get_column_definitions().
+
+    Raises:
+        ValueError: If the table does not have a column of the dataframe.
+    """
+    column_types = get_table_column_types(cur, table_name)
+    if missing := [col for col in df.columns
+                   if str(col).lower() not in column_types]:
+        raise ValueError(f"{table_name} has no columns {missing}")
+    return [(col, DEFINITION_TYPES.get(column_types[str(col).lower()],
+                                       'VARCHAR(255)'))
+            for col in df.columns]
+
+
+def create_tables(df, year, shadow=False):
+    """
+    Create scorecard_{year}, or the shadow table that a load of it fills.
+
+    Args:
+        df: The cleaned pandas dataframe, whose dtypes give the column types.
+        year: The year of the scorecard table.
+        shadow: Whether to create the shadow table, see shadow_tables.py.
+
+    Returns:
+        The name of the created table.
+    """
+    conn, cur = connect_to_database()
+    yr = year
+    columns = [f'{col} {sql_type}'
+               for col, sql_type in get_column_definitions(df)]
     print(len(columns))
     column_str_1 = ', '.join(columns)
     print(column_str_1)
-    cur.execute(f'CREATE TABLE scorecard_{yr} ({column_str_1});')
-    conn.commit()
-    conn.close()
+    with stage('create_table', table=f'scorecard_{yr}'):
+        if shadow:
+            table_name = create_shadow_table(
+                cur, f'scorecard_{yr}', column_str_1)
+        else:
+            table_name = f'scorecard_{yr}'
+            cur.execute(f'CREATE TABLE {table_name} ({column_str_1});')
+        conn.commit()
+    release(conn)
+    return table_name
+
+
+def swap_in_table(year, expected_rows):
+    """
+    Replace scorecard_{year} with its loaded shadow table.
 
+    The row hashes of the year are dropped in the same transaction, since
+    only delta loads keep them up to date.
 
-def insert_rows(df, year):
+    Args:
+        year: The year of the scorecard table.
+        expected_rows: The number of rows loaded into the shadow table.
+    """
+    conn, cur = connect_to_database()
+    try:
+        with stage('swap', table=f'scorecard_{year}'):
+            swap_shadow_table(cur, f'scorecard_{year}', expected_rows)
+            row_hashes.forget_hashes(cur, [f'scorecard_{year}'], year)
+            conn.commit()
+    finally:
+        release(conn)
+
+
+def validate_rows(df, definitions, year, rejected_csv):
+    """
+    Split off the rows that would not fit scorecard_{year}.
+
+    The rows are checked against the column types of the table and the
+    SCORECARD_KEY before anything is sent to the database, and the rows
+    that fail are written to rejected_csv with their reasons.
+
+    Args:
+        df: The cleaned pandas dataframe.
+        definitions: A list of (column name, SQL type) tuples.
+        year: The year of the scorecard table to load.
+        rejected_csv: A csv writer for the rejected rows.
+
+    Returns:
+        A tuple of (valid rows, number of rows rejected).
+    """
+    rules = rules_for_sql_types(dict(definitions), SCORECARD_KEY)
+    with stage('validate', rows=len(df), table=f'scorecard_{year}'):
+        valid, rejected = validate(df, rules)
+        rejected_csv.writerows(reject_records(rejected))
+    return valid, len(rejected)
+
+
+def insert_rows(df, year, table_name):
     # Connect to the database
     conn, cur = connect_to_database()
     num_rows_inserted = 0
     num_rows_rejected = 0
     rejected_csv = csv.writer(open(f'rejected_rows_{year}.csv', 'w'))
-    # make a new transaction
-    with conn.transaction():
-        for row in df.itertuples():
-            row = tuple(row)[1:]
-            try:
-                with conn.transaction():
-                    query1 = f'INSERT INTO scorecard_{year} VALUES {row};'
-                    cur.execute(query1)
-            except Exception as e:
-                # print("row rejected")
-                rejected_csv.writerow([str(e), row])
-                num_rows_rejected += 1
-            else:
-                # print("row inserted")
-                num_rows_inserted += 1
+    # only the rows that pass the checks are sent, one at a time.
+    df, num_rows_rejected = validate_rows(
+        df, get_column_definitions(df), year, rejected_csv)
+    # make a new transaction. It is committed at the end of the insert stage.
+    with stage('insert', rows=len(df), table=f'scorecard_{year}'):
+        with conn.transaction():
+            for row in df.itertuples():
+                row = tuple(row)[1:]
+                try:
+                    with conn.transaction():
+                        query1 = f'INSERT INTO {table_name} VALUES {row};'
+                        cur.execute(query1)
+                except Exception as e:
+                    # print("row rejected")
+                    rejected_csv.writerow([str(e), row])
+                    num_rows_rejected += 1
+                else:
+                    # print("row inserted")
+                    num_rows_inserted += 1
     # now we commit the entire transaction
     conn.commit()
-    conn.close()
+    release(conn)
     print(f"Total number of rows inserted: {num_rows_inserted}")
     print(f"Total number of rows rejected: {num_rows_rejected}")
+    return num_rows_inserted, num_rows_rejected
+
+
+# a value is numeric if postgres can cast its text to NUMERIC.
+NUMERIC_PATTERN = r'^\s*[-+]?(\d+\.?\d*|\.\d+)([eE][-+]?\d+)?\s*$'
+
+
+def reject_reason_sql(definitions):
+    """
+    Build a SQL expression that explains why a staged row cannot be moved.
+
+    Args:
+        definitions: A list of (column name, SQL type) tuples.
+
+    Returns:
+        A SQL expression that is '' for good rows and a list of problems
+        for rejected rows.
+    """
+    checks = []
+    for col, sql_type in definitions:
+        if sql_type == 'INTEGER':
+            checks.append(
+                f"CASE WHEN {col} IS NULL THEN NULL "
+                f"WHEN {col} !~ '{NUMERIC_PATTERN}' "
+                f"THEN '{col}: invalid integer' "
+                f"WHEN {col}::NUMERIC NOT BETWEEN -2147483648 AND 2147483647 "
+                f"THEN '{col}: integer out of range' "
+                f"WHEN {col}::NUMERIC <> trunc({col}::NUMERIC) "
+                f"THEN '{col}: not an integer' END")
+        elif sql_type == 'FLOAT':
+            checks.append(
+                f"CASE WHEN {col} !~ '{NUMERIC_PATTERN}' "
+                f"THEN '{col}: invalid float' END")
+        else:
+            checks.append(
+                f"CASE WHEN LENGTH({col}) > 255 "
+                f"THEN '{col}: value too long for VARCHAR(255)' END")
+    return f"CONCAT_WS('; ', {', '.join(checks)})"
+
+
+def create_staging_table(cur, definitions, year):
+    """
+    Create the temporary text staging table used by the COPY loader.
+
+    Args:
+        cur: The database cursor.
+        definitions: A list of (column name, SQL type) tuples.
+        year: The year of the scorecard table to load.
+
+    Returns:
+        The name of the staging table.
+    """
+    staging_table = f'scorecard_{year}_staging'
+    staging_cols = ', '.join(f'{col} TEXT' for col, _ in definitions)
+    cur.execute(
+        f'CREATE TEMP TABLE {staging_table} '
+        f'(row_num BIGSERIAL, {staging_cols}) ON COMMIT DROP;')
+    return staging_table
+
+
+def move_staged_rows(cur, definitions, table_name, staging_table,
+                     rejected_csv):
+    """
+    Move the staged rows that cast cleanly into the scorecard table.
+
+    Rejected rows are written to rejected_csv with their reason, and the
+    staging table is emptied so that it can take the next batch.
+
+    Args:
+        cur: The database cursor.
+        definitions: A list of (column name, SQL type) tuples.
+        table_name: The table to load, scorecard_{year} or its shadow.
+        staging_table: The name of the staging table.
+        rejected_csv: A csv writer for the rejected rows.
+
+    Returns:
+        A tuple of (rows inserted, rows rejected).
+    """
+    reason = reject_reason_sql(definitions)
+    casts = ', '.join(
+        f'{col}::NUMERIC::INTEGER' if sql_type == 'INTEGER'
+        else f'{col}::FLOAT' if sql_type == 'FLOAT'
+        else col
+        for col, sql_type in definitions)
+    column_names = ', '.join(col for col, _ in definitions)
+
+    cur.execute(
+        f'INSERT INTO {table_name} ({column_names}) '
+        f'SELECT {casts} FROM {staging_table} '
+        f'WHERE {reason} = \'\' ORDER BY row_num;')
+    num_rows_inserted = cur.rowcount
+    cur.execute(
+        f'SELECT {reason}, {column_names} FROM {staging_table} '
+        f'WHERE {reason} <> \'\' ORDER BY row_num;')
+    num_rows_rejected = 0
+    for row in cur:
+        rejected_csv.writerow([row[0], row[1:]])
+        num_rows_rejected += 1
+    cur.execute(f'TRUNCATE {staging_table};')
+    return num_rows_inserted, num_rows_rejected
+
+
+def insert_rows_copy(df, year, table_name):
+    """
+    Bulk load the cleaned dataframe with COPY through a staging table.
+
+    The rows that fail validate_rows are written to rejected_rows_{year}.csv
+    with their reasons. Every value of the other rows is copied as text
+    into a temporary staging table, and the rows that cast cleanly are
+    moved into the table with one INSERT ... SELECT.
+
+    Args:
+        df: The cleaned pandas dataframe.
+        year: The year of the scorecard table to load.
+        table_name: The table to load, scorecard_{year} or its shadow.
+
+    Returns:
+        A tuple of (rows inserted, rows rejected).
+    """
+    conn, cur = connect_to_database()
+    definitions = get_column_definitions(df)
+    with open(f'rejected_rows_{year}.csv', 'w') as f:
+        rejected_csv = csv.writer(f)
+        df, num_rows_invalid = validate_rows(
+            df, definitions, year, rejected_csv)
+        # the rows are committed together, in the commit stage.
+        with stage('insert', rows=len(df), table=f'scorecard_{year}'):
+            staging_table = create_staging_table(cur, definitions, year)
+            num_rows_staged = bulk_load.copy_frame(cur, staging_table, df)
+            print(f"Rows copied into staging: {num_rows_staged}")
+            num_rows_inserted, num_rows_rejected = move_staged_rows(
+                cur, definitions, table_name, staging_table, rejected_csv)
+        num_rows_rejected += num_rows_invalid
+        with stage('commit', table=f'scorecard_{year}'):
+            conn.commit()
+    release(conn)
+    print(f"Total number of rows inserted: {num_rows_inserted}")
+    print(f"Total number of rows rejected: {num_rows_rejected}")
+    return num_rows_inserted, num_rows_rejected
+
+
+def insert_chunks_copy(chunks, year, new_tables):
+    """
+    Stream cleaned chunks into scorecard_{year} with COPY.
+
+    The next chunk is parsed and cleaned in a background thread while the
+    current one is copied into the database. The column types of the table
+    are taken from the first chunk. All chunks are loaded in one
+    transaction, so a failed run leaves the table unchanged. Each chunk is
+    checked with validate_rows, so duplicate keys are only found within a
+    chunk.
+
+    Args:
+        chunks: An iterator of cleaned dataframes, see clean_csv_chunks.
+        year: The year of the scorecard table to load.
+        new_tables: Whether to create the shadow table of scorecard_{year}
+            from the first chunk and load it, instead of adding the rows
+            to scorecard_{year}.
+
+    Returns:
+        A tuple of (rows inserted, rows rejected).
+
+    Raises:
+        ValueError: If new_tables is set and there are no rows, since
+            there is nothing to replace scorecard_{year} with.
+    """
+    num_rows_read = 0
+    num_rows_inserted = 0
+    num_rows_rejected = 0
+    with ThreadPoolExecutor(max_workers=1) as parser:
+        df = parser.submit(next, chunks, None).result()
+        if df is None or df.empty:
+            print("Number of rows read in: 0")
+            if new_tables:
+                raise ValueError(
+                    f"No rows were read; scorecard_{year} was not replaced")
+            return 0, 0
+        table_name = (create_tables(df, year, shadow=True) if new_tables
+                      else f'scorecard_{year}')
+        definitions = get_column_definitions(df)
+        conn, cur = connect_to_database()
+        with open(f'rejected_rows_{year}.csv', 'w') as f:
+            rejected_csv = csv.writer(f)
+            # the chunks are committed together, in the commit stage.
+            staging_table = create_staging_table(cur, definitions, year)
+            while df is not None:
+                next_df = parser.submit(next, chunks, None)
+                num_rows_read += len(df)
+                df, invalid = validate_rows(
+                    df, definitions, year, rejected_csv)
+                with stage('insert', rows=len(df), table=f'scorecard_{year}'):
+                    bulk_load.copy_frame(cur, staging_table, df)
+                    inserted, rejected = move_staged_rows(
+                        cur, definitions, table_name, staging_table,
+                        rejected_csv)
+                num_rows_inserted += inserted
+                num_rows_rejected += rejected + invalid
+                df = next_df.result()
+            with stage('commit', table=f'scorecard_{year}'):
+                conn.commit()
+        release(conn)
+    print(f"Number of rows read in: {num_rows_read}")
+    print(f"Total number of rows inserted: {num_rows_inserted}")
+    print(f"Total number of rows rejected: {num_rows_rejected}")
+    return num_rows_inserted, num_rows_rejected
+
+
+def insert_rows_delta(df, year):
+    """
+    Write only the institutions that are new, changed or gone.
+
+    Every valid row is hashed and compared with the hashes stored in
+    row_hashes by the last delta load of scorecard_{year}. The old
+    versions of the changed rows and the rows of institutions that are no
+    longer in the file are deleted, the new and changed rows are copied
+    in through the staging table, and the hashes are updated, all in one
+    transaction. A table that has no hashes yet is written in full once.
+
+    The rows are checked, cast and hashed with the column types of the
+    existing scorecard_{year}, not the dtypes of the file, so a --typed
+    file is not rounded into INTEGER columns, and hashes the same as an
+    untyped read of the same values.
+
+    Args:
+        df: The cleaned pandas dataframe.
+        year: The year of the scorecard table to load.
+
+    Returns:
+        A tuple of (rows inserted, rows rejected).
+    """
+    table_name = f'scorecard_{year}'
+    conn, cur = connect_to_database()
+    definitions = get_table_definitions(cur, df, table_name)
+    with open(f'rejected_rows_{year}.csv', 'w') as f:
+        rejected_csv = csv.writer(f)
+        df, num_rows_invalid = validate_rows(
+            df, definitions, year, rejected_csv)
+        with stage('hash', rows=len(df), table=table_name):
+            hashes = row_hashes.frame_hashes(df, dict(definitions))
+            changes = row_hashes.compare_hashes(
+                df['UNITID'], hashes,
+                row_hashes.stored_hashes(cur, table_name, year))
+        written = changes['inserted'] | changes['changed']
+        changed_df = df[written]
+        # the rows are committed together, in the commit stage.
+        with stage('insert', rows=len(changed_df), table=table_name):
+            removed = row_hashes.delete_stale_rows(
+                cur, table_name, year, changed_df['UNITID'], df['UNITID'])
+            changes['removed'] = sorted({*changes['removed'], *removed})
+            staging_table = create_staging_table(cur, definitions, year)
+            bulk_load.copy_frame(cur, staging_table, changed_df)
+            num_rows_inserted, num_rows_rejected = move_staged_rows(
+                cur, definitions, table_name, staging_table, rejected_csv)
+            row_hashes.save_hashes(
+                cur, table_name, year, changed_df['UNITID'],
+                hashes[written], changes['removed'])
+        num_rows_rejected += num_rows_invalid
+        with stage('commit', table=table_name):
+            conn.commit()
+    release(conn)
+    print(row_hashes.change_summary(table_name, changes))
+    print(f"Total number of rows inserted: {num_rows_inserted}")
+    print(f"Total number of rows rejected: {num_rows_rejected}")
+    return num_rows_inserted, num_rows_rejected
+
+
+def table_exists(table_name):
+    """Check whether a table exists in the database."""
+    conn, cur = connect_to_database()
+    cur.execute("SELECT to_regclass(%s) IS NOT NULL;", (table_name,))
+    exists = cur.fetchone()[0]
+    release(conn)
+    return exists
+
+
+def forget_row_hashes(year):
+    """Drop the row hashes of scorecard_{year} before rows are added."""
+    conn, cur = connect_to_database()
+    row_hashes.forget_hashes(cur, [f'scorecard_{year}'], year)
+    conn.commit()
+    release(conn)
+
+
+def load_scorecard_file(filename, mode="copy", chunksize=None,
+                        new_tables=True, typed=False, delta=False):
+    """
+    Load one raw MERGED file into scorecard_{year}.
+
+    Args:
+        filename: The path to the raw scorecard file.
+        mode: "copy" to bulk load through a staging table, "insert" to
+            insert one row at a time.
+        chunksize: If given, stream the file this many rows at a time.
+        new_tables: Whether to replace scorecard_{year}. The rows are then
+            loaded into a shadow table, which takes the place of
+            scorecard_{year} once its row count has been checked, so
+            readers never see a missing or half-filled table. Otherwise
+            the rows are added to scorecard_{year}.
+        typed: Whether to parse the file with typed dtypes, see
+            read_scorecard_csv.
+        delta: Whether to only write the rows that changed since the last
+            delta load, see insert_rows_delta. scorecard_{year} is then
+            kept and only created if it does not exist.
+
+    Returns:
+        A tuple of (rows inserted, rows rejected).
+
+    Raises:
+        ValueError: If new_tables is set and the file has no rows, or the
+            loaded rows fail the checks of swap_shadow_table.
+    """
+    year = scorecard_year(filename)
+    print(f"loading in {year} data")
+    if delta:
+        cleaned = clean_csv(filename, typed)
+        if not table_exists(f'scorecard_{year}'):
+            create_tables(cleaned, year)
+        counts = insert_rows_delta(cleaned, year)
+        write_run_record('load-scorecard', year=year)
+        return counts
+    if not new_tables:
+        # the added rows have no hashes, so the next delta load must not
+        # trust the stored ones; drop them before any row is committed.
+        forget_row_hashes(year)
+    if chunksize is not None:
+        chunks = clean_csv_chunks(filename, chunksize, typed)
+        counts = insert_chunks_copy(chunks, year, new_tables)
+    else:
+        cleaned = clean_csv(filename, typed)
+        if new_tables and cleaned.empty:
+            raise ValueError(
+                f"{filename} has no rows; scorecard_{year} was not replaced")
+        # pick out the columns that we need.
+        table_name = (create_tables(cleaned, year, shadow=True) if new_tables
+                      else f'scorecard_{year}')
+        if mode == "copy":
+            counts = insert_rows_copy(cleaned, year, table_name)
+        else:
+            counts = insert_rows(cleaned, year, table_name)
+    if new_tables:
+        swap_in_table(year, counts[0])
+    write_run_record('load-scorecard', year=year)
+    return counts
+
 
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+        description="Load raw college scorecard data into postgres.")
+    parser.add_argument(
+        "filename",
+        help="raw scorecard file, e.g. MERGED2018_19_PP.csv or "
+             "MERGED2018_19_PP.csv.gz")
+    parser.add_argument(
+        "--mode", choices=["copy", "insert"], default="copy",
+        help="copy: bulk load through a staging table (default); "
+             "insert: one INSERT and savepoint per row")
+    parser.add_argument(
+        "--chunksize", type=int,
+        help="stream the file this many rows at a time (copy mode only)")
+    parser.add_argument(
+        "--typed", action="store_true",
+        help="read PrivacySuppressed cells as NULL instead of 999 and keep "
+             "the columns in narrow dtypes (copy mode only)")
+    parser.add_argument(
+        "--delta", action="store_true",
+        help="keep scorecard_<year> and only write the institutions that "
+             "are new, changed or gone since the last delta load "
+             "(copy mode without --chunksize only)")
+    args = parser.parse_args()
+    if args.delta and (args.mode != "copy" or args.chunksize is not None):
+        parser.error("--delta can only be used with --mode copy and "
+                     "without --chunksize")
+    if args.chunksize is not None and args.mode != "copy":
+        parser.error("--chunksize can only be used with --mode copy")
+    if args.typed and args.mode != "copy":
+        parser.error("--typed can only be used with --mode copy")
 
-# set this flag.
-new_tables = True
+    # set this flag.
+    new_tables = True
 
-filename = sys.argv[1]
-year = filename.split('_')[0].replace('MERGED', '')
-print(f"loading in {year} data")
-cleaned = clean_csv(filename)
-# pick out the columns that we need.
-if new_tables:
-    create_tables(cleaned, year)
-insert_rows(cleaned, year)
+    load_scorecard_file(args.filename, args.mode, args.chunksize, new_tables,
+                        args.typed, args.delta)
@@ -1,29 +1,44 @@
 import pandas as pd
-import psycopg
 import sys
 import re
-import credentials
-
-
-def connect_to_database():
-    # Establishing a connection to the database
-    conn = psycopg.connect(
-        host = "pinniped.postgres.database.azure.com",
-        dbname = credentials.DB_USER,
-        user=credentials.DB_USER,
-        password=credentials.DB_PASSWORD
-    )
-
-    cur = conn.cursor()
-    return conn,cur
+import os
+import io
+import csv
+import bulk_load
+import parquet_cache
+from db import connect_to_database, release
+from raw_files import open_raw_file
+from instrumentation import stage, write_run_record
+from validation import validate, reject_records, rules_for_sql_types
+from shadow_tables import create_shadow_table, swap_shadow_table
+
+# no two rows may share these columns.
+IPEDS_KEY = ['UNITID', 'year']
+# the values that make sense, on top of the column types.
+IPEDS_LIMITS = {
+    'LATITUDE': {'min': -90, 'max': 90},
+    'LONGITUD': {'min': -180, 'max': 180},
+}
 
 
 def read_csv(filename):
     # Extracting year from the filename using regular expression
-    year = re.findall(r'\d{4}', filename)[0]
-    df = pd.read_csv(filename, encoding='ISO-8859-1', na_values=['', -999])
+    year = re.findall(r'\d{4}', os.path.basename(filename))[0]
+    columns = ['UNITID', 'INSTNM', 'ADDR', 'CONTROL', 'CCBASIC', 'LATITUDE', 'LONGITUD']
+    with stage('read_csv') as measurement:
+        if parquet_cache.cache_enabled():
+            # only the selected columns are read from the Parquet copy
+            df = parquet_cache.read_csv(filename, columns=columns,
+                                        encoding='ISO-8859-1',
+                                        null_values=['-999', '-999.0'])
+        else:
+            # a .zip or .gz file is decompressed as it is read
+            with open_raw_file(filename) as f:
+                df = pd.read_csv(f, encoding='ISO-8859-1',
+                                 na_values=['', -999])
+        measurement['rows'] = len(df)
     # Selecting specific variables from the dataframe
-    df = df[['UNITID', 'INSTNM', 'ADDR', 'CONTROL', 'CCBASIC', 'LATITUDE', 'LONGITUD']]
+    df = df[columns]
     df = df.replace(-999, None)
     # Adding a 'year' column to the dataframe
     df['year'] = year
@@ -41,55 +56,62 @@ def data_type(pandas_dtype):
 
 
 def create_table(df, table_name, conn, cur):
+    """
+    Create the shadow table that a load of table_name writes to.
+
+    The live table is left alone until the load is swapped in.
+
+    Returns:
+        The name of the shadow table.
+    """
     # Creating SQL column definitions based on dataframe dtypes
     columns = [f"{col} {data_type(df[col].dtype)}" for col in df.columns]
     columns_str = ', '.join(columns)
-    cur.execute(f"DROP TABLE IF EXISTS {table_name};")
-    cur.execute(f'CREATE TABLE {table_name} ({columns_str});')
-    conn.commit()
+    with stage('create_table', table=table_name):
+        shadow_table = create_shadow_table(cur, table_name, columns_str)
+        conn.commit()
+    return shadow_table
 
 
-def is_invalid_data(row, numeric_columns):
-    for col in numeric_columns:
-        if isinstance(row[col], str) and re.search(r'[a-zA-Z]', row[col]):
-            return True
-    return False
- 
+def validation_rules(df):
+    """
+    Build the rules that the rows of ipeds_{year} must pass.
+
+    Args:
+        df: The pandas dataframe, whose dtypes give the column types.
+
+    Returns:
+        The rules, see validation.py.
+    """
+    rules = rules_for_sql_types(
+        {col: data_type(df[col].dtype) for col in df.columns}, IPEDS_KEY)
+    for col, limits in IPEDS_LIMITS.items():
+        rules['columns'][col].update(limits)
+    return rules
+
 
 def insert_data(df, table_name, conn, cur):
     total_rows = len(df)
     inserted_rows = 0
     failed_rows = 0
-    failed_data = []
+    # rejected rows are written with their reason, like the other loaders.
+    failed_data = io.StringIO()
+    failed_csv = csv.writer(failed_data)
 
-    numeric_columns = [col for col in df.columns if pd.api.types.is_numeric_dtype(df[col])]
-
-    # Replacing pandas NA values with None for SQL compatibility
-    df = df.replace({pd.NA: None})
     try:
-        for index, row in df.iterrows():
-            if is_invalid_data(row, numeric_columns):
-                failed_rows += 1
-                failed_data.append(row)
-                continue
-
-            # prepare for SQL
-            placeholders = ', '.join(['%s'] * len(row))
-            columns = ', '.join(row.index)
-            sql = (
-                f"INSERT INTO {table_name} "
-                f"({columns}) "
-                f"VALUES ({placeholders})"
-            )
-            try:
-                cur.execute(sql, list(row.values))
-                inserted_rows += 1
-            except Exception as e:
-                print(f"Error in row {index}: {e}")
-                failed_rows += 1
-                failed_data.append(row)
-                continue
-        conn.commit()
+        with stage('validate', rows=total_rows, table=table_name):
+            valid, rejected = validate(df, validation_rules(df))
+            failed_csv.writerows(reject_records(rejected))
+            failed_rows = len(rejected)
+            # Replacing pandas NA values with None for SQL compatibility
+            valid = valid.astype(object).where(valid.notna(), None)
+        with stage('insert', rows=len(valid), table=table_name):
+            inserted_rows, rejected_rows = bulk_load.insert_batches(
+                conn, cur, table_name, list(valid.columns),
+                bulk_load.frame_to_rows(valid), failed_csv)
+            failed_rows += rejected_rows
+        with stage('commit', table=table_name):
+            conn.commit()
     except Exception as e:
         print(f"Error during insertion: {e}")
         conn.rollback()
@@ -98,19 +120,35 @@ def insert_data(df, table_name, conn, cur):
 
     # Writing failed data rows to a CSV file
     if failed_rows > 0:
-        pd.DataFrame(failed_data).to_csv('failed_data.csv', index=False)
+        with open('failed_data.csv', 'w', newline='') as f:
+            f.write(failed_data.getvalue())
 
     return total_rows, inserted_rows, failed_rows
 
 
-if __name__ == "__main__":
-    if len(sys.argv) != 2:
-        print("Usage: python load-ipeds.py <filename>")
-        sys.exit(1)
+def load_ipeds_file(filename):
+    """
+    Load one raw IPEDS file into ipeds_{year}.
+
+    The rows are loaded into a shadow table, which replaces ipeds_{year}
+    once its row count has been checked, see shadow_tables.py. A file
+    without rows, or a load that inserts no rows, never replaces the table.
+
+    Args:
+        filename: The path to the raw IPEDS file, e.g. hd2019.csv.
+
+    Returns:
+        A tuple of (rows read, rows inserted, rows failed).
 
-    filename = sys.argv[1]
+    Raises:
+        ValueError: If the file has no rows, no row was inserted, or the
+            loaded rows fail the checks of swap_shadow_table.
+    """
     df, year = read_csv(filename)
     table_name = f'ipeds_{year}'
+    if df.empty:
+        raise ValueError(
+            f"{filename} has no rows; {table_name} was not replaced")
 
     try:
         conn, cur = connect_to_database()
@@ -118,13 +156,34 @@ if __name__ == "__main__":
         print(f"Error connecting to database: {e}")
         sys.exit(1)
 
-    create_table(df, table_name, conn, cur)
-    
-    total_rows, inserted_rows, failed_rows = insert_data(df, table_name, conn, cur)
-    print(f"Total rows read from CSV: {total_rows}")
-    print(f"Total rows successfully inserted: {inserted_rows}")
-    print(f"Total rows failed to insert: {failed_rows}")
+    try:
+        shadow_table = create_table(df, table_name, conn, cur)
+
+        total_rows, inserted_rows, failed_rows = insert_data(
+            df, shadow_table, conn, cur)
+        print(f"Total rows read from CSV: {total_rows}")
+        print(f"Total rows successfully inserted: {inserted_rows}")
+        print(f"Total rows failed to insert: {failed_rows}")
+        # a failed insert rolls back to the empty shadow table, which
+        # must not take the place of the table.
+        if inserted_rows == 0:
+            raise ValueError(
+                f"No rows of {filename} were inserted; {table_name} was "
+                f"not replaced")
+
+        # readers keep seeing the old table until the new one is complete.
+        with stage('swap', table=table_name):
+            swap_shadow_table(cur, table_name, inserted_rows)
+            conn.commit()
+        cur.close()
+    finally:
+        release(conn)
+    write_run_record('load_ipeds', year=year)
+    return total_rows, inserted_rows, failed_rows
 
-    cur.close()
-    conn.close()
+if __name__ == "__main__":
+    if len(sys.argv) != 2:
+        print("Usage: python load-ipeds.py <filename>")
+        sys.exit(1)
 
+    load_ipeds_file(sys.argv[1])
@@ -1,25 +1,13 @@
-
 import pandas as pd
-import credentials
-import psycopg
 import sys
-
-
-def connect_to_database():
-    """
-    Connect to the PostgreSQL database.
-
-    Returns:
-        A tuple containing the connection and cursor objects.
-    """
-    conn = psycopg.connect(
-        host="pinniped.postgres.database.azure.com",
-        dbname=credentials.DB_NAME,
-        user=credentials.DB_USER,
-        password=credentials.DB_PASSWORD
-    )
-    cur = conn.cursor()
-    return conn, cur
+import csv
+import bulk_load
+import row_hashes
+from schema_tables import (TABLE_COLUMNS, PRIMARY_KEY, ROLLUP_SOURCES,
+                           ROLLUP_TABLE, ensure_year_partition,
+                           get_table_column_types, refresh_rollup)
+from db import connect_to_database, release, bump_table_versions
+from validation import validate, reject_records, rules_for_sql_types
 
 
 def read_csv(csv_file_path):
@@ -46,46 +34,114 @@ def data_type(pandas_dtype):
         return "TEXT"
 
 
-def change_InstitutionInformation(df, year, unitid):
-    # Connect to the database
-    conn, cur = connect_to_database()
+def overwrite_table(df, year, table_name):
+    """
+    Replace the rows of one schema table for a year with corrected rows.
+
+    The corrections are loaded into a temporary copy of the table. The old
+    rows are then removed with one DELETE ... USING and the corrected rows
+    are added with one INSERT ... SELECT, in a single short transaction.
+    The row hashes of the table and year are dropped in that transaction,
+    so the next delta load of load-schema.py writes every row again
+    instead of keeping the corrections as unchanged rows.
+    The old rows are appended to output.csv and the new rows to
+    overwritten.csv. The corrections are first checked against the column
+    types and primary key of the table with validation.py. Correction rows
+    that fail the checks or that the database cannot store are written to
+    rejected_overwrite_{year}.csv and are not applied.
+
+    Args:
+        df: The corrected rows. Needs every column of the table; the year
+            column is filled in from year.
+        year: The year that the corrections are for.
+        table_name: The schema table to change, in any case.
 
-    rowstodelete = []
-    rowstoinsert = []
-    # Loop through the unitid column
-    for index, value in df[unitid].iteritems():
-        # Row to be deleted
-        query = f"SELECT * FROM institutioninformation WHERE unitid = {value} AND year = {year}"
-        cur.execute(query)
-        rowstodelete.append(cur.fetchone())
-        # Delete the row
-        cur.execute(f"DELETE FROM institutioninformation WHERE unitid = {value} AND year = {year}")
-        # Row to be inserted
-        rowstoinsert.append(df.iloc[index])
-        # Insert the row
-        cur.execute(f"INSERT INTO institutioninformation VALUES {tuple(rowstoinsert[index])}")
-
-    # Write rows to the CSV file
-    df_to_write = pd.DataFrame(rowstodelete, columns=df.columns)
-    df_to_write['change'] = 'deleted'
-    df_to_write.to_csv('output.csv', index=False, mode='a')
-
-    df_to_write = pd.DataFrame(rowstoinsert, columns=df.columns)
-    df_to_write['change'] = 'inserted'
-    df_to_write.to_csv('overwritten.csv', index=False, header=False, mode='a')
-
-    conn.commit()
-    conn.close()
+    Returns:
+        A tuple of (rows deleted, rows inserted, rows rejected).
+    """
+    tables = {name.lower(): name for name in TABLE_COLUMNS}
+    if table_name.lower() not in tables:
+        raise ValueError(f"Unknown table {table_name}, expected one of "
+                         f"{', '.join(tables)}")
+    table_name = tables[table_name.lower()]
+    columns = TABLE_COLUMNS[table_name]
+
+    df = df.rename(columns=str.lower)
+    df['year'] = int(year)
+    if missing := [col for col in columns if col not in df.columns]:
+        raise ValueError(f"Correction file is missing columns: {missing}")
+    df = df.loc[:, columns]
+
+    conn, cur = connect_to_database()
+    try:
+        column_types = get_table_column_types(cur, table_name)
+        rules = rules_for_sql_types(
+            {col: column_types[col] for col in columns}, PRIMARY_KEY)
+        # end the transaction of the lookup, so that the overwrite below
+        # runs in a transaction of its own.
+        conn.commit()
+        staging_table = f'{table_name}_overwrite'
+        with open(f'rejected_overwrite_{year}.csv', 'w') as f:
+            rejected_csv = csv.writer(f)
+            df, invalid = validate(df, rules)
+            rejected_csv.writerows(reject_records(invalid))
+            df = df.astype(object).where(df.notna(), None)
+            with conn.transaction():
+                cur.execute(
+                    f'CREATE TEMP TABLE {staging_table} (LIKE {table_name}) '
+                    f'ON COMMIT DROP;')
+                _, rejected_rows = bulk_load.insert_batches(
+                    conn, cur, staging_table, columns,
+                    bulk_load.frame_to_rows(df), rejected_csv)
+                # Rows to be deleted
+                cur.execute(
+                    f'DELETE FROM {table_name} t USING {staging_table} o '
+                    f'WHERE t.unitid = o.unitid AND t.year = o.year '
+                    f'RETURNING t.*;')
+                deleted = pd.DataFrame(
+                    cur.fetchall(), columns=[d.name for d in cur.description])
+                # Rows to be inserted
+                ensure_year_partition(cur, table_name, year)
+                column_str = ', '.join(columns)
+                cur.execute(
+                    f'INSERT INTO {table_name} ({column_str}) '
+                    f'SELECT {column_str} FROM {staging_table} RETURNING *;')
+                inserted = pd.DataFrame(
+                    cur.fetchall(), columns=[d.name for d in cur.description])
+                row_hashes.forget_hashes(cur, [table_name], year)
+                changed = [table_name]
+                if table_name in ROLLUP_SOURCES:
+                    refresh_rollup(cur, int(year))
+                    changed.append(ROLLUP_TABLE)
+                bump_table_versions(cur, changed)
+        rejected_rows += len(invalid)
+    finally:
+        release(conn)
+
+    # Write rows to the CSV files
+    deleted['change'] = 'deleted'
+    deleted.to_csv('output.csv', index=False, mode='a')
+    inserted['change'] = 'inserted'
+    inserted.to_csv('overwritten.csv', index=False, header=False, mode='a')
+
+    print(f"Deleted: {len(deleted)}, Inserted: {len(inserted)}, "
+          f"Rejected: {rejected_rows}")
+    return len(deleted), len(inserted), rejected_rows
+
+
+def change_InstitutionInformation(df, year):
+    return overwrite_table(df, year, "institutioninformation")
 
 
 if __name__ == "__main__":
+    if len(sys.argv) != 4:
+        print("Usage: python overwrite_data.py <filename> <year> <table>")
+        sys.exit(1)
     # Read the CSV file
     df = read_csv(sys.argv[1])
     # Get the year from the filename
     year = sys.argv[2]
-    # Get the unitid column name from the filename
+    # Get the name of the table to change
     tabletochange = sys.argv[3]
 
-    if tabletochange == "institutioninformation":
-        # Change the InstitutionInformation table
-        change_InstitutionInformation(df, year)
+    overwrite_table(df, year, tabletochange)
@@ -0,0 +1,238 @@
+import argparse
+import hashlib
+import json
+import os
+import numpy as np
+from instrumentation import stage
+from raw_files import open_raw_file, raw_stem
+
+try:
+    import pyarrow as pa
+    import pyarrow.csv as pa_csv
+    import pyarrow.parquet as pq
+except ImportError:
+    # without pyarrow the loaders read the CSV files directly.
+    pa = None
+
+# bump this when the conversion changes, so old cache files are rebuilt.
+CACHE_VERSION = 2
+# set this environment variable to 0 to always read the CSV files.
+CACHE_VARIABLE = "PIPELINE_PARQUET_CACHE"
+# the cells that pandas.read_csv reads as missing by default.
+PANDAS_NULL_VALUES = [
+    '', '#N/A', '#N/A N/A', '#NA', '-1.#IND', '-1.#QNAN', '-NaN', '-nan',
+    '1.#IND', '1.#QNAN', '<NA>', 'N/A', 'NA', 'NULL', 'NaN', 'None', 'n/a',
+    'nan', 'null']
+
+
+def cache_enabled():
+    """Tell whether the loaders should read through the Parquet cache."""
+    return pa is not None and os.environ.get(CACHE_VARIABLE) != "0"
+
+
+def cache_path(csv_path, encoding, null_values, string_columns):
+    """
+    Get the path of the Parquet copy of a CSV file, next to the file.
+
+    The name holds a hash of the conversion settings, so reads of the same
+    file with different settings, e.g. with and without PrivacySuppressed
+    as a missing value, each keep their own copy.
+    """
+    key = hashlib.sha256(repr((
+        CACHE_VERSION, encoding, sorted(null_values), sorted(string_columns)
+    )).encode()).hexdigest()[:12]
+    return os.path.join(
+        os.path.dirname(csv_path), f'{raw_stem(csv_path)}.{key}.parquet')
+
+
+def cache_settings(csv_path, encoding, null_values, string_columns):
+    """
+    Describe the source file and the conversion that made a Parquet copy.
+
+    The description is stored in the Parquet file, and the copy is only
+    used while the description still matches.
+    """
+    source = os.stat(csv_path)
+    return {
+        'version': CACHE_VERSION,
+        'source_size': source.st_size,
+        'source_mtime_ns': source.st_mtime_ns,
+        'encoding': encoding,
+        'null_values': sorted(null_values),
+        'string_columns': sorted(string_columns),
+    }
+
+
+def stored_settings(path):
+    """Get the conversion settings stored in a Parquet copy, or None."""
+    try:
+        metadata = pq.read_schema(path).metadata or {}
+    except (FileNotFoundError, pa.ArrowInvalid):
+        return None
+    if b'parquet_cache' not in metadata:
+        return None
+    return json.loads(metadata[b'parquet_cache'])
+
+
+def convert(csv_path, encoding='utf-8', null_values=(), string_columns=()):
+    """
+    Parse a raw CSV file once and store a typed Parquet copy next to it.
+
+    The file is parsed with the multithreaded Arrow reader. A .gz or .zip
+    file is decompressed as it is parsed. The string_columns are read as
+    text and Arrow infers the type of the other columns as it parses them:
+    int64 if all values are integers, float64 if they are all numbers and
+    text otherwise, which gives the same dtypes as pandas.read_csv. Columns
+    without any value are stored as float64, also like pandas. Integer
+    columns with missing values come back from Parquet as float64.
+
+    Args:
+        csv_path: The path to the CSV file, or to a .gz or .zip archive
+            of it.
+        encoding: The encoding of the CSV file.
+        null_values: Cells to read as missing, besides the pandas defaults.
+        string_columns: Columns to keep as text, like dtype=object in
+            pandas.read_csv.
+
+    Returns:
+        The path of the Parquet copy.
+    """
+    path = cache_path(csv_path, encoding, null_values, string_columns)
+    settings = cache_settings(csv_path, encoding, null_values, string_columns)
+    with stage('convert_parquet') as measurement:
+        with open_raw_file(csv_path) as f:
+            table = pa_csv.read_csv(
+                f,
+                read_options=pa_csv.ReadOptions(
+                    use_threads=True, encoding=encoding),
+                convert_options=pa_csv.ConvertOptions(
+                    column_types={name: pa.string()
+                                  for name in string_columns},
+                    null_values=PANDAS_NULL_VALUES + list(null_values),
+                    strings_can_be_null=True))
+        columns = []
+        for name, column in zip(table.column_names, table.columns):
+            if pa.types.is_null(column.type):
+                column = column.cast(pa.float64())
+            elif pa.types.is_temporal(column.type):
+                # pandas.read_csv leaves dates and times as text.
+                column = column.cast(pa.string())
+            columns.append(column)
+        table = pa.table(columns, names=table.column_names)
+        table = table.replace_schema_metadata(
+            {'parquet_cache': json.dumps(settings)})
+        # write to a temporary file first, so that an interrupted conversion
+        # never leaves a broken copy behind.
+        tmp_path = f'{path}.{os.getpid()}.tmp'
+        pq.write_table(table, tmp_path)
+        os.replace(tmp_path, path)
+        measurement['rows'] = table.num_rows
+    print(f"Stored a Parquet copy of {csv_path} in {path}")
+    return path
+
+
+def cached_copy(csv_path, encoding='utf-8', null_values=(), string_columns=()):
+    """
+    Get an up to date Parquet copy of a CSV file, converting it if needed.
+
+    Args:
+        csv_path: The path to the CSV file.
+        encoding: The encoding of the CSV file.
+        null_values: Cells to read as missing, besides the pandas defaults.
+        string_columns: Columns to keep as text.
+
+    Returns:
+        The path of the Parquet copy.
+    """
+    path = cache_path(csv_path, encoding, null_values, string_columns)
+    settings = cache_settings(csv_path, encoding, null_values, string_columns)
+    if stored_settings(path) != settings:
+        convert(csv_path, encoding, null_values, string_columns)
+    return path
+
+
+def file_order(path, columns):
+    """Put the requested columns in the order of the file, like usecols."""
+    if columns is None:
+        return None
+    names = pq.read_schema(path).names
+    if missing := [col for col in columns if col not in names]:
+        raise ValueError(f"Columns not found in {path}: {missing}")
+    wanted = set(columns)
+    return [name for name in names if name in wanted]
+
+
+def to_frame(table):
+    """
+    Convert an Arrow table or record batch to a pandas dataframe.
+
+    Missing text cells become NaN instead of None, as with pandas.read_csv.
+    """
+    df = table.to_pandas()
+    for col in df.columns[(df.dtypes == object).to_numpy()]:
+        df[col] = df[col].where(df[col].notna(), np.nan)
+    return df
+
+
+def read_csv(csv_path, columns=None, encoding='utf-8', null_values=(),
+             string_columns=()):
+    """
+    Read a CSV file through its Parquet copy.
+
+    Only the requested columns are read from the copy.
+
+    Args:
+        csv_path: The path to the CSV file.
+        columns: The columns to read, or None for all of them.
+        encoding: The encoding of the CSV file.
+        null_values: Cells to read as missing, besides the pandas defaults.
+        string_columns: Columns to keep as text.
+
+    Returns:
+        A pandas dataframe.
+    """
+    path = cached_copy(csv_path, encoding, null_values, string_columns)
+    return to_frame(pq.read_table(
+        path, columns=file_order(path, columns), use_threads=True))
+
+
+def read_csv_chunks(csv_path, chunksize, columns=None, encoding='utf-8',
+                    null_values=(), string_columns=()):
+    """
+    Read a CSV file through its Parquet copy, chunksize rows at a time.
+
+    Args:
+        csv_path: The path to the CSV file.
+        chunksize: The number of rows in each chunk.
+        columns: The columns to read, or None for all of them.
+        encoding: The encoding of the CSV file.
+        null_values: Cells to read as missing, besides the pandas defaults.
+        string_columns: Columns to keep as text.
+
+    Yields:
+        Pandas dataframes of at most chunksize rows.
+    """
+    path = cached_copy(csv_path, encoding, null_values, string_columns)
+    parquet_file = pq.ParquetFile(path)
+    for batch in parquet_file.iter_batches(
+            batch_size=chunksize, columns=file_order(path, columns)):
+        yield to_frame(batch)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+        description="Store Parquet copies of raw scorecard and IPEDS files "
+                    "ahead of a load.")
+    parser.add_argument("filenames", nargs="+",
+                        help="raw MERGED or hd files, plain or .gz/.zip")
+    args = parser.parse_args()
+    if not cache_enabled():
+        parser.error(f"pyarrow is not installed or {CACHE_VARIABLE} is 0")
+    # read each file the way its loader does, so the copy is made with the
+    # same settings.
+    from run_pipeline import load_module
+    for filename in args.filenames:
+        if os.path.basename(filename).lower().startswith('hd'):
+            load_module('load_ipeds.py').read_csv(filename)
+        else:
+            load_module('load-scorecard.py').read_scorecard_csv(filename)
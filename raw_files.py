@@ -0,0 +1,78 @@
+import gzip
+import os
+import zipfile
+
+# the raw files can be plain CSV files or CSV files compressed with gzip or
+# zip; compressed files are read as a stream, without unpacking them first.
+RAW_FILE_SUFFIXES = ('.csv', '.csv.gz', '.gz', '.zip', '.csv.zip')
+
+
+def raw_stem(path):
+    """
+    Get the name of a raw file without its .csv, .gz or .zip extensions.
+
+    Args:
+        path: The path to the raw file, e.g. data/MERGED2018_19_PP.csv.gz.
+
+    Returns:
+        The name, e.g. MERGED2018_19_PP.
+    """
+    name = os.path.basename(path)
+    for extension in ('.gz', '.zip', '.csv'):
+        if name.lower().endswith(extension):
+            name = name[:-len(extension)]
+    return name
+
+
+def open_raw_file(path):
+    """
+    Open a raw CSV file for reading, decompressing it as it is read.
+
+    A .zip archive must hold exactly one CSV file, like the HD archives
+    that IPEDS publishes.
+
+    Args:
+        path: The path to a .csv, .gz or .zip file.
+
+    Returns:
+        A binary file object.
+    """
+    lower = path.lower()
+    if lower.endswith('.gz'):
+        return gzip.open(path, 'rb')
+    if lower.endswith('.zip'):
+        archive = zipfile.ZipFile(path)
+        members = [name for name in archive.namelist()
+                   if name.lower().endswith('.csv')]
+        if len(members) != 1:
+            archive.close()
+            raise ValueError(
+                f"Expected one CSV file in {path}, found {members}")
+        # the member keeps the archive file open until it is closed.
+        return archive.open(members[0])
+    return open(path, 'rb')
+
+
+def find_raw_file(directory, stem):
+    """
+    Find the raw file with a name in a directory, plain or compressed.
+
+    Names are matched without regard to case, so hd2019 also finds
+    HD2019.zip.
+
+    Args:
+        directory: The directory to look in.
+        stem: The file name without extensions, e.g. hd2019.
+
+    Returns:
+        The path of the first file found, in the order of
+        RAW_FILE_SUFFIXES, or the path of the plain CSV file if there is
+        none, so that the loader reports the missing file.
+    """
+    names = {}
+    if os.path.isdir(directory):
+        names = {name.lower(): name for name in os.listdir(directory)}
+    for suffix in RAW_FILE_SUFFIXES:
+        if name := names.get(f'{stem}{suffix}'.lower()):
+            return os.path.join(directory, name)
+    return os.path.join(directory, f'{stem}.csv')
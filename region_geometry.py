@@ -0,0 +1,70 @@
+import functools
+import os
+import pickle
+import geopandas as gpd
+from report_cache import CACHE_DIR
+
+REPO_DIR = os.path.dirname(os.path.abspath(__file__))
+SHAPEFILE = os.path.join(REPO_DIR, 'usa-states-census-2014.shp')
+# outlines are simplified to this share of the width of the map, which is
+# far below what a report figure can show.
+SIMPLIFY_FRACTION = 0.0005
+
+
+def cache_path(shapefile):
+    """Get the path of the stored region polygons of a shapefile."""
+    name = os.path.splitext(os.path.basename(shapefile))[0]
+    return os.path.join(CACHE_DIR, f'{name}_regions.pkl')
+
+
+def build_region_geometry(shapefile):
+    """
+    Merge the state polygons of a shapefile into one polygon per region.
+
+    Args:
+        shapefile: The path to a shapefile with a 'region' column.
+
+    Returns:
+        A GeoDataFrame with the columns 'region' and 'geometry'.
+    """
+    states = gpd.read_file(shapefile)
+    regions = states[['region', 'geometry']].dissolve(by='region')
+    regions = regions.reset_index()
+    min_x, min_y, max_x, max_y = regions.total_bounds
+    tolerance = SIMPLIFY_FRACTION * max(max_x - min_x, max_y - min_y)
+    regions['geometry'] = regions.geometry.simplify(
+        tolerance, preserve_topology=True)
+    return regions
+
+
+@functools.lru_cache(maxsize=None)
+def region_geometry(shapefile=SHAPEFILE):
+    """
+    Get one simplified polygon per region of the states shapefile.
+
+    The polygons are built from the shapefile once and pickled, which
+    stores them as WKB, in the report cache directory. Later calls read the stored
+    polygons, until the shapefile changes, and within a process they are
+    only read once. Do not change the returned frame; merge or copy it.
+
+    Args:
+        shapefile: The path to a shapefile with a 'region' column.
+
+    Returns:
+        A GeoDataFrame with the columns 'region' and 'geometry'.
+    """
+    path = cache_path(shapefile)
+    if (os.path.exists(path)
+            and os.path.getmtime(path) >= os.path.getmtime(shapefile)):
+        try:
+            with open(path, 'rb') as f:
+                return pickle.load(f)
+        except (EOFError, pickle.UnpicklingError):
+            pass
+    regions = build_region_geometry(shapefile)
+    os.makedirs(CACHE_DIR, exist_ok=True)
+    tmp_path = f'{path}.{os.getpid()}.tmp'
+    with open(tmp_path, 'wb') as f:
+        pickle.dump(regions, f)
+    os.replace(tmp_path, path)
+    return regions
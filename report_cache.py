@@ -0,0 +1,108 @@
+import hashlib
+import os
+import pickle
+from db import connect_to_database, release, get_table_versions
+
+# cached results are kept as one pickle file per query in this directory.
+# The REPORT_CACHE_DIR environment variable can point it somewhere else.
+CACHE_DIR = os.environ.get('REPORT_CACHE_DIR', os.path.join(
+    os.path.dirname(os.path.abspath(__file__)), '.report_cache'))
+# the least recently used results are removed beyond this many files.
+MAX_ENTRIES = 256
+
+
+def cache_path(query, params, versions):
+    """Get the cache file for a query, its parameters and table versions."""
+    key = hashlib.sha256(repr((query, params, versions)).encode()).hexdigest()
+    return os.path.join(CACHE_DIR, f'{key}.pkl')
+
+
+def evict():
+    """Remove the least recently used results beyond MAX_ENTRIES."""
+    paths = [os.path.join(CACHE_DIR, name) for name in os.listdir(CACHE_DIR)
+             if name.endswith('.pkl')]
+    if len(paths) <= MAX_ENTRIES:
+        return
+    paths.sort(key=os.path.getmtime)
+    for path in paths[:len(paths) - MAX_ENTRIES]:
+        try:
+            os.remove(path)
+        except FileNotFoundError:
+            pass
+
+
+def lookup(query, params, versions):
+    """
+    Get a stored result.
+
+    Args:
+        query: The SQL query.
+        params: The query parameters, or None.
+        versions: The versions of the tables that the query reads.
+
+    Returns:
+        The stored rows, or None if there is no stored result.
+    """
+    path = cache_path(query, params, versions)
+    try:
+        with open(path, 'rb') as f:
+            rows = pickle.load(f)
+    except (FileNotFoundError, EOFError, pickle.UnpicklingError):
+        return None
+    # mark the result as recently used.
+    os.utime(path)
+    return rows
+
+
+def store(query, params, versions, rows):
+    """
+    Store a result, evicting old results if the cache is full.
+
+    Args:
+        query: The SQL query.
+        params: The query parameters, or None.
+        versions: The versions of the tables that the query reads.
+        rows: The rows returned by the query.
+    """
+    os.makedirs(CACHE_DIR, exist_ok=True)
+    path = cache_path(query, params, versions)
+    tmp_path = f'{path}.{os.getpid()}.tmp'
+    with open(tmp_path, 'wb') as f:
+        pickle.dump(rows, f)
+    os.replace(tmp_path, path)
+    evict()
+
+
+def cached_query(query, tables, params=None):
+    """
+    Run a report query, reusing the stored result while its tables have not
+    changed.
+
+    A result is stored under the query, its parameters and the versions of
+    the tables it reads. load-schema.py and overwrite_data.py bump those
+    versions when they change a table, so a stored result is never used
+    after its data changed.
+
+    Args:
+        query: The SQL query.
+        tables: The names of the tables that the query reads.
+        params: The query parameters, or None.
+
+    Returns:
+        A list of result rows.
+    """
+    conn, cur = connect_to_database()
+    try:
+        versions = get_table_versions(cur, tables)
+        if versions is None:
+            # nothing has recorded table versions yet, so do not cache.
+            cur.execute(query, params)
+            return cur.fetchall()
+        rows = lookup(query, params, versions)
+        if rows is None:
+            cur.execute(query, params)
+            rows = cur.fetchall()
+            store(query, params, versions, rows)
+        return rows
+    finally:
+        release(conn)
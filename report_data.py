@@ -0,0 +1,126 @@
+import asyncio
+from db import (POOL_MAX_SIZE, connect_async, connect_to_database,
+                get_table_versions, release)
+from report_cache import lookup, store
+from report_queries import REPORT_QUERIES, slice_tuition_cube
+
+# queries without {year} return the same rows for every report year, so a
+# process that renders several years (see generate_reports.py) keeps their
+# results in memory, by query and table versions.
+_shared_results = {}
+
+
+async def run_query(query, limit):
+    """
+    Run one query over its own async connection.
+
+    Args:
+        query: The SQL query.
+        limit: A semaphore that caps the number of open connections.
+
+    Returns:
+        A list of result rows.
+    """
+    async with limit:
+        async with await connect_async() as conn:
+            cur = await conn.execute(query)
+            return await cur.fetchall()
+
+
+def table_versions(names):
+    """
+    Look up the versions of the tables that some report queries read.
+
+    Args:
+        names: The names of the queries in REPORT_QUERIES.
+
+    Returns:
+        A dict of query name to the versions of its tables, or None if
+        table_versions does not exist.
+    """
+    tables = list(dict.fromkeys(
+        table for name in names for table in REPORT_QUERIES[name][1]))
+    conn, cur = connect_to_database()
+    try:
+        versions = get_table_versions(cur, tables)
+    finally:
+        release(conn)
+    if versions is None:
+        return None
+    by_table = dict(zip(tables, versions))
+    return {name: tuple(by_table[table] for table in REPORT_QUERIES[name][1])
+            for name in names}
+
+
+async def gather_report_data(year, names=None):
+    """
+    Fetch the data of every report section at the same time.
+
+    Results of the queries that do not depend on the year are kept in
+    memory and reused for the next year, and results that report_cache.py
+    holds for the current table versions are reused. The other queries
+    are all sent at once, each over its own async connection, so the
+    report waits about as long as its slowest query instead of the sum of
+    all of them. New results are stored in the cache, under the same keys
+    as cached_query() in Reporting.py. The three tuition summaries come
+    from the one tuition_cube query and are sliced out of its rows.
+
+    Args:
+        year: The year of the report.
+        names: The queries to run, by name in REPORT_QUERIES, or None for
+            all of them.
+
+    Returns:
+        A dict of query name to result rows. With tuition_cube, it also
+        holds the summaries of report_queries.TUITION_LEVELS.
+    """
+    names = list(REPORT_QUERIES if names is None else names)
+    queries = {name: REPORT_QUERIES[name][0].format(year=year)
+               for name in names}
+    versions = table_versions(names)
+
+    def shared_key(name):
+        if '{year}' in REPORT_QUERIES[name][0]:
+            return None
+        return queries[name], versions and versions[name]
+
+    data = {}
+    for name in names:
+        if (key := shared_key(name)) in _shared_results:
+            data[name] = _shared_results[key]
+        elif versions is not None:
+            rows = lookup(queries[name], None, versions[name])
+            if rows is not None:
+                data[name] = rows
+    missing = [name for name in names if name not in data]
+    limit = asyncio.Semaphore(POOL_MAX_SIZE)
+    results = await asyncio.gather(
+        *(run_query(queries[name], limit) for name in missing))
+    for name, rows in zip(missing, results):
+        if versions is not None:
+            store(queries[name], None, versions[name], rows)
+        data[name] = rows
+    for name in names:
+        if key := shared_key(name):
+            _shared_results[key] = data[name]
+    data = {name: data[name] for name in names}
+    if 'tuition_cube' in data:
+        data.update(slice_tuition_cube(data['tuition_cube']))
+    return data
+
+
+def load_report_data(year, names=None):
+    """
+    Fetch the data of every report section, for code that is not async.
+
+    Inside a running event loop, e.g. a notebook, await
+    gather_report_data() instead.
+
+    Args:
+        year: The year of the report.
+        names: The queries to run, or None for all of them.
+
+    Returns:
+        A dict of query name to result rows.
+    """
+    return asyncio.run(gather_report_data(year, names))
@@ -0,0 +1,75 @@
+# the queries behind the reports, by name, with the tables that each one
+# reads. {year} is replaced with the report year. Reporting.py, the
+# reporting notebook (through report_data.py) and benchmark_queries.py all
+# take their SQL from here, so the same report runs the same query text and
+# shares its cached result.
+REPORT_QUERIES = {
+    'colleges_by_state_and_type': (
+        "SELECT region, control, SUM(institution_count) as count "
+        "FROM reporting_rollup WHERE year = {year} "
+        "GROUP BY region, control ORDER BY region, control;",
+        ['reporting_rollup']),
+    # GROUPING() is 0 for the region and ccbasic level, 1 for the region
+    # level and 2 for the ccbasic level; see TUITION_LEVELS.
+    'tuition_cube': (
+        "SELECT GROUPING(region, ccbasic) AS level, region, ccbasic, "
+        "SUM(tuition_sum)::NUMERIC / NULLIF(SUM(tuition_count), 0) "
+        "AS avg_tuition FROM reporting_rollup WHERE year = {year} "
+        "GROUP BY GROUPING SETS ((region, ccbasic), (region), (ccbasic)) "
+        "HAVING SUM(studentbody_count) > 0 ORDER BY level, region, ccbasic;",
+        ['reporting_rollup']),
+    'loan_repayments': (
+        "SELECT * FROM loanrepayments WHERE year = {year};",
+        ['loanrepayments']),
+    'institution_names': (
+        "SELECT unitid, instnm FROM institutioninformation "
+        "WHERE year = {year};",
+        ['institutioninformation']),
+    'yearly_tuition_by_control': (
+        "SELECT year, control, "
+        "SUM(tuition_sum)::NUMERIC / NULLIF(SUM(tuition_count), 0) "
+        "AS avg_tuition FROM reporting_rollup GROUP BY year, control "
+        "HAVING SUM(studentbody_count) > 0 ORDER BY year;",
+        ['reporting_rollup']),
+    'tuition_and_salary': (
+        "SELECT unitid, year, tuitfte, avgfacsal "
+        "FROM institutioninformation NATURAL JOIN studentbody "
+        "WHERE year = {year};",
+        ['institutioninformation', 'studentbody']),
+    'institution_new': (
+        "SELECT i.unitid, i.instnm FROM institutioninformation i "
+        "WHERE i.year = {year} AND NOT EXISTS ("
+        "SELECT 1 FROM institutioninformation o WHERE o.unitid = i.unitid "
+        "AND o.year >= 2019 AND o.year < {year});",
+        ['institutioninformation']),
+}
+
+# the tuition summaries in the rows of the tuition_cube query, by the
+# GROUPING() level of the rows.
+TUITION_LEVELS = {
+    0: 'tuition_by_state_and_classification',
+    1: 'tuition_by_state',
+    2: 'tuition_by_classification',
+}
+
+
+def slice_tuition_cube(rows):
+    """
+    Split the rows of the tuition_cube query into the tuition summaries.
+
+    Args:
+        rows: The result rows of the tuition_cube query, as tuples of
+            (level, region, ccbasic, avg_tuition).
+
+    Returns:
+        A dict of summary name in TUITION_LEVELS to its rows:
+        (region, ccbasic, avg_tuition) for the state and classification
+        summary, (region, avg_tuition) for the state summary and
+        (ccbasic, avg_tuition) for the classification summary.
+    """
+    summaries = {name: [] for name in TUITION_LEVELS.values()}
+    for level, region, ccbasic, avg_tuition in rows:
+        # the column that a level groups over is NULL, so leave it out.
+        keys = {0: (region, ccbasic), 1: (region,), 2: (ccbasic,)}[level]
+        summaries[TUITION_LEVELS[level]].append((*keys, avg_tuition))
+    return summaries
@@ -0,0 +1,211 @@
+import pandas as pd
+from validation import SQL_RULE_TYPES
+
+# the hash of every loaded row, by table, year and institution. Delta loads
+# compare a file with these hashes and only write the rows that differ.
+ROW_HASHES_TABLE = 'row_hashes'
+
+
+def create_row_hashes_table(cur):
+    """
+    Create the row_hashes table if it does not exist yet.
+
+    Args:
+        cur: The database cursor.
+    """
+    cur.execute(f"""
+        CREATE TABLE IF NOT EXISTS {ROW_HASHES_TABLE} (
+            table_name TEXT,
+            year INTEGER,
+            unitid INTEGER,
+            row_hash BIGINT NOT NULL,
+            PRIMARY KEY (table_name, year, unitid)
+        );""")
+
+
+def frame_hashes(df, column_types):
+    """
+    Hash the values of every row the way the table stores them.
+
+    Every column is first converted to the values of its SQL type, e.g.
+    integer columns are rounded, so a row hashes the same whether it was
+    read as int, float or text.
+
+    Args:
+        df: The pandas dataframe.
+        column_types: A dict of column name to SQL type, e.g. 'INTEGER'.
+
+    Returns:
+        A numpy array of one 64 bit hash per row.
+    """
+    values = {}
+    for col in df.columns:
+        base = column_types[col].lower().partition('(')[0].strip()
+        rule_type = SQL_RULE_TYPES.get(base, 'text')
+        series = df[col]
+        if rule_type == 'text':
+            values[col] = series.astype(str).where(series.notna(), None)
+            continue
+        if not pd.api.types.is_numeric_dtype(series):
+            series = pd.to_numeric(series.astype(object), errors='coerce')
+        numbers = series.astype('float64')
+        values[col] = (numbers.round().astype('Int64')
+                       if rule_type == 'integer' else numbers)
+    hashes = pd.util.hash_pandas_object(pd.DataFrame(values), index=False)
+    return hashes.to_numpy().view('int64')
+
+
+def stored_hashes(cur, table_name, year):
+    """
+    Look up the hashes stored for the rows of a table and year.
+
+    Args:
+        cur: The database cursor.
+        table_name: The table name, in any case.
+        year: The year of the rows.
+
+    Returns:
+        A pandas Series of hashes indexed by unitid, empty if there are
+        none.
+    """
+    create_row_hashes_table(cur)
+    cur.execute(
+        f"SELECT unitid, row_hash FROM {ROW_HASHES_TABLE} "
+        f"WHERE table_name = %s AND year = %s;",
+        (table_name.lower(), int(year)))
+    rows = cur.fetchall()
+    return pd.Series([row[1] for row in rows],
+                     index=[row[0] for row in rows], dtype='Int64')
+
+
+def compare_hashes(keys, hashes, stored):
+    """
+    Sort the rows of a file into new, changed and unchanged rows.
+
+    Args:
+        keys: The unitid of every row. The keys must be unique.
+        hashes: The hash of every row, see frame_hashes().
+        stored: The stored hashes, see stored_hashes().
+
+    Returns:
+        A dict with boolean arrays 'inserted', 'changed' and 'unchanged'
+        over the rows, and the list of stored unitids that are no longer
+        in the file as 'removed'.
+    """
+    keys = pd.Index(keys).astype('int64')
+    old = stored.reindex(keys)
+    inserted = old.isna().to_numpy()
+    changed = ~inserted & (old.fillna(0).to_numpy(dtype='int64') != hashes)
+    return {
+        'inserted': inserted,
+        'changed': changed,
+        'unchanged': ~inserted & ~changed,
+        'removed': stored.index.difference(keys).tolist(),
+    }
+
+
+def change_summary(table_name, changes):
+    """
+    Describe the changes of a delta load in one line.
+
+    Args:
+        table_name: The table that was loaded.
+        changes: The dict returned by compare_hashes().
+
+    Returns:
+        The summary, e.g. 'scorecard_2018: 3 inserted, 5 changed, ...'.
+    """
+    return (f"{table_name}: {int(changes['inserted'].sum())} inserted, "
+            f"{int(changes['changed'].sum())} changed, "
+            f"{len(changes['removed'])} removed, "
+            f"{int(changes['unchanged'].sum())} unchanged")
+
+
+def delete_stale_rows(cur, table_name, year, written, keys,
+                      year_column=None):
+    """
+    Delete the old versions of the rows that a delta load writes again.
+
+    The rows of the written institutions are deleted, and so are the rows
+    of institutions that are no longer in the file, including rows that a
+    full load wrote without hashes. The caller is responsible for
+    committing.
+
+    Args:
+        cur: The database cursor.
+        table_name: The table being loaded.
+        year: The year of the rows.
+        written: The unitids of the new and changed rows.
+        keys: The unitids of every row in the file.
+        year_column: The year column of the table, if it holds several
+            years.
+
+    Returns:
+        The unitids of the institutions that were removed.
+    """
+    of_year = f" AND {year_column} = {int(year)}" if year_column else ""
+    cur.execute(
+        f"DELETE FROM {table_name} WHERE unitid = ANY(%s){of_year};",
+        ([int(key) for key in written],))
+    cur.execute(
+        f"DELETE FROM {table_name} "
+        f"WHERE unitid NOT IN (SELECT unnest(%s::INTEGER[])){of_year} "
+        f"RETURNING unitid;",
+        ([int(key) for key in keys],))
+    return sorted({row[0] for row in cur.fetchall()})
+
+
+def save_hashes(cur, table_name, year, keys, hashes, removed,
+                year_column=None):
+    """
+    Store the hashes of the rows that a delta load wrote.
+
+    The hashes of the written and removed rows are replaced. Only rows
+    that are now in the table get a hash, so a row that the database
+    rejected counts as new on the next load. The caller is responsible for
+    committing.
+
+    Args:
+        cur: The database cursor.
+        table_name: The table that was loaded.
+        year: The year of the rows.
+        keys: The unitids of the written rows.
+        hashes: The hashes of the written rows.
+        removed: The unitids of the rows that were deleted.
+        year_column: The year column of the table, if it holds several
+            years.
+    """
+    keys = [int(key) for key in keys]
+    cur.execute(
+        f"DELETE FROM {ROW_HASHES_TABLE} "
+        f"WHERE table_name = %s AND year = %s AND unitid = ANY(%s);",
+        (table_name.lower(), int(year), keys + [int(key) for key in removed]))
+    in_table = f"SELECT unitid FROM {table_name}"
+    if year_column:
+        in_table += f" WHERE {year_column} = {int(year)}"
+    cur.execute(
+        f"INSERT INTO {ROW_HASHES_TABLE} (table_name, year, unitid, row_hash) "
+        f"SELECT %s, %s, h.unitid, h.row_hash "
+        f"FROM unnest(%s::INTEGER[], %s::BIGINT[]) AS h(unitid, row_hash) "
+        f"WHERE h.unitid IN ({in_table});",
+        (table_name.lower(), int(year), keys, [int(h) for h in hashes]))
+
+
+def forget_hashes(cur, table_names, year):
+    """
+    Drop the stored hashes of tables that were loaded in full.
+
+    A full load does not keep the hashes up to date, so the next delta
+    load of these tables writes every row once.
+
+    Args:
+        cur: The database cursor.
+        table_names: The tables that were loaded.
+        year: The year of the rows.
+    """
+    cur.execute("SELECT to_regclass(%s) IS NOT NULL;", (ROW_HASHES_TABLE,))
+    if cur.fetchone()[0]:
+        cur.execute(
+            f"DELETE FROM {ROW_HASHES_TABLE} "
+            f"WHERE table_name = ANY(%s) AND year = %s;",
+            ([name.lower() for name in table_names], int(year)))
@@ -0,0 +1,146 @@
+import argparse
+import importlib.util
+import multiprocessing
+import os
+import sys
+from concurrent.futures import ProcessPoolExecutor, FIRST_COMPLETED, wait
+from raw_files import find_raw_file
+
+
+def load_module(filename):
+    """
+    Import one of the pipeline scripts from this directory.
+
+    The loader scripts have hyphens in their names, so they cannot be
+    imported with a plain import statement.
+
+    Args:
+        filename: The file name of the script, e.g. load-schema.py.
+
+    Returns:
+        The imported module.
+    """
+    path = os.path.join(os.path.dirname(os.path.abspath(__file__)), filename)
+    name = os.path.splitext(filename)[0].replace('-', '_')
+    spec = importlib.util.spec_from_file_location(name, path)
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    return module
+
+
+def run_scorecard(filename):
+    load_module('load-scorecard.py').load_scorecard_file(filename)
+
+
+def run_ipeds(filename):
+    load_module('load_ipeds.py').load_ipeds_file(filename)
+
+
+def run_schema(year):
+    load_module('load-schema.py').main(year, "False")
+
+
+def build_tasks(years, data_dir):
+    """
+    Build the task graph for loading the given schema years.
+
+    load-schema.py <year> reads scorecard_{year - 1} and ipeds_{year}, so
+    each schema task depends on those two loads. The scorecard and IPEDS
+    loads do not depend on anything.
+
+    Args:
+        years: The schema years to load, e.g. [2019, 2020].
+        data_dir: The directory that holds the raw MERGED and HD files.
+
+    Returns:
+        A dict of task name to (function, argument, list of dependencies).
+    """
+    tasks = {}
+    for year in years:
+        # the raw files may be plain or compressed, e.g. HD2019.zip.
+        scorecard_file = find_raw_file(
+            data_dir, f'MERGED{year - 1}_{str(year)[2:]}_PP')
+        ipeds_file = find_raw_file(data_dir, f'hd{year}')
+        tasks[f'scorecard_{year - 1}'] = (run_scorecard, scorecard_file, [])
+        tasks[f'ipeds_{year}'] = (run_ipeds, ipeds_file, [])
+        tasks[f'schema_{year}'] = (
+            run_schema, year, [f'scorecard_{year - 1}', f'ipeds_{year}'])
+    return tasks
+
+
+def run_tasks(tasks, max_workers):
+    """
+    Run the task graph in a process pool.
+
+    A task is started as soon as all of its dependencies have finished.
+    If a task fails, the tasks that depend on it are skipped.
+
+    Args:
+        tasks: The task graph returned by build_tasks.
+        max_workers: The number of worker processes.
+
+    Returns:
+        A tuple of (finished task names, failed task names, skipped task
+        names).
+    """
+    done = set()
+    failed = set()
+    skipped = set()
+    waiting = dict(tasks)
+    running = {}
+    # spawn fresh worker processes, so that no worker inherits the database
+    # connections of this process.
+    context = multiprocessing.get_context("spawn")
+    with ProcessPoolExecutor(max_workers=max_workers,
+                             mp_context=context) as pool:
+        while waiting or running:
+            for name, (function, argument, dependencies) in list(waiting.items()):
+                if any(dep in failed or dep in skipped for dep in dependencies):
+                    print(f"skipping {name}: a dependency failed")
+                    skipped.add(name)
+                    del waiting[name]
+                elif all(dep in done for dep in dependencies):
+                    print(f"starting {name}")
+                    running[pool.submit(function, argument)] = name
+                    del waiting[name]
+            if not running:
+                break
+            finished, _ = wait(running, return_when=FIRST_COMPLETED)
+            for future in finished:
+                name = running.pop(future)
+                try:
+                    future.result()
+                except BaseException as e:
+                    print(f"{name} failed: {e}")
+                    failed.add(name)
+                else:
+                    print(f"{name} finished")
+                    done.add(name)
+    return done, failed, skipped
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+        description="Load the scorecard, IPEDS and schema tables for "
+                    "several years, running independent loads in parallel.")
+    parser.add_argument(
+        "years", type=int, nargs="+",
+        help="schema years to load, e.g. 2019 2020 2021 2022")
+    parser.add_argument(
+        "--data-dir", default=".",
+        help="directory with the raw MERGED and hd files, plain or as "
+             ".gz/.zip archives (default: .)")
+    parser.add_argument(
+        "--workers", type=int, default=os.cpu_count(),
+        help="number of worker processes (default: number of CPUs)")
+    args = parser.parse_args()
+
+    # the six schema tables are created once, before any year is loaded.
+    load_module('load-schema.py').create_tables_schema()
+
+    tasks = build_tasks(args.years, args.data_dir)
+    done, failed, skipped = run_tasks(tasks, args.workers)
+    print(f"Finished: {len(done)}, Failed: {len(failed)}, "
+          f"Skipped: {len(skipped)}")
+    if failed or skipped:
+        sys.exit(1)
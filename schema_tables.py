@@ -0,0 +1,393 @@
+# The tables of our data schema and the columns that load-schema.py writes
+# into each of them. The tables are created by create_tables_schema() in
+# load-schema.py.
+TABLE_COLUMNS = {
+    "InstitutionInformation": [
+        'unitid',
+        'year',
+        'instnm',
+        'addr',
+        'region',
+        'control',
+        'ccbasic',
+        'latitude',
+        'longitude',
+        'accredagency',
+        'preddeg',
+        'highdeg',
+        'avgfacsal'],
+    "StudentBody": [
+        'unitid',
+        'year',
+        'pptug_ef',
+        'ugds_white',
+        'ugds_black',
+        'ugds_hisp',
+        'ugds_asian',
+        'ugds_nra',
+        'ug',
+        'inexpfte',
+        'c150_4',
+        'c150_l4',
+        'tuitfte',
+        'tuitionfee_in',
+        'tuitionfee_out',
+        'tuitionfee_prog'],
+    "Debt": [
+        'unitid',
+        'year',
+        'grad_debt_mdn',
+        'wdraw_debt_mdn',
+        'lo_inc_debt_mdn',
+        'md_inc_debt_mdn',
+        'hi_inc_debt_mdn',
+        'dep_debt_mdn',
+        'ind_debt_mdn',
+        'pell_debt_mdn',
+        'nopell_debt_mdn',
+        'female_debt_mdn',
+        'male_debt_mdn',
+        'firstgen_debt_mdn',
+        'notfirstgen_debt_mdn',
+        'cdr2',
+        'cdr3'],
+    "LoanRepayments": [
+        'unitid',
+        'year',
+        'dbrr1_fed_ug_n',
+        'dbrr1_fed_ug_rt',
+        'dbrr4_fed_ug_n',
+        'dbrr4_fed_ug_rt',
+        'dbrr5_fed_ug_n',
+        'dbrr5_fed_ug_rt',
+        'dbrr10_fed_ug_n',
+        'dbrr10_fed_ug_rt',
+        'dbrr20_fed_ug_n',
+        'dbrr20_fed_ug_rt'],
+    "Admissions": [
+        'unitid',
+        'year',
+        'sat_avg',
+        'adm_rate',
+        'openadmp',
+        'admcon7'],
+    "StudentOutcomes": [
+        'unitid',
+        'year',
+        'pct25_earn_wne_p6',
+        'pct75_earn_wne_p6',
+        'count_wne_inc1_p6',
+        'count_wne_inc2_p6',
+        'count_wne_inc3_p6'],
+}
+
+
+# the columns that hold fractions, e.g. coordinates and rates. They are
+# FLOAT columns; older versions of create_tables_schema() made them INTEGER.
+FRACTION_COLUMNS = {
+    "InstitutionInformation": ['latitude', 'longitude'],
+    "StudentBody": ['c150_4', 'c150_l4'],
+    "Debt": ['cdr2', 'cdr3'],
+}
+
+
+def get_table_column_types(cur, table_name):
+    """
+    Look up the SQL types of the columns of a table.
+
+    Args:
+        cur: The database cursor.
+        table_name: The table name, in any case.
+
+    Returns:
+        A dict of lower case column name to the information_schema
+        data_type, e.g. 'integer', 'double precision' or 'text'.
+    """
+    cur.execute(
+        "SELECT column_name, data_type FROM information_schema.columns "
+        "WHERE table_name = %s;", (table_name.lower(),))
+    return dict(cur.fetchall())
+
+
+def migrate_fraction_columns(cur):
+    """
+    Change the FRACTION_COLUMNS of an older database from INTEGER to FLOAT.
+
+    The source files hold fractions in these columns, e.g. a latitude of
+    40.7 or a completion rate of 0.56. As INTEGER columns, postgres rounded
+    them on insert, so a completion rate was stored as 0 or 1. Now that
+    validation.py rejects fractions for INTEGER columns instead of letting
+    them be rounded, nearly every row would be rejected. The rounded values
+    are kept as they are; load the years again to get the fractions back.
+    The caller is responsible for committing.
+
+    Args:
+        cur: The database cursor.
+    """
+    for table_name, columns in FRACTION_COLUMNS.items():
+        column_types = get_table_column_types(cur, table_name)
+        for col in columns:
+            if column_types.get(col) == 'integer':
+                cur.execute(f"ALTER TABLE {table_name} "
+                            f"ALTER COLUMN {col} TYPE FLOAT;")
+                print(f"Changed {table_name}.{col} from INTEGER to FLOAT")
+
+
+# every schema table has this primary key.
+PRIMARY_KEY = ['unitid', 'year']
+
+
+def upsert_sql(columns):
+    """
+    Build the conflict handling for an idempotent INSERT into a schema table.
+
+    A row whose primary key already exists is updated, but only if one of
+    its values changed. The statement returns one row per inserted or
+    updated row, holding True for an insert and False for an update.
+    Unchanged rows are not returned. The INSERT must use the alias t for
+    the target table.
+
+    Args:
+        columns: The columns being inserted.
+
+    Returns:
+        The ON CONFLICT ... RETURNING part of the statement.
+    """
+    values = [col for col in columns if col not in PRIMARY_KEY]
+    updates = ', '.join(f'{col} = EXCLUDED.{col}' for col in values)
+    current = ', '.join(f't.{col}' for col in values)
+    excluded = ', '.join(f'EXCLUDED.{col}' for col in values)
+    return (
+        f"ON CONFLICT ({', '.join(PRIMARY_KEY)}) DO UPDATE SET {updates} "
+        f"WHERE ({current}) IS DISTINCT FROM ({excluded}) "
+        f"RETURNING (t.xmax = 0)")
+
+
+# secondary indexes of the schema tables, as (index name, table, columns).
+# There are none: the tables are partitioned by year, so a query of one
+# year only reads its partition, the lookups by institution use the
+# (unitid, year) primary keys, and the reports group by region, control
+# and ccbasic in reporting_rollup instead of in the schema tables. Every
+# index here would be built again each time a partition is attached.
+# benchmark_queries.py measures the queries with and without them.
+SECONDARY_INDEXES = []
+
+# indexes that earlier versions created and create_indexes() drops.
+OBSOLETE_INDEXES = (
+    'institutioninformation_group_idx',
+    'institutioninformation_year_idx',
+    'studentbody_year_idx',
+    'debt_year_idx',
+    'loanrepayments_year_idx',
+    'admissions_year_idx',
+    'studentoutcomes_year_idx',
+)
+
+
+def create_indexes(cur):
+    """
+    Create the secondary indexes of the schema tables that do not exist yet.
+
+    The indexes in OBSOLETE_INDEXES are dropped. The caller is responsible
+    for committing.
+
+    Args:
+        cur: The database cursor.
+    """
+    for index_name in OBSOLETE_INDEXES:
+        cur.execute(f"DROP INDEX IF EXISTS {index_name};")
+    for index_name, table_name, columns in SECONDARY_INDEXES:
+        cur.execute(
+            f"CREATE INDEX IF NOT EXISTS {index_name} "
+            f"ON {table_name} ({', '.join(columns)});")
+
+
+def is_partitioned(cur, table_name):
+    """
+    Check whether a schema table is partitioned by year.
+
+    Databases created before the tables were partitioned keep plain tables
+    until create_tables_schema() runs again.
+
+    Args:
+        cur: The database cursor.
+        table_name: The table name, in any case.
+
+    Returns:
+        True if the table exists and is partitioned.
+    """
+    cur.execute(
+        "SELECT relkind = 'p' FROM pg_class WHERE oid = to_regclass(%s);",
+        (table_name.lower(),))
+    row = cur.fetchone()
+    return bool(row and row[0])
+
+
+def partition_name(table_name, year):
+    """Get the name of the partition that holds one year of a table."""
+    return f"{table_name.lower()}_{int(year)}"
+
+
+def ensure_year_partition(cur, table_name, year):
+    """
+    Create the empty partition of a year if it does not exist yet.
+
+    Rows can only be written through a partitioned table into a year that
+    has a partition. Nothing is done for a plain table.
+
+    Args:
+        cur: The database cursor.
+        table_name: The schema table.
+        year: The year.
+    """
+    if is_partitioned(cur, table_name):
+        cur.execute(
+            f"CREATE TABLE IF NOT EXISTS {partition_name(table_name, year)} "
+            f"PARTITION OF {table_name} FOR VALUES IN ({int(year)});")
+
+
+def create_year_table(cur, table_name, year):
+    """
+    Create a standalone table to load one year of a schema table into.
+
+    The table has the columns of the schema table and only accepts rows of
+    the year, so it can be attached as the partition of the year with
+    swap_year_partition() without being scanned again. It has no indexes
+    while it is loaded; the primary key and the secondary indexes are
+    built when it is attached. The rows must therefore not repeat a
+    primary key, which validation.py makes sure of. A plain schema table
+    is loaded directly instead.
+
+    The columns are read from the catalog instead of with CREATE TABLE
+    ... LIKE, which would lock the schema table until the load commits.
+    Loads of other years could then each hold that lock while they wait
+    for the lock of the swap, and deadlock.
+
+    Args:
+        cur: The database cursor.
+        table_name: The schema table.
+        year: The year to load.
+
+    Returns:
+        The name of the table to load the rows into.
+    """
+    if not is_partitioned(cur, table_name):
+        return table_name
+    cur.execute(
+        "SELECT attname, format_type(atttypid, atttypmod), attnotnull "
+        "FROM pg_attribute WHERE attrelid = to_regclass(%s) "
+        "AND attnum > 0 AND NOT attisdropped ORDER BY attnum;",
+        (table_name.lower(),))
+    columns = [f"{name} {sql_type}{' NOT NULL' if not_null else ''}"
+               for name, sql_type, not_null in cur.fetchall()]
+    load_table = f"{partition_name(table_name, year)}_load"
+    cur.execute(f"DROP TABLE IF EXISTS {load_table};")
+    cur.execute(
+        f"CREATE TABLE {load_table} ({', '.join(columns)}, "
+        f"CHECK (year = {int(year)}));")
+    return load_table
+
+
+def swap_year_partition(cur, table_name, year, load_table):
+    """
+    Replace the partition of a year with a table from create_year_table().
+
+    The old partition is detached and dropped and the loaded table is
+    attached in its place, which builds its indexes but does not scan or
+    copy the old rows. The caller is responsible for committing, so
+    readers see either the old or the new year.
+
+    The schema table is locked first, in the mode that DETACH needs, so
+    loads of several years that run at the same time swap one after the
+    other instead of deadlocking over a weaker lock.
+
+    Args:
+        cur: The database cursor.
+        table_name: The schema table.
+        year: The year that was loaded.
+        load_table: The table returned by create_year_table().
+    """
+    if load_table == table_name:
+        return
+    cur.execute(f"LOCK TABLE {table_name} IN ACCESS EXCLUSIVE MODE;")
+    partition = partition_name(table_name, year)
+    cur.execute(
+        "SELECT relispartition FROM pg_class WHERE oid = to_regclass(%s);",
+        (partition,))
+    if row := cur.fetchone():
+        if row[0]:
+            cur.execute(
+                f"ALTER TABLE {table_name} DETACH PARTITION {partition};")
+        cur.execute(f"DROP TABLE {partition};")
+    cur.execute(f"ALTER TABLE {load_table} RENAME TO {partition};")
+    cur.execute(
+        f"ALTER TABLE {table_name} ATTACH PARTITION {partition} "
+        f"FOR VALUES IN ({int(year)});")
+
+
+# counts and tuition sums of every year, region, control and ccbasic group,
+# kept up to date by the loaders so the reports do not have to join and
+# scan the schema tables.
+ROLLUP_TABLE = 'reporting_rollup'
+# the schema tables that the rollup is computed from.
+ROLLUP_SOURCES = ['InstitutionInformation', 'StudentBody']
+
+
+# fills the rollup rows of the years that match the WHERE clause.
+ROLLUP_INSERT = f"""
+    INSERT INTO {ROLLUP_TABLE}
+    SELECT i.year, i.region, i.control, i.ccbasic, COUNT(*),
+           COUNT(s.unitid), COUNT(s.tuitfte), SUM(s.tuitfte)
+    FROM institutioninformation i
+    LEFT JOIN studentbody s USING (unitid, year)
+    {{where}}
+    GROUP BY i.year, i.region, i.control, i.ccbasic;"""
+
+
+def create_rollup_table(cur):
+    """
+    Create the reporting rollup table if it does not exist yet.
+
+    institution_count counts the institutions of a group and
+    studentbody_count the ones that also have a StudentBody row.
+    tuition_sum and tuition_count are the sum and number of the non null
+    tuitfte values, so the average tuition of any combination of groups is
+    SUM(tuition_sum) / SUM(tuition_count). A new table is filled for every
+    year that is already loaded. This is done by create_tables_schema(),
+    before any year is loaded, so concurrent loads never race to create
+    the table. The caller is responsible for committing.
+
+    Args:
+        cur: The database cursor.
+    """
+    cur.execute(f"SELECT to_regclass('{ROLLUP_TABLE}') IS NOT NULL;")
+    if cur.fetchone()[0]:
+        return
+    cur.execute(f"""
+        CREATE TABLE {ROLLUP_TABLE} (
+            year INTEGER,
+            region INTEGER,
+            control INTEGER,
+            ccbasic INTEGER,
+            institution_count BIGINT NOT NULL,
+            studentbody_count BIGINT NOT NULL,
+            tuition_count BIGINT NOT NULL,
+            tuition_sum BIGINT
+        );
+        CREATE INDEX ON {ROLLUP_TABLE} (year);""")
+    cur.execute(ROLLUP_INSERT.format(where=""))
+
+
+def refresh_rollup(cur, year):
+    """
+    Recompute the reporting rollup rows of one year.
+
+    The rollup table is created by create_rollup_table(). The caller is
+    responsible for committing.
+
+    Args:
+        cur: The database cursor.
+        year: The year to recompute.
+    """
+    cur.execute(f"DELETE FROM {ROLLUP_TABLE} WHERE year = %s;", (year,))
+    cur.execute(ROLLUP_INSERT.format(where="WHERE i.year = %s"), (year,))
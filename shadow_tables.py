@@ -0,0 +1,85 @@
+import os
+
+# a load is not swapped in if its table has fewer rows than this share of
+# the rows of the table it replaces, e.g. because the file was cut short.
+# Set the environment variable to 0 to swap in any load.
+MIN_ROW_RATIO_VARIABLE = "PIPELINE_MIN_ROW_RATIO"
+DEFAULT_MIN_ROW_RATIO = 0.5
+
+
+def shadow_name(table_name):
+    """Get the name of the shadow table that a load of a table writes to."""
+    return f"{table_name}_shadow"
+
+
+def create_shadow_table(cur, table_name, columns):
+    """
+    Create an empty shadow table to load a table into.
+
+    A shadow table left behind by a failed load is dropped first. The
+    caller is responsible for committing.
+
+    Args:
+        cur: The database cursor.
+        table_name: The table that the load will replace.
+        columns: The column definitions, e.g. 'UNITID INTEGER, ...'.
+
+    Returns:
+        The name of the shadow table.
+    """
+    shadow_table = shadow_name(table_name)
+    cur.execute(f"DROP TABLE IF EXISTS {shadow_table};")
+    cur.execute(f"CREATE TABLE {shadow_table} ({columns});")
+    return shadow_table
+
+
+def min_row_ratio():
+    """Get the smallest share of the old rows that a load must keep."""
+    return float(os.environ.get(MIN_ROW_RATIO_VARIABLE,
+                                DEFAULT_MIN_ROW_RATIO))
+
+
+def swap_shadow_table(cur, table_name, expected_rows):
+    """
+    Check the row count of a loaded shadow table and rename it into place.
+
+    The shadow table must hold exactly the rows the loader inserted, and
+    at least min_row_ratio() of the rows of the table it replaces. The old
+    table is then dropped and the shadow table takes its name. The caller
+    commits, so readers see the old table until the new one is complete,
+    and never a missing or half-filled table.
+
+    Args:
+        cur: The database cursor.
+        table_name: The table to replace.
+        expected_rows: The number of rows the loader inserted.
+
+    Raises:
+        ValueError: If a row count check fails. The old table is left
+            alone and the shadow table is kept for inspection.
+    """
+    shadow_table = shadow_name(table_name)
+    cur.execute("SELECT to_regclass(%s) IS NOT NULL;",
+                (shadow_table.lower(),))
+    if not cur.fetchone()[0]:
+        raise ValueError(
+            f"{shadow_table} does not exist; {table_name} was not replaced")
+    cur.execute(f"SELECT COUNT(*) FROM {shadow_table};")
+    shadow_rows = cur.fetchone()[0]
+    if shadow_rows != expected_rows:
+        raise ValueError(
+            f"{shadow_table} has {shadow_rows} rows, but {expected_rows} "
+            f"were inserted; {table_name} was not replaced")
+    cur.execute("SELECT to_regclass(%s) IS NOT NULL;", (table_name.lower(),))
+    if cur.fetchone()[0]:
+        cur.execute(f"SELECT COUNT(*) FROM {table_name};")
+        old_rows = cur.fetchone()[0]
+        if shadow_rows < old_rows * min_row_ratio():
+            raise ValueError(
+                f"{shadow_table} has {shadow_rows} rows, fewer than "
+                f"{min_row_ratio():.0%} of the {old_rows} rows of "
+                f"{table_name}; {table_name} was not replaced (set "
+                f"{MIN_ROW_RATIO_VARIABLE}=0 to replace it anyway)")
+        cur.execute(f"DROP TABLE {table_name};")
+    cur.execute(f"ALTER TABLE {shadow_table} RENAME TO {table_name};")
+    print(f"Swapped in {table_name} with {shadow_rows} rows")
@@ -0,0 +1,188 @@
+import argparse
+import os
+import numpy as np
+import pandas as pd
+from run_pipeline import load_module
+
+# the number of institutions in a real MERGED file, i.e. the 1x scale.
+BASE_ROWS = 6500
+# the share of the scorecard institutions that are also in the HD file.
+IPEDS_OVERLAP = 0.95
+# the share of empty cells in the numeric scorecard columns, and the share of
+# PrivacySuppressed cells in the columns that the scorecard suppresses.
+MISSING_SHARE = 0.1
+SUPPRESSED_SHARE = 0.05
+
+ACCREDITING_AGENCIES = [
+    'Higher Learning Commission',
+    'Middle States Commission on Higher Education',
+    'New England Commission on Higher Education',
+    'Southern Association of Colleges and Schools Commission on Colleges',
+    'WASC Senior College and University Commission',
+    'Accrediting Commission of Career Schools and Colleges',
+]
+
+
+def scorecard_column_kind(column):
+    """
+    Tell what kind of values a scorecard column holds.
+
+    Args:
+        column: The column name.
+
+    Returns:
+        One of 'id', 'text', 'agency', 'code', 'coordinate', 'rate',
+        'count' or 'money'.
+    """
+    if column == 'UNITID':
+        return 'id'
+    if column in ('INSTNM', 'ADDR'):
+        return 'text'
+    if column == 'ACCREDAGENCY':
+        return 'agency'
+    if column in ('CONTROL', 'REGION', 'CCBASIC', 'PREDDEG', 'HIGHDEG',
+                  'OPENADMP', 'ADMCON7'):
+        return 'code'
+    if column in ('LATITUDE', 'LONGITUDE'):
+        return 'coordinate'
+    if (column.endswith('_RT') or column.startswith(('UGDS_', 'C150_', 'CDR'))
+            or column in ('ADM_RATE', 'PPTUG_EF')):
+        return 'rate'
+    if column.endswith('_N') or column.startswith('COUNT_') or column == 'UG':
+        return 'count'
+    return 'money'
+
+
+# the codes that each code column takes.
+CODE_RANGES = {
+    'CONTROL': (1, 3),
+    'REGION': (0, 9),
+    'CCBASIC': (-2, 33),
+    'PREDDEG': (0, 4),
+    'HIGHDEG': (0, 4),
+    'OPENADMP': (1, 2),
+    'ADMCON7': (1, 5),
+}
+
+
+def scorecard_frame(rows, seed=0):
+    """
+    Build a synthetic raw MERGED file with the columns that we load.
+
+    Rates are floats between 0 and 1, counts and money are integers, and
+    the numeric columns have empty and PrivacySuppressed cells like the
+    real files. An extra column that the loader does not read is included
+    as well.
+
+    Args:
+        rows: The number of institutions.
+        seed: The seed of the random numbers.
+
+    Returns:
+        The dataframe.
+    """
+    rng = np.random.default_rng(seed)
+    data = {}
+    for column in load_module('load-scorecard.py').SCORECARD_COLUMNS:
+        kind = scorecard_column_kind(column)
+        if kind == 'id':
+            values = np.arange(100000, 100000 + rows)
+        elif kind == 'text':
+            values = [f'{column.title()} {i}' for i in range(rows)]
+        elif kind == 'agency':
+            values = rng.choice(ACCREDITING_AGENCIES, rows)
+        elif kind == 'code':
+            low, high = CODE_RANGES[column]
+            values = rng.integers(low, high + 1, rows)
+        elif kind == 'coordinate':
+            low, high = (20, 65) if column == 'LATITUDE' else (-160, -65)
+            values = rng.uniform(low, high, rows).round(6)
+        elif kind == 'rate':
+            values = rng.random(rows).round(4)
+        elif kind == 'count':
+            values = rng.integers(0, 20000, rows)
+        else:
+            values = rng.integers(1000, 80000, rows)
+
+        if kind in ('rate', 'count', 'money'):
+            values = values.astype(object)
+            values[rng.random(rows) < MISSING_SHARE] = None
+            values[rng.random(rows) < SUPPRESSED_SHARE] = 'PrivacySuppressed'
+        data[column] = values
+    df = pd.DataFrame(data)
+    df['OPEID'] = df['UNITID'] * 100
+    return df
+
+
+def hd_frame(rows, seed=0):
+    """
+    Build a synthetic raw IPEDS HD file.
+
+    Most institutions are the ones of scorecard_frame(rows) and the rest
+    are only in the HD file. Institutions without a Carnegie
+    classification have CCBASIC -2, like in the real files.
+
+    Args:
+        rows: The number of institutions in the scorecard file.
+        seed: The seed of the random numbers.
+
+    Returns:
+        The dataframe.
+    """
+    rng = np.random.default_rng(seed + 1)
+    shared = int(rows * IPEDS_OVERLAP)
+    unitids = np.concatenate([
+        rng.choice(np.arange(100000, 100000 + rows), shared, replace=False),
+        np.arange(100000 + rows, 100000 + 2 * rows - shared)])
+    unitids.sort()
+    count = len(unitids)
+    ccbasic = rng.integers(0, 34, count)
+    ccbasic[rng.random(count) < MISSING_SHARE] = -2
+    return pd.DataFrame({
+        'UNITID': unitids,
+        'INSTNM': [f'Institution {unitid}' for unitid in unitids],
+        'ADDR': [f'{unitid} College Avenue' for unitid in unitids],
+        'CITY': 'Pittsburgh',
+        'CONTROL': rng.integers(1, 4, count),
+        'CCBASIC': ccbasic,
+        'LATITUDE': rng.uniform(20, 65, count).round(6),
+        'LONGITUD': rng.uniform(-160, -65, count).round(6),
+    })
+
+
+def write_synthetic_files(directory, year, rows, seed=0):
+    """
+    Write the raw files that load-schema.py <year> needs.
+
+    Args:
+        directory: The directory to write to.
+        year: The schema year. The scorecard file is for year - 1.
+        rows: The number of institutions in the scorecard file.
+        seed: The seed of the random numbers.
+
+    Returns:
+        A tuple of the scorecard and HD file paths.
+    """
+    os.makedirs(directory, exist_ok=True)
+    scorecard_file = os.path.join(
+        directory, f'MERGED{year - 1}_{str(year)[2:]}_PP.csv')
+    hd_file = os.path.join(directory, f'hd{year}.csv')
+    scorecard_frame(rows, seed).to_csv(scorecard_file, index=False)
+    hd_frame(rows, seed).to_csv(hd_file, index=False, encoding='ISO-8859-1')
+    return scorecard_file, hd_file
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+        description="Write synthetic raw scorecard and IPEDS HD files.")
+    parser.add_argument("directory", help="directory to write the files to")
+    parser.add_argument("year", type=int, help="the schema year, e.g. 2021")
+    parser.add_argument(
+        "--scale", type=float, default=1,
+        help=f"size as a multiple of {BASE_ROWS} institutions (default: 1)")
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    for path in write_synthetic_files(
+            args.directory, args.year, int(BASE_ROWS * args.scale), args.seed):
+        print(f"wrote {path}")
@@ -0,0 +1,60 @@
+import os
+import sys
+import pytest
+
+# the modules live at the top of the repository, next to the loaders.
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from db import DSN_VARIABLE, connect_to_database, release  # noqa: E402
+from row_hashes import create_row_hashes_table  # noqa: E402
+from schema_tables import TABLE_COLUMNS, partition_name  # noqa: E402
+
+# the years that the database tests load; no real data is that old.
+TEST_YEARS = (1990, 1991)
+
+
+@pytest.fixture(scope='session')
+def load_schema():
+    """
+    Create the schema tables in the PIPELINE_DSN database.
+
+    The tests that need a database are skipped if PIPELINE_DSN is not set.
+    Only point it at a throwaway database.
+
+    Returns:
+        The load-schema.py module.
+    """
+    if not os.environ.get(DSN_VARIABLE):
+        pytest.skip(f"{DSN_VARIABLE} is not set")
+    from run_pipeline import load_module
+    module = load_module('load-schema.py')
+    module.create_tables_schema()
+    return module
+
+
+@pytest.fixture
+def database(load_schema, tmp_path, monkeypatch):
+    """
+    Give a test the schema tables and drop the TEST_YEARS afterwards.
+
+    The loaders write their reject files to the current directory, so the
+    test runs in tmp_path.
+
+    Yields:
+        The load-schema.py module.
+    """
+    monkeypatch.chdir(tmp_path)
+    yield load_schema
+    conn, cur = connect_to_database()
+    create_row_hashes_table(cur)
+    for year in TEST_YEARS:
+        for table_name in TABLE_COLUMNS:
+            partition = partition_name(table_name, year)
+            cur.execute(f"DROP TABLE IF EXISTS {partition}, "
+                        f"{partition}_load;")
+        cur.execute(f"DROP TABLE IF EXISTS scorecard_{year}, ipeds_{year}, "
+                    f"ipeds_{year}_shadow;")
+        cur.execute("DELETE FROM row_hashes WHERE year = %s;", (year,))
+        cur.execute("DELETE FROM reporting_rollup WHERE year = %s;", (year,))
+    conn.commit()
+    release(conn)
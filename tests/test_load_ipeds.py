@@ -0,0 +1,35 @@
+import pytest
+from conftest import TEST_YEARS
+from db import connect_to_database, release
+from run_pipeline import load_module
+
+YEAR = TEST_YEARS[0]
+HEADER = 'UNITID,INSTNM,ADDR,CONTROL,CCBASIC,LATITUDE,LONGITUD\n'
+
+
+def table_exists(table_name):
+    conn, cur = connect_to_database()
+    cur.execute("SELECT to_regclass(%s) IS NOT NULL;", (table_name,))
+    exists = cur.fetchone()[0]
+    release(conn)
+    return exists
+
+
+@pytest.mark.parametrize('rows, match', [
+    ('', 'has no rows'),
+    # a latitude past 90 fails validation, so no row is inserted.
+    ('1,a,b,1,15,500,0\n', 'No rows'),
+])
+def test_empty_load_does_not_replace_the_table(database, rows, match):
+    load_ipeds = load_module('load_ipeds.py')
+    with open(f'hd{YEAR}.csv', 'w') as f:
+        f.write(HEADER + rows)
+    with pytest.raises(ValueError, match=match):
+        load_ipeds.load_ipeds_file(f'hd{YEAR}.csv')
+    assert not table_exists(f'ipeds_{YEAR}')
+
+    # the connection went back to the pool, so a good file still loads.
+    with open(f'hd{YEAR}.csv', 'w') as f:
+        f.write(HEADER + '1,a,b,1,15,40,0\n')
+    assert load_ipeds.load_ipeds_file(f'hd{YEAR}.csv') == (1, 1, 0)
+    assert table_exists(f'ipeds_{YEAR}')
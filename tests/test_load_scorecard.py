@@ -0,0 +1,26 @@
+import pandas as pd
+from conftest import TEST_YEARS
+from db import connect_to_database, release
+from run_pipeline import load_module
+
+YEAR = TEST_YEARS[0]
+
+
+def test_delta_load_uses_the_column_types_of_the_table(database):
+    scorecard = load_module('load-scorecard.py')
+    untyped = pd.DataFrame({'UNITID': [1, 2], 'year1': [YEAR, YEAR],
+                            'UG': [10, 20]})
+    scorecard.create_tables(untyped, YEAR)
+    assert scorecard.insert_rows_delta(untyped, YEAR) == (2, 0)
+
+    # a --typed read gives floats. 10.0 hashes like 10, so the row is
+    # unchanged, and 20.5 is rejected instead of being rounded into UG; the
+    # institution then leaves the table, as it would in a full load.
+    typed = pd.DataFrame({'UNITID': [1, 2], 'year1': [YEAR, YEAR],
+                          'UG': [10.0, 20.5]})
+    assert scorecard.insert_rows_delta(typed, YEAR) == (0, 1)
+    conn, cur = connect_to_database()
+    cur.execute(f"SELECT unitid, ug FROM scorecard_{YEAR} ORDER BY unitid;")
+    rows = cur.fetchall()
+    release(conn)
+    assert rows == [(1, 10)]
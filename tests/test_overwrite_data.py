@@ -0,0 +1,54 @@
+import pandas as pd
+from conftest import TEST_YEARS
+from db import connect_to_database, release
+from overwrite_data import overwrite_table
+from schema_tables import TABLE_COLUMNS
+
+YEAR = TEST_YEARS[0]
+
+
+def merged_frame(names):
+    """Build a merged frame like select_data() with one row per name."""
+    columns = dict.fromkeys(
+        col for table in TABLE_COLUMNS.values() for col in table)
+    df = pd.DataFrame({col: [1] * len(names) for col in columns})
+    df['unitid'] = range(1, len(names) + 1)
+    df['year'] = YEAR
+    df['instnm'] = names
+    df['addr'] = 'Main Street'
+    df['accredagency'] = 'agency'
+    return df
+
+
+def stored_names():
+    conn, cur = connect_to_database()
+    cur.execute("SELECT unitid, instnm FROM institutioninformation "
+                "WHERE year = %s ORDER BY unitid;", (YEAR,))
+    rows = cur.fetchall()
+    release(conn)
+    return rows
+
+
+def test_delta_load_writes_over_an_overwrite(database):
+    source = merged_frame(['First', 'Second'])
+    counts = database.delta_data(source, YEAR)
+    assert counts['inserted'] == 2 * len(TABLE_COLUMNS)
+    overwrite_table(merged_frame(['Corrected', 'Second']).loc[:0], YEAR,
+                    'InstitutionInformation')
+    assert stored_names() == [(1, 'Corrected'), (2, 'Second')]
+
+    # the overwrite dropped the hashes, so the source rows are written again.
+    counts = database.delta_data(source, YEAR)
+    assert counts['unchanged'] == 2 * (len(TABLE_COLUMNS) - 1)
+    assert stored_names() == [(1, 'First'), (2, 'Second')]
+
+
+def test_overwrite_rejects_a_duplicate_unitid(database):
+    database.delta_data(merged_frame(['First', 'Second']), YEAR)
+    corrections = merged_frame(['Corrected', 'Twice'])
+    corrections['unitid'] = 1
+    assert overwrite_table(corrections, YEAR,
+                           'InstitutionInformation') == (1, 1, 1)
+    assert stored_names() == [(1, 'Corrected'), (2, 'Second')]
+    with open(f'rejected_overwrite_{YEAR}.csv') as f:
+        assert 'duplicate unitid' in f.read()
@@ -0,0 +1,50 @@
+import gzip
+import zipfile
+import pytest
+from raw_files import find_raw_file, open_raw_file, raw_stem
+
+CSV = b'UNITID,INSTNM\n1,a\n'
+
+
+def test_raw_stem():
+    assert raw_stem('data/MERGED2018_19_PP.csv.gz') == 'MERGED2018_19_PP'
+    assert raw_stem('HD2019.zip') == 'HD2019'
+    assert raw_stem('hd2019.CSV') == 'hd2019'
+
+
+def test_plain_and_gzip_files(tmp_path):
+    (tmp_path / 'hd2019.csv').write_bytes(CSV)
+    with gzip.open(tmp_path / 'hd2020.csv.gz', 'wb') as f:
+        f.write(CSV)
+    for name in ('hd2019.csv', 'hd2020.csv.gz'):
+        with open_raw_file(str(tmp_path / name)) as f:
+            assert f.read() == CSV
+
+
+def test_zip_with_one_csv_file(tmp_path):
+    path = tmp_path / 'HD2019.zip'
+    with zipfile.ZipFile(path, 'w') as archive:
+        archive.writestr('hd2019.csv', CSV)
+        archive.writestr('readme.txt', 'not a csv file')
+    with open_raw_file(str(path)) as f:
+        assert f.read() == CSV
+
+
+@pytest.mark.parametrize('members', [[], ['hd2019.csv', 'hd2019_rv.csv']])
+def test_zip_must_hold_exactly_one_csv_file(tmp_path, members):
+    path = tmp_path / 'HD2019.zip'
+    with zipfile.ZipFile(path, 'w') as archive:
+        for member in members:
+            archive.writestr(member, CSV)
+    with pytest.raises(ValueError, match='Expected one CSV file'):
+        open_raw_file(str(path))
+
+
+def test_find_raw_file(tmp_path):
+    (tmp_path / 'HD2019.zip').write_bytes(b'')
+    (tmp_path / 'hd2019.csv.gz').write_bytes(b'')
+    # a .csv.gz file comes before a .zip file, whatever the case.
+    assert find_raw_file(str(tmp_path), 'hd2019') == str(
+        tmp_path / 'hd2019.csv.gz')
+    assert find_raw_file(str(tmp_path), 'hd2020') == str(
+        tmp_path / 'hd2020.csv')
@@ -0,0 +1,11 @@
+from report_queries import slice_tuition_cube
+
+
+def test_slice_tuition_cube():
+    rows = [(0, 1, 15, 100), (0, 2, 15, 200), (1, 1, None, 100),
+            (1, 2, None, 200), (2, None, 15, 150)]
+    assert slice_tuition_cube(rows) == {
+        'tuition_by_state_and_classification': [(1, 15, 100), (2, 15, 200)],
+        'tuition_by_state': [(1, 100), (2, 200)],
+        'tuition_by_classification': [(15, 150)],
+    }
@@ -0,0 +1,45 @@
+import numpy as np
+import pandas as pd
+from row_hashes import change_summary, compare_hashes, frame_hashes
+
+COLUMN_TYPES = {'unitid': 'INTEGER', 'rate': 'FLOAT', 'name': 'VARCHAR(50)'}
+
+
+def test_hashes_do_not_depend_on_how_the_file_was_read():
+    as_numbers = pd.DataFrame({'unitid': [1, 2], 'rate': [0.5, None],
+                               'name': ['a', None]})
+    as_floats = pd.DataFrame({'unitid': [1.0, 2.0], 'rate': [0.5, np.nan],
+                              'name': ['a', np.nan]})
+    as_text = pd.DataFrame({'unitid': ['1', '2'], 'rate': ['0.5', None],
+                            'name': ['a', None]}, dtype=object)
+    expected = frame_hashes(as_numbers, COLUMN_TYPES)
+    assert expected.dtype == np.int64
+    np.testing.assert_array_equal(
+        frame_hashes(as_floats, COLUMN_TYPES), expected)
+    np.testing.assert_array_equal(
+        frame_hashes(as_text, COLUMN_TYPES), expected)
+
+
+def test_hashes_change_with_any_value():
+    df = pd.DataFrame({'unitid': [1, 1, 1, 1],
+                       'rate': [0.5, 0.25, 0.5, 0.5],
+                       'name': ['a', 'a', 'b', None]})
+    assert len(set(frame_hashes(df, COLUMN_TYPES))) == 4
+
+
+def test_compare_hashes():
+    stored = pd.Series([10, 20, 30], index=[1, 2, 3], dtype='Int64')
+    changes = compare_hashes([2, 3, 4], np.array([20, 31, 40]), stored)
+    assert changes['inserted'].tolist() == [False, False, True]
+    assert changes['changed'].tolist() == [False, True, False]
+    assert changes['unchanged'].tolist() == [True, False, False]
+    assert changes['removed'] == [1]
+    assert change_summary('debt', changes) == (
+        'debt: 1 inserted, 1 changed, 1 removed, 1 unchanged')
+
+
+def test_everything_is_new_without_stored_hashes():
+    changes = compare_hashes([1, 2], np.array([10, 20]),
+                             pd.Series([], dtype='Int64'))
+    assert changes['inserted'].tolist() == [True, True]
+    assert changes['removed'] == []
@@ -0,0 +1,42 @@
+import threading
+from conftest import TEST_YEARS
+from db import connect_to_database, release
+from schema_tables import create_year_table, swap_year_partition
+
+
+def reload_year(year, ready, errors):
+    """Load one row into a year of Admissions and swap it in."""
+    conn, cur = connect_to_database()
+    try:
+        load_table = create_year_table(cur, 'Admissions', year)
+        cur.execute(f"INSERT INTO {load_table} (unitid, year) "
+                    f"VALUES (1, {year});")
+        # both loads have written their rows before either one swaps.
+        ready.wait()
+        swap_year_partition(cur, 'Admissions', year, load_table)
+        conn.commit()
+    except Exception as e:
+        errors.append(e)
+    finally:
+        release(conn)
+
+
+def test_years_reload_at_the_same_time(database):
+    # the second round replaces partitions that exist, which needs DETACH.
+    for _ in range(2):
+        ready = threading.Barrier(len(TEST_YEARS))
+        errors = []
+        threads = [threading.Thread(target=reload_year,
+                                    args=(year, ready, errors))
+                   for year in TEST_YEARS]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        assert errors == []
+    conn, cur = connect_to_database()
+    cur.execute("SELECT year, COUNT(*) FROM admissions "
+                "WHERE year = ANY(%s) GROUP BY year ORDER BY year;",
+                (list(TEST_YEARS),))
+    assert cur.fetchall() == [(year, 1) for year in TEST_YEARS]
+    release(conn)
@@ -0,0 +1,68 @@
+import numpy as np
+import pandas as pd
+from validation import reject_records, rules_for_sql_types, validate
+
+RULES = rules_for_sql_types(
+    {'UNITID': 'INTEGER', 'year': 'INTEGER', 'LATITUDE': 'FLOAT',
+     'INSTNM': 'VARCHAR(10)'},
+    key=['UNITID', 'year'])
+
+
+def test_rules_for_sql_types():
+    assert RULES['columns']['UNITID'] == {'type': 'integer',
+                                          'nullable': False}
+    assert RULES['columns']['LATITUDE'] == {'type': 'float'}
+    assert RULES['columns']['INSTNM'] == {'type': 'text', 'max_length': 10}
+    assert RULES['unique'] == ['UNITID', 'year']
+
+
+def test_duplicate_keys_keep_the_first_valid_row():
+    df = pd.DataFrame({'UNITID': [1, 1, 2, 2], 'year': [2019] * 4,
+                       'LATITUDE': [1.5, 2.5, 100.0, 3.5],
+                       'INSTNM': ['a', 'b', 'c', 'd']})
+    rules = dict(RULES, columns=dict(
+        RULES['columns'], LATITUDE={'type': 'float', 'max': 90}))
+    valid, rejected = validate(df, rules)
+    # the first row of unitid 2 is invalid, so the second one is kept.
+    assert valid['INSTNM'].tolist() == ['a', 'd']
+    assert rejected['reason'].tolist() == [
+        'duplicate UNITID, year', 'LATITUDE: above 90']
+
+
+def test_key_columns_may_not_be_missing():
+    df = pd.DataFrame({'UNITID': [1, None], 'year': [2019, 2019],
+                       'LATITUDE': [None, None], 'INSTNM': [None, 'b']})
+    valid, rejected = validate(df, RULES)
+    # other columns may be missing.
+    assert valid['UNITID'].tolist() == [1]
+    assert rejected['reason'].tolist() == ['UNITID: missing']
+
+
+def test_integer_columns_reject_fractions():
+    rules = rules_for_sql_types({'UNITID': 'INTEGER', 'year': 'INTEGER'})
+    df = pd.DataFrame({'UNITID': ['1', '2', None, '4.0'],
+                       'year': [2019.0, 2019.5, np.nan, 2019.0]})
+    valid, rejected = validate(df, rules)
+    # whole floats and missing values pass, as postgres would store them.
+    assert valid.index.tolist() == [0, 2]
+    assert rejected['reason'].tolist() == [
+        'year: not an integer', 'UNITID: invalid integer']
+
+
+def test_integer_columns_reject_values_out_of_range():
+    df = pd.DataFrame({'UNITID': [1, 2**31], 'year': [2019, 2019],
+                       'LATITUDE': [0.5, 0.5], 'INSTNM': ['a', 'b']})
+    valid, rejected = validate(df, RULES)
+    assert valid['UNITID'].tolist() == [1]
+    assert rejected['reason'].tolist() == ['UNITID: integer out of range']
+
+
+def test_every_problem_of_a_row_is_listed():
+    df = pd.DataFrame({'UNITID': [1], 'year': ['x'],
+                       'LATITUDE': ['north'], 'INSTNM': ['a' * 11]})
+    _, rejected = validate(df, RULES)
+    assert rejected['reason'].tolist() == [
+        'year: invalid integer; LATITUDE: invalid float; '
+        'INSTNM: longer than 10 characters']
+    assert reject_records(rejected) == [
+        [rejected['reason'].iloc[0], (1, 'x', 'north', 'a' * 11)]]
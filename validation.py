@@ -0,0 +1,168 @@
+import numpy as np
+import pandas as pd
+
+# Rules describe what a loader may send to the database, e.g.
+#
+#     {'columns': {'UNITID': {'type': 'integer', 'nullable': False},
+#                  'LATITUDE': {'type': 'float', 'min': -90, 'max': 90},
+#                  'INSTNM': {'type': 'text', 'max_length': 255}},
+#      'unique': ['UNITID', 'year']}
+#
+# Every column rule has a type ('integer', 'float' or 'text') and may set
+# 'nullable' (default True), 'min' and 'max' for numbers and 'max_length'
+# for text. 'unique' lists the columns of a key that no two rows may share.
+# Values of an 'integer' column must be whole numbers, as numbers or text.
+
+INTEGER_RANGE = (-2147483648, 2147483647)
+INTEGER_PATTERN = r'\s*[-+]?\d+\s*'
+FLOAT_PATTERN = (r'\s*[-+]?(\d+\.?\d*|\.\d+)([eE][-+]?\d+)?\s*'
+                 r'|(?i:\s*[-+]?(nan|inf|infinity)\s*)')
+
+# the rule type of each SQL type that the loaders create.
+SQL_RULE_TYPES = {
+    'integer': 'integer',
+    'double precision': 'float',
+    'float': 'float',
+    'text': 'text',
+    'character varying': 'text',
+}
+
+
+def rules_for_sql_types(column_types, key=()):
+    """
+    Build the rules that match the column types of a table.
+
+    Args:
+        column_types: A dict of column name to SQL type, e.g. 'INTEGER',
+            'double precision' or 'VARCHAR(255)'.
+        key: Columns that must be present and unique together.
+
+    Returns:
+        The rules, see the top of this module.
+    """
+    columns = {}
+    for col, sql_type in column_types.items():
+        base, _, length = sql_type.lower().partition('(')
+        # anything else, e.g. VARCHAR(255), is text.
+        rule = {'type': SQL_RULE_TYPES.get(base.strip(), 'text')}
+        if length:
+            rule['max_length'] = int(length.rstrip(')'))
+        if col in key:
+            rule['nullable'] = False
+        columns[col] = rule
+    return {'columns': columns, 'unique': list(key)}
+
+
+def number_problems(col, series, rule, missing):
+    """
+    Check the values of a column that must be numbers.
+
+    Args:
+        col: The column name.
+        series: The column.
+        rule: The rule of the column.
+        missing: A boolean array of the missing values.
+
+    Returns:
+        A list of (boolean array, problem) tuples.
+    """
+    problems = []
+    if pd.api.types.is_numeric_dtype(series):
+        numbers = series.to_numpy(dtype='float64', na_value=np.nan)
+    else:
+        # text is checked the way postgres reads it; other objects, e.g.
+        # ints mixed with None, must be numbers.
+        pattern = (INTEGER_PATTERN if rule['type'] == 'integer'
+                   else FLOAT_PATTERN)
+        values = series.astype(object)
+        text = values.where(values.map(type, na_action='ignore') == str)
+        is_text = text.notna().to_numpy()
+        matches = text.str.fullmatch(pattern).eq(True).to_numpy()
+        numbers = pd.to_numeric(
+            values.where(~is_text | matches), errors='coerce'
+        ).to_numpy(dtype='float64', na_value=np.nan)
+        invalid = ~missing & ((is_text & ~matches)
+                              | (~is_text & np.isnan(numbers)))
+        problems.append((invalid, f"{col}: invalid {rule['type']}"))
+    with np.errstate(invalid='ignore'):
+        if rule['type'] == 'integer':
+            problems.append((
+                ~np.isnan(numbers) & ((numbers < INTEGER_RANGE[0])
+                                      | (numbers > INTEGER_RANGE[1])
+                                      | np.isinf(numbers)),
+                f'{col}: integer out of range'))
+            problems.append((
+                np.isfinite(numbers) & (numbers != np.round(numbers)),
+                f'{col}: not an integer'))
+        if 'min' in rule:
+            problems.append((numbers < rule['min'],
+                             f"{col}: below {rule['min']}"))
+        if 'max' in rule:
+            problems.append((numbers > rule['max'],
+                             f"{col}: above {rule['max']}"))
+    return problems
+
+
+def validate(df, rules):
+    """
+    Split a frame into the rows that pass the rules and the rows that fail.
+
+    Each rule is checked on a whole column at once. Rows with a duplicate
+    key are rejected after the other checks, keeping the first valid row
+    of each key.
+
+    Args:
+        df: The pandas dataframe.
+        rules: The rules, see the top of this module.
+
+    Returns:
+        A tuple of (valid rows, rejected rows). The rejected rows have an
+        extra 'reason' column that lists every problem of the row.
+    """
+    problems = []
+    for col, rule in rules['columns'].items():
+        series = df[col]
+        missing = series.isna().to_numpy()
+        if not rule.get('nullable', True):
+            problems.append((missing, f'{col}: missing'))
+        if rule['type'] in ('integer', 'float'):
+            problems.extend(number_problems(col, series, rule, missing))
+        elif 'max_length' in rule:
+            lengths = series.astype(str).str.len().to_numpy()
+            problems.append((
+                ~missing & (lengths > rule['max_length']),
+                f"{col}: longer than {rule['max_length']} characters"))
+
+    bad = np.zeros(len(df), dtype=bool)
+    for mask, _ in problems:
+        bad |= mask
+    if key := rules.get('unique'):
+        duplicate = np.zeros(len(df), dtype=bool)
+        duplicate[~bad] = df.loc[~bad, key].duplicated().to_numpy()
+        problems.append((duplicate, f"duplicate {', '.join(key)}"))
+        bad |= duplicate
+
+    # reasons are only built for the rejected rows.
+    reasons = np.full(int(bad.sum()), '', dtype=object)
+    for mask, problem in problems:
+        hit = mask[bad]
+        reasons[hit] = reasons[hit] + f'; {problem}'
+    rejected = df[bad].copy()
+    rejected['reason'] = [reason[2:] for reason in reasons]
+    return df[~bad], rejected
+
+
+def reject_records(rejected):
+    """
+    Format rejected rows like the rows that the database rejects.
+
+    Args:
+        rejected: The rejected rows returned by validate().
+
+    Returns:
+        A list of [reason, row tuple] lists for a csv writer.
+    """
+    values = rejected.drop(columns='reason')
+    values = values.astype(object).where(values.notna(), None)
+    return [[reason, row] for reason, row in
+            zip(rejected['reason'], values.itertuples(index=False, name=None))]